@@ -0,0 +1,84 @@
+"""
+Learned boot durations, seconds from an accepted start to the RUNNING state per instance and per shape.
+samples are measured while a run confirms started instances, persisted with the run history and reloaded
+from it periodically, so the profile survives cold starts. starts are issued early by a high percentile of
+these durations so instances are usable at the scheduled time
+"""
+
+import threading
+import collections
+
+from utils.clock import get_clock
+from utils.metrics import get_percentile
+
+
+class BootProfile:
+    """
+    Recent boot duration samples per instance and per shape, kept for the life of the container
+    """
+
+    def __init__(self, max_samples=20, min_samples=3):
+        """
+        Initialization, a lead is only learned from at least min samples
+        """
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._instances = {}
+        self._shapes = {}
+        self._lock = threading.Lock()
+        self._loaded_at = None
+
+    def add(self, ocid, shape, seconds):
+        """
+        records one boot duration of the instance and its shape
+        """
+        with self._lock:
+            self._instances.setdefault(ocid, collections.deque(maxlen=self.max_samples)).append(seconds)
+            if shape:
+                shape_samples = self._shapes.setdefault(shape, collections.deque(maxlen=self.max_samples * 5))
+                shape_samples.append(seconds)
+
+    def load(self, samples):
+        """
+        Replaces the profile with samples read from the run history, oldest first
+        """
+        with self._lock:
+            self._instances, self._shapes = {}, {}
+        for sample in samples:
+            self.add(sample['ocid'], sample.get('shape'), sample['seconds'])
+        with self._lock:
+            self._loaded_at = get_clock().monotonic()
+
+    def is_stale(self, max_age_seconds) -> bool:
+        """
+        whether the profile was never loaded or was loaded longer ago than given seconds
+        """
+        return self._loaded_at is None or get_clock().monotonic() - self._loaded_at >= max_age_seconds
+
+    def get_boot_seconds(self, ocid, shape, percentile=90):
+        """
+        Learned boot duration of the instance, from its own samples or else from samples of its shape.
+        None when neither has enough samples
+        """
+        with self._lock:
+            samples = self._instances.get(ocid)
+            if not samples or len(samples) < self.min_samples:
+                samples = self._shapes.get(shape)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            return get_percentile(list(samples), percentile)
+
+    def get_stats(self) -> dict:
+        """
+        Returns number of profiled instances and shapes and the learned duration of every shape
+        """
+        with self._lock:
+            shapes = {shape: list(samples) for shape, samples in self._shapes.items()}
+            instances = len(self._instances)
+        return {
+            'instances': instances,
+            'shapes': {shape: get_percentile(samples, 90) for shape, samples in shapes.items()},
+        }
+
+
+boot_profile = BootProfile()
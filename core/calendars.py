@@ -0,0 +1,181 @@
+"""
+Exception calendars, named sets of periods in which automated starts or stops are suppressed, eg - public
+holidays or maintenance windows. periods are kept as sorted and merged utc intervals, so finding the periods
+overlapping a run window is a binary search done once per run and instances only check those few periods
+expected config ExceptionCalendars -
+{"in-holidays": {"kind": "no_start", "timezone": "IST", "dates": ["2026-08-15"]},
+ "db-maintenance": {"kind": "no_stop", "periods": [{"from": "2026-11-01T02:00", "to": "2026-11-01T06:00"}]}}
+"""
+
+import json
+import bisect
+import logging
+import datetime
+
+import pytz
+
+from utils.date_util import get_timezone_from_abbreviation
+
+
+class ExceptionCalendar:
+    """
+    Sorted non overlapping utc intervals of one calendar, intervals include start and exclude end
+    """
+
+    KINDS = {'no_start': ('start',), 'no_stop': ('stop',), 'no_action': ('start', 'stop')}
+
+    def __init__(self, name, kind, intervals):
+        """
+        Initialization, overlapping and touching intervals are merged
+        """
+        self.name = name
+        self.kind = kind
+        self.actions = self.KINDS[kind]
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+
+    def __repr__(self):
+        return "ExceptionCalendar({}, {}, periods={})".format(self.name, self.kind, len(self._starts))
+
+    def get_overlapping(self, past, now) -> list:
+        """
+        Returns the intervals overlapping the window [past, now] using binary search on both bounds
+        """
+        first = bisect.bisect_right(self._ends, past)
+        last = bisect.bisect_right(self._starts, now)
+        return list(zip(self._starts[first:last], self._ends[first:last]))
+
+
+class CalendarWindow:
+    """
+    Calendars narrowed down to the periods overlapping a single run window
+    """
+
+    def __init__(self, periods: dict):
+        """
+        Initialization, periods are keyed by calendar name
+        """
+        self._periods = periods
+
+    def get_active(self):
+        """
+        names of calendars having a period in the run window
+        """
+        return sorted(name for name, (_, intervals) in self._periods.items() if intervals)
+
+    def get_blocking_calendar(self, names, action, moment):
+        """
+        Returns name of the first calendar among given names that suppresses the action at given utc time
+        """
+        for name in names:
+            calendar, intervals = self._periods.get(name, (None, ()))
+            if calendar is None or action not in calendar.actions:
+                continue
+            for start, end in intervals:
+                if start <= moment < end:
+                    return name
+        return None
+
+
+class ExceptionCalendars:
+    """
+    All configured calendars by name, built once per config change
+    """
+
+    def __init__(self, calendars: dict = None, default_names=()):
+        """
+        Initialization, default calendars apply to every instance
+        """
+        self._calendars = calendars or {}
+        self.default_names = tuple(name for name in default_names if name in self._calendars)
+
+    @staticmethod
+    def get_tz_info(timezone):
+        """
+        accepts timezone abbreviation or tz database name, utc if not given
+        """
+        if not timezone:
+            return pytz.utc
+        return pytz.timezone(get_timezone_from_abbreviation(timezone.upper()) or timezone)
+
+    @classmethod
+    def build_calendar(cls, name, definition: dict) -> ExceptionCalendar:
+        """
+        Converts local dates and periods of a calendar definition to utc intervals
+        """
+        tz_info = cls.get_tz_info(definition.get('timezone'))
+
+        def to_utc(naive):
+            return tz_info.normalize(tz_info.localize(naive)).astimezone(pytz.utc)
+
+        intervals = []
+        for date_value in definition.get('dates', []):
+            day = datetime.datetime.strptime(date_value, '%Y-%m-%d')
+            intervals.append((to_utc(day), to_utc(day + datetime.timedelta(days=1))))
+        for period in definition.get('periods', []):
+            start = to_utc(datetime.datetime.strptime(period['from'], '%Y-%m-%dT%H:%M'))
+            end = to_utc(datetime.datetime.strptime(period['to'], '%Y-%m-%dT%H:%M'))
+            if end <= start:
+                raise ValueError(f"period '{period}' ends before it starts")
+            intervals.append((start, end))
+        return ExceptionCalendar(name, definition.get('kind', 'no_start'), intervals)
+
+    @classmethod
+    def from_config(cls, calendars_json, default_names=None):
+        """
+        Builds calendars from ExceptionCalendars config, invalid calendars are logged and skipped
+        """
+        calendars = {}
+        if calendars_json:
+            try:
+                definitions = json.loads(calendars_json)
+            except ValueError as err:
+                logging.getLogger().error(f"exception calendars config is not valid json '{err}'")
+                definitions = {}
+
+            for name, definition in definitions.items():
+                try:
+                    calendars[name] = cls.build_calendar(name, definition)
+                except Exception as err:
+                    logging.getLogger().error(f"skipping invalid exception calendar '{name}', '{err}'")
+
+        names = [name.strip() for name in default_names.split(',') if name.strip()] if default_names else []
+        for name in names:
+            if name not in calendars:
+                logging.getLogger().error(f"default exception calendar '{name}' is not defined")
+        return cls(calendars, default_names=names)
+
+    def get_calendar(self, name):
+        """
+        getter for a calendar by name
+        """
+        return self._calendars.get(name)
+
+    def get_window(self, past, now) -> CalendarWindow:
+        """
+        Narrows every calendar down to the periods overlapping the run window, done once per run
+        """
+        return CalendarWindow({
+            name: (calendar, calendar.get_overlapping(past, now)) for name, calendar in self._calendars.items()
+        })
+
+    def get_names(self, tag_value=None):
+        """
+        Calendars applying to an instance, default calendars and those listed in its calendar tag
+        """
+        names = list(self.default_names)
+        if tag_value:
+            for name in tag_value.split(','):
+                name = name.strip()
+                if name and name not in names:
+                    if name not in self._calendars:
+                        logging.getLogger().info(f"exception calendar '{name}' is not defined, ignoring it")
+                        continue
+                    names.append(name)
+        return names
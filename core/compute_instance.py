@@ -13,7 +13,7 @@ from core.oci_client import client
 
 class ComputeInstance:
     """
-    A management wrapper for given OCI compute instance
+    A management wrapper for given OCI compute instance or any other resource type with a registered driver
     """
 
     def __init__(self, **kwargs):
@@ -23,8 +23,15 @@ class ComputeInstance:
         self.name = kwargs['name']
         self.oracle_tag = kwargs['oracle_tag']
         self.freeform_tags = kwargs['freeform_tags']
+        self.shape = kwargs.get('shape')
+        self.fault_domain = kwargs.get('fault_domain')
+        self.resource_type = kwargs.get('resource_type') or 'instance'
+        # metadata served from cache may carry a stale lifecycle state
+        self.from_cache = kwargs.get('from_cache', False)
 
         self._action = None
+        self._scheduled_at = None
+        self.trace_span = None
         # two schedule
         self._db_schedule = None
         self._live_schedule = None
@@ -47,6 +54,18 @@ class ComputeInstance:
         """
         self._action = action
 
+    def get_scheduled_at(self):
+        """
+        Getter for utc time of the scheduled event the action belongs to
+        """
+        return self._scheduled_at
+
+    def set_scheduled_at(self, scheduled_at):
+        """
+        Set utc time of the scheduled event the action belongs to
+        """
+        self._scheduled_at = scheduled_at
+
     def set_db_schedule(self, schedule_obj):
         """
         Attach schedule instance to the vm instance
@@ -96,7 +115,7 @@ class ComputeInstance:
         """
         response = {}
         try:
-            response = client.set_instance_action(self.ocid, 'START')
+            response = client.set_resource_action(self.resource_type, self.ocid, 'START')
             if response:
                 logging.getLogger().info("instance started successfully")
                 return response
@@ -113,7 +132,7 @@ class ComputeInstance:
         """
         response = {}
         try:
-            response = client.set_instance_action(self.ocid, 'STOP')
+            response = client.set_resource_action(self.resource_type, self.ocid, 'STOP')
             if response:
                 logging.getLogger().info("instance stopped successfully")
                 return response
@@ -0,0 +1,131 @@
+"""
+Dependency ordering of start and stop actions. an instance names its dependency group and the groups it
+depends on with freeform tags, eg - DependencyGroup=app and DependsOn=db,cache. groups of the instances due
+in a run form a DAG which is split into levels with Kahn's algorithm, starts run dependencies first and stops
+run dependents first. groups on or behind a cycle are never acted on
+"""
+
+import collections
+
+
+def get_levels(graph: dict):
+    """
+    Kahn's algorithm over a mapping of group and the groups that must go before it. returns list of levels,
+    each a sorted list of groups whose predecessors are all in earlier levels, and the set of groups left
+    unplaced by cycles
+    """
+    indegree = {group: len(predecessors) for group, predecessors in graph.items()}
+    successors = collections.defaultdict(set)
+    for group, predecessors in graph.items():
+        for predecessor in predecessors:
+            successors[predecessor].add(group)
+
+    levels = []
+    level = sorted(group for group, degree in indegree.items() if degree == 0)
+    while level:
+        levels.append(level)
+        following = []
+        for group in level:
+            for successor in successors[group]:
+                indegree[successor] -= 1
+                if indegree[successor] == 0:
+                    following.append(successor)
+        level = sorted(following)
+
+    placed = {group for level in levels for group in level}
+    return levels, set(graph) - placed
+
+
+class DependencyPlan:
+    """
+    Levels of instances to act on, an instance of a level only goes ahead once the groups it requires are
+    confirmed in their target state
+    """
+
+    def __init__(self, instances, group_tag_key='DependencyGroup', depends_on_tag_key='DependsOn'):
+        """
+        Initialization, plans starts and stops separately and merges them level by level
+        """
+        self.group_tag_key = group_tag_key
+        self.depends_on_tag_key = depends_on_tag_key
+        self.levels = []
+        self.blocked = []
+        self._requires = {}
+
+        by_action = collections.defaultdict(list)
+        for instance in instances:
+            by_action[instance.get_action()].append(instance)
+        for action, members in by_action.items():
+            self._plan_action(action, members)
+
+    def get_group(self, instance):
+        """
+        dependency group of the instance, an ungrouped instance with dependencies is a group of its own
+        """
+        group = (instance.freeform_tags.get(self.group_tag_key) or '').strip()
+        if group:
+            return group
+        return instance.ocid if self.get_depends_on(instance) else None
+
+    def get_depends_on(self, instance) -> set:
+        """
+        groups the instance depends on
+        """
+        value = instance.freeform_tags.get(self.depends_on_tag_key) or ''
+        return {group.strip() for group in value.split(',') if group.strip()}
+
+    def get_key(self, instance) -> tuple:
+        """
+        action and group pair confirmed as one unit between levels
+        """
+        return instance.get_action(), self.get_group(instance)
+
+    def get_requires(self, instance) -> set:
+        """
+        keys that must be confirmed before the action is taken on the instance
+        """
+        return self._requires.get(instance.ocid, set())
+
+    def is_flat(self) -> bool:
+        """
+        True when there is nothing to order, all instances are dispatched at once
+        """
+        return len(self.levels) <= 1 and not self.blocked
+
+    def _add(self, index, instances, requires):
+        while len(self.levels) <= index:
+            self.levels.append([])
+        for instance in instances:
+            self.levels[index].append(instance)
+            self._requires[instance.ocid] = requires
+
+    def _plan_action(self, action, members):
+        groups = collections.defaultdict(list)
+        depends_on = collections.defaultdict(set)
+        for instance in members:
+            group = self.get_group(instance)
+            groups[group].append(instance)
+            if group is not None:
+                depends_on[group] |= self.get_depends_on(instance)
+
+        # dependencies on groups with nothing to do in this run do not hold anything back
+        dependencies = {group: {dependency for dependency in depends_on[group]
+                                if dependency in groups and dependency != group}
+                        for group in groups if group is not None}
+        if action == 'stop':
+            # dependents are stopped before the groups they depend on
+            graph = {group: {dependent for dependent, required in dependencies.items() if group in required}
+                     for group in dependencies}
+        else:
+            graph = dependencies
+
+        levels, cyclic = get_levels(graph)
+        self._add(0, groups.get(None, []), set())
+        for index, level in enumerate(levels):
+            for group in level:
+                self._add(index, groups[group], {(action, predecessor) for predecessor in graph[group]})
+
+        if cyclic:
+            reason = "dependency cycle, groups on or behind it are {}".format(", ".join(sorted(cyclic)))
+            for group in sorted(cyclic):
+                self.blocked.extend((instance, reason) for instance in groups[group])
@@ -0,0 +1,177 @@
+"""
+Action dispatcher, takes start/stop actions in priority order with pacing and per shape / fault domain
+concurrency caps so that a whole cohort does not hit the compute api in the same second
+"""
+
+import time
+import heapq
+import logging
+import threading
+import itertools
+import collections
+
+
+class ActionDispatcher:
+    """
+    Priority queue based dispatcher for compute instance actions
+    """
+
+    def __init__(self, workers=50, rate_per_second=None, spread_seconds=0, shape_limit=None,
+                 fault_domain_limit=None, prioritize_stops=False, deadline=None):
+        """
+        Initialization, limits of None mean unbounded. no action is started after the monotonic deadline
+        """
+        self.workers = workers
+        self.rate_per_second = rate_per_second
+        self.spread_seconds = spread_seconds
+        self.limits = {'shape': shape_limit, 'fault_domain': fault_domain_limit}
+        self.prioritize_stops = prioritize_stops
+        self.deadline = deadline
+        self.pending = []
+        self._condition = threading.Condition()
+        self._queue = []
+        # instances held back by a concurrency cap, one heap per saturated shape / fault domain
+        self._blocked = collections.defaultdict(list)
+        self._sequence = itertools.count()
+        self._running = collections.Counter()
+        self._slots = 0
+        self._dispatched = 0
+        # taken off the queue but not acted on, the deadline passed while pacing
+        self._expired = []
+        self._started_at = None
+        self._interval = 0
+        self._timeline = collections.Counter()
+
+    def get_priority(self, instance) -> tuple:
+        """
+        lower sorts first, stops go first when configured and older scheduled events go before newer ones
+        """
+        action_rank = 0 if (self.prioritize_stops and instance.get_action() == 'stop') else 1
+        scheduled_at = instance.get_scheduled_at()
+        return action_rank, scheduled_at.timestamp() if scheduled_at else 0
+
+    def get_keys(self, instance) -> list:
+        """
+        concurrency keys of the instance which have a cap configured
+        """
+        keys = []
+        for attribute, limit in self.limits.items():
+            value = getattr(instance, attribute, None)
+            if limit and value:
+                keys.append((attribute, value))
+        return keys
+
+    def _has_capacity(self, keys) -> bool:
+        return all(self._running[key] < self.limits[key[0]] for key in keys)
+
+    def is_expired(self) -> bool:
+        """
+        whether the deadline has passed
+        """
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _pop_candidate(self):
+        """
+        pops highest priority item of the queue and of the blocked heaps whose cap has room again
+        """
+        best = self._queue if self._queue else None
+        for key, heap in self._blocked.items():
+            if heap and self._has_capacity([key]) and (best is None or heap[0] < best[0]):
+                best = heap
+        return heapq.heappop(best) if best is not None else None
+
+    def _next(self):
+        """
+        pops highest priority instance whose concurrency caps allow it, waits otherwise.
+        returns None once the queue is drained
+        """
+        with self._condition:
+            while True:
+                if self.is_expired():
+                    return None
+                item = self._pop_candidate()
+                while item is not None:
+                    keys = self.get_keys(item[-1])
+                    saturated = [key for key in keys if not self._has_capacity([key])]
+                    if not saturated:
+                        for key in keys:
+                            self._running[key] += 1
+                        slot = self._slots
+                        self._slots += 1
+                        return item, keys, slot
+                    heapq.heappush(self._blocked[saturated[0]], item)
+                    item = self._pop_candidate()
+                if not any(self._blocked.values()):
+                    return None
+                # wake up at the deadline when no running action frees a slot before it
+                self._condition.wait(timeout=None if self.deadline is None else self.deadline - time.monotonic())
+
+    def _release(self, keys):
+        with self._condition:
+            for key in keys:
+                self._running[key] -= 1
+            self._condition.notify_all()
+
+    def _worker(self, action):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            item, keys, slot = task
+            instance = item[-1]
+            try:
+                # pace the dispatch, nth action is not taken before its slot in the window
+                delay = self._started_at + slot * self._interval - time.monotonic()
+                if self.deadline is not None:
+                    delay = min(delay, self.deadline - time.monotonic())
+                if delay > 0:
+                    time.sleep(delay)
+                with self._condition:
+                    if self.is_expired():
+                        self._expired.append(item)
+                        continue
+                    self._dispatched += 1
+                    self._timeline[int(time.monotonic() - self._started_at)] += 1
+                action(instance)
+            except Exception as err:
+                logging.getLogger().exception(f"error occurred while dispatching action on '{instance}', {err}")
+            finally:
+                self._release(keys)
+
+    def run(self, instances, action) -> dict:
+        """
+        takes the action on every instance and returns dispatch timeline stats
+        """
+        self._queue = [(self.get_priority(instance), next(self._sequence), instance) for instance in instances]
+        heapq.heapify(self._queue)
+
+        count = len(self._queue)
+        intervals = [0]
+        if self.spread_seconds and count > 1:
+            intervals.append(self.spread_seconds / count)
+        if self.rate_per_second:
+            intervals.append(1 / self.rate_per_second)
+        self._interval = max(intervals)
+        self._started_at = time.monotonic()
+        logging.getLogger().info(f"dispatching {count} actions, one every {self._interval:.3f} seconds")
+
+        threads = []
+        for _ in range(min(self.workers, count)):
+            worker = threading.Thread(target=self._worker, args=(action,))
+            worker.start()
+            threads.append(worker)
+
+        for th in threads:
+            th.join()
+
+        # left over when the deadline passed
+        left = self._queue + self._expired + [item for heap in self._blocked.values() for item in heap]
+        self.pending = [item[-1] for item in sorted(left, key=lambda item: item[:2])]
+        return {
+            'dispatched': self._dispatched,
+            'pending': len(self.pending),
+            'workers': len(threads),
+            'interval_ms': round(self._interval * 1000, 2),
+            'duration_ms': round((time.monotonic() - self._started_at) * 1000, 2),
+            'per_second': {str(second): total for second, total in sorted(self._timeline.items())},
+        }
@@ -0,0 +1,217 @@
+"""
+Resource drivers, adapters between the scheduling pipeline and the OCI apis of every schedulable resource type.
+a driver maps get, list and start/stop calls of its sdk client and normalizes lifecycle states to the compute
+instance states used by the validators. drivers act on a whole resource in as few calls as the api allows,
+an instance pool of any size is started or stopped with a single call
+"""
+
+import hashlib
+from types import SimpleNamespace
+
+from oci.core import ComputeClient, ComputeManagementClient
+from oci.database import DatabaseClient
+
+
+class ResourceDriver:
+    """
+    Base driver, subclasses set the sdk client class, method names and state mapping
+    """
+
+    resource_type = None
+    sdk_client = None
+    get_method = None
+    list_method = None
+    start_method = None
+    stop_method = None
+    get_endpoint = 'get_resource'
+    action_endpoint = 'resource_action'
+    list_endpoint = 'list_resources'
+    # sdk lifecycle state to normalized state, unmapped states are kept as is
+    STATES = {}
+
+    def normalize_state(self, state):
+        """
+        lifecycle state in compute instance terms, RUNNING, STOPPED, STARTING, STOPPING, TERMINATED etc
+        """
+        return self.STATES.get(state, state)
+
+    def get(self, sdk, resource_id):
+        """
+        single resource read
+        """
+        return getattr(sdk, self.get_method)(resource_id)
+
+    def list_page(self, sdk, compartment_id, page=None):
+        """
+        one page of resources of the compartment
+        """
+        kwargs = {'page': page} if page else {}
+        return getattr(sdk, self.list_method)(compartment_id, **kwargs)
+
+    def act(self, sdk, resource_id, action):
+        """
+        start or stop the whole resource, action is START or STOP
+        """
+        method = self.start_method if action == 'START' else self.stop_method
+        return getattr(sdk, method)(resource_id)
+
+    def to_details(self, data, etag=None) -> dict:
+        """
+        normalized metadata of the resource
+        """
+        defined_tags = getattr(data, 'defined_tags', None) or {}
+        return {
+            'ocid': data.id,
+            'name': data.display_name,
+            'state': self.normalize_state(data.lifecycle_state),
+            'oracle_tags': defined_tags.get('Oracle-Tags', {}),
+            'freeform_tags': getattr(data, 'freeform_tags', None) or {},
+            'shape': getattr(data, 'shape', None),
+            'fault_domain': getattr(data, 'fault_domain', None),
+            'resource_type': self.resource_type,
+            'etag': etag,
+        }
+
+
+class ComputeInstanceDriver(ResourceDriver):
+    """
+    Compute instances, the original resource of this scheduler
+    """
+
+    resource_type = 'instance'
+    sdk_client = ComputeClient
+    get_method = 'get_instance'
+    list_method = 'list_instances'
+    get_endpoint = 'get_instance'
+    action_endpoint = 'instance_action'
+
+    def act(self, sdk, resource_id, action):
+        return sdk.instance_action(resource_id, action)
+
+
+class InstancePoolDriver(ResourceDriver):
+    """
+    Instance pools, all instances of the pool are started or stopped by one pool level call
+    """
+
+    resource_type = 'instance_pool'
+    sdk_client = ComputeManagementClient
+    get_method = 'get_instance_pool'
+    list_method = 'list_instance_pools'
+    start_method = 'start_instance_pool'
+    stop_method = 'stop_instance_pool'
+    STATES = {'PROVISIONING': 'STARTING', 'SCALING': 'RUNNING'}
+
+
+class AutonomousDatabaseDriver(ResourceDriver):
+    """
+    Autonomous databases
+    """
+
+    resource_type = 'autonomous_database'
+    sdk_client = DatabaseClient
+    get_method = 'get_autonomous_database'
+    list_method = 'list_autonomous_databases'
+    start_method = 'start_autonomous_database'
+    stop_method = 'stop_autonomous_database'
+    STATES = {'AVAILABLE': 'RUNNING', 'AVAILABLE_NEEDS_ATTENTION': 'RUNNING', 'RESTARTING': 'STARTING'}
+
+
+class DbSystemDriver(ResourceDriver):
+    """
+    VM and bare metal DB systems. the api starts and stops db nodes, so the db system state is derived from
+    its nodes and an action is one call per node
+    """
+
+    resource_type = 'db_system'
+    sdk_client = DatabaseClient
+    get_method = 'get_db_system'
+    list_method = 'list_db_systems'
+    STATES = {'AVAILABLE': 'RUNNING'}
+
+    def get_nodes(self, sdk, db_system):
+        return sdk.list_db_nodes(db_system.compartment_id, db_system_id=db_system.id).data
+
+    def get_state(self, nodes):
+        """
+        RUNNING or STOPPED when all nodes agree, otherwise the transitional state of any node
+        """
+        states = {self.normalize_state(node.lifecycle_state) for node in nodes}
+        if len(states) == 1:
+            return states.pop()
+        for state in ('STARTING', 'STOPPING', 'RUNNING'):
+            if state in states:
+                return state
+        return sorted(states)[0] if states else None
+
+    def with_node_state(self, db_system, nodes):
+        """
+        db system data with its lifecycle state taken from the nodes
+        """
+        state = self.get_state(nodes) or self.normalize_state(db_system.lifecycle_state)
+        return SimpleNamespace(
+            id=db_system.id, display_name=db_system.display_name, lifecycle_state=state,
+            defined_tags=db_system.defined_tags, freeform_tags=db_system.freeform_tags,
+            shape=db_system.shape, fault_domain=(db_system.fault_domains or [None])[0]
+        )
+
+    def get(self, sdk, resource_id):
+        response = sdk.get_db_system(resource_id)
+        data = self.with_node_state(response.data, self.get_nodes(sdk, response.data))
+        etag = hashlib.md5("{}|{}".format(response.headers.get('etag'), data.lifecycle_state).encode()).hexdigest()
+        return SimpleNamespace(status=response.status, data=data, headers={'etag': etag})
+
+    def list_page(self, sdk, compartment_id, page=None):
+        """
+        one page of db systems, the nodes of the whole compartment are listed once per page so a listed
+        db system carries the state of its nodes as well
+        """
+        response = super().list_page(sdk, compartment_id, page)
+        nodes = {}
+        node_page = None
+        while True:
+            kwargs = {'page': node_page} if node_page else {}
+            node_response = sdk.list_db_nodes(compartment_id, **kwargs)
+            for node in node_response.data:
+                nodes.setdefault(node.db_system_id, []).append(node)
+            if not node_response.has_next_page:
+                break
+            node_page = node_response.next_page
+        return SimpleNamespace(
+            status=response.status, headers=response.headers, has_next_page=response.has_next_page,
+            next_page=response.next_page,
+            data=[self.with_node_state(db_system, nodes.get(db_system.id, [])) for db_system in response.data]
+        )
+
+    def act(self, sdk, resource_id, action):
+        db_system = sdk.get_db_system(resource_id).data
+        response = None
+        for node in self.get_nodes(sdk, db_system):
+            response = sdk.db_node_action(node.id, action)
+        data = SimpleNamespace(id=db_system.id, display_name=db_system.display_name,
+                               lifecycle_state='STARTING' if action == 'START' else 'STOPPING')
+        return SimpleNamespace(status=response.status if response else 200, data=data, headers={})
+
+
+DRIVERS = {}
+
+
+def register_driver(driver: ResourceDriver):
+    """
+    registers a driver for its resource type, a custom driver replaces the built in one
+    """
+    DRIVERS[driver.resource_type] = driver
+
+
+def get_driver(resource_type=None) -> ResourceDriver:
+    """
+    driver of given resource type, compute instance driver when resource type is not given
+    """
+    driver = DRIVERS.get(resource_type or 'instance')
+    if driver is None:
+        raise ValueError(f"no driver registered for resource type '{resource_type}'")
+    return driver
+
+
+for builtin_driver in (ComputeInstanceDriver(), InstancePoolDriver(), AutonomousDatabaseDriver(), DbSystemDriver()):
+    register_driver(builtin_driver)
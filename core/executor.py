@@ -0,0 +1,97 @@
+"""
+Bounded record executor, a fixed number of worker threads take table records from a priority queue while the
+scan keeps filling it. workers stop taking records once the deadline passes and the records left over are
+handed back, so a run close to the function timeout can checkpoint them instead of being killed half way
+"""
+
+import time
+import heapq
+import logging
+import threading
+import itertools
+
+
+class BoundedExecutor:
+    """
+    Priority ordered worker pool with a deadline on the monotonic clock
+    """
+
+    def __init__(self, workers=32, deadline=None):
+        """
+        Initialization, no deadline means records are processed until the queue is drained
+        """
+        self.workers = workers
+        self.deadline = deadline
+        self.pending = []
+        self.scan_complete = True
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._closed = False
+        self._processed = 0
+
+    def is_expired(self) -> bool:
+        """
+        whether the deadline has passed
+        """
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _next(self):
+        with self._condition:
+            while not self._heap and not self._closed and not self.is_expired():
+                # wake up now and then to notice the deadline
+                self._condition.wait(timeout=0.5)
+            if self.is_expired() or not self._heap:
+                return None
+            self._processed += 1
+            return heapq.heappop(self._heap)[-1]
+
+    def _worker(self, work):
+        while True:
+            record = self._next()
+            if record is None:
+                return
+            try:
+                work(record)
+            except Exception as err:
+                logging.getLogger().exception(f"error occurred while processing the record, {err}")
+
+    def run(self, records, priority, work) -> dict:
+        """
+        Calls work on every record, lower priority values first. records not processed by the deadline are
+        left in pending in priority order, scan_complete is False if the deadline passed during the scan
+        """
+        threads = []
+        for _ in range(self.workers):
+            worker = threading.Thread(target=self._worker, args=(work,))
+            worker.start()
+            threads.append(worker)
+
+        scanned = 0
+        for record in records:
+            scanned += 1
+            with self._condition:
+                heapq.heappush(self._heap, (priority(record), next(self._sequence), record))
+                self._condition.notify()
+            if self.is_expired():
+                logging.getLogger().error("deadline passed while scanning the table")
+                self.scan_complete = False
+                # stops the scan behind the records right away
+                if hasattr(records, 'close'):
+                    records.close()
+                break
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for th in threads:
+            th.join()
+
+        self.pending = [item[-1] for item in sorted(self._heap, key=lambda item: item[:2])]
+        return {
+            'workers': len(threads),
+            'scanned': scanned,
+            'processed': self._processed,
+            'pending': len(self.pending),
+            'scan_complete': self.scan_complete,
+        }
@@ -0,0 +1,178 @@
+"""
+HTTP connection pools of the sdk clients sized to the worker count. every sdk client owns a requests session whose
+adapters default to 10 pooled connections per host, so hundreds of worker threads either queue for a connection or
+open sockets that are discarded after one call. pools are resized to HttpPoolSize and made blocking, threads wait
+up to HttpConnectTimeout for a connection, and the time waited and checkouts timed out are measured per run
+"""
+
+import time
+import socket
+import logging
+import threading
+import collections
+
+try:
+    # older sdk releases, eg - the pinned 2.45.1, bundle their own urllib3 and build the client pools from it
+    from oci._vendor.urllib3.connection import HTTPConnection
+    from oci._vendor.urllib3.exceptions import EmptyPoolError
+except ImportError:
+    from urllib3.connection import HTTPConnection
+    from urllib3.exceptions import EmptyPoolError
+
+from utils.metrics import metrics, get_percentile, POOL_WAIT_BUCKETS
+
+# timed subclass of every pool class in use, eg - the expect header pool of the sdk
+_timed_classes = {}
+_timed_classes_lock = threading.Lock()
+
+
+class PoolStats:
+    """
+    Connection checkouts, time waited for a free connection, checkouts timed out and connections opened in the
+    current run
+    """
+
+    def __init__(self, max_samples=20000):
+        """
+        Initialization
+        """
+        self._lock = threading.Lock()
+        self._waits = collections.deque(maxlen=max_samples)
+        self._counts = {'checkouts': 0, 'opened': 0, 'timeouts': 0}
+        self._wait_seconds = 0.0
+
+    def add_wait(self, seconds):
+        """
+        records one connection checkout and how long it waited
+        """
+        with self._lock:
+            self._counts['checkouts'] += 1
+            self._wait_seconds += seconds
+            self._waits.append(seconds)
+
+    def add_timeout(self):
+        """
+        records one checkout that gave up waiting for a free connection
+        """
+        with self._lock:
+            self._counts['timeouts'] += 1
+
+    def add_opened(self):
+        """
+        records one new connection
+        """
+        with self._lock:
+            self._counts['opened'] += 1
+
+    def reset(self):
+        """
+        reset per run counters
+        """
+        with self._lock:
+            self._waits.clear()
+            self._counts = dict.fromkeys(self._counts, 0)
+            self._wait_seconds = 0.0
+
+    def get_stats(self) -> dict:
+        """
+        Returns checkouts, connections opened and the distribution of pool wait time of the run
+        """
+        with self._lock:
+            waits = list(self._waits)
+            stats = dict(self._counts, wait_total_s=round(self._wait_seconds, 3))
+        stats.update({
+            'wait_p50_ms': round(get_percentile(waits, 50) * 1000, 3) if waits else None,
+            'wait_p95_ms': round(get_percentile(waits, 95) * 1000, 3) if waits else None,
+            'wait_max_ms': round(max(waits) * 1000, 3) if waits else None,
+        })
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class TimedPoolMixin:
+    """
+    Measures connection checkouts and new connections of a urllib3 connection pool, without keep-alive
+    connections are closed once their response is read. a checkout waits at most pool_timeout seconds
+    """
+
+    keep_alive = True
+    pool_timeout = None
+
+    def _get_conn(self, timeout=None):
+        started = time.monotonic()
+        try:
+            return super()._get_conn(timeout=self.pool_timeout if timeout is None else timeout)
+        except EmptyPoolError:
+            pool_stats.add_timeout()
+            raise
+        finally:
+            waited = time.monotonic() - started
+            pool_stats.add_wait(waited)
+            metrics.observe('scheduler_http_pool_wait_seconds', waited, buckets=POOL_WAIT_BUCKETS)
+
+    def _new_conn(self):
+        pool_stats.add_opened()
+        return super()._new_conn()
+
+    def _put_conn(self, conn):
+        if conn is not None and not self.keep_alive:
+            conn.close()
+            # the free slot makes the next checkout open a new connection
+            conn = None
+        super()._put_conn(conn)
+
+
+def get_timed_pool_class(pool_class, keep_alive=True, pool_timeout=None):
+    """
+    timed subclass of given pool class, built once per keep-alive and pool timeout setting
+    """
+    # pools configured before are rebuilt from the pool class of the sdk
+    while issubclass(pool_class, TimedPoolMixin):
+        pool_class = pool_class.__bases__[-1]
+    with _timed_classes_lock:
+        key = (pool_class, keep_alive, pool_timeout)
+        if key not in _timed_classes:
+            _timed_classes[key] = type('Timed' + pool_class.__name__, (TimedPoolMixin, pool_class),
+                                       {'keep_alive': keep_alive, 'pool_timeout': pool_timeout})
+        return _timed_classes[key]
+
+
+def configure_sdk_client(sdk_client, pool_size, keep_alive=True, connect_timeout=10.0, read_timeout=60.0,
+                         pool_connections=10) -> bool:
+    """
+    Resizes the connection pools of the sdk client and applies keep-alive and timeouts, pool connections is the
+    number of per host pools kept. existing pools are dropped, the adapters mounted by the sdk are kept so its
+    transport behaviour is preserved. waiting for a free connection is bounded by the connect timeout. returns
+    False for clients without an http session, eg - test fakes
+    """
+    base_client = getattr(sdk_client, 'base_client', None)
+    session = getattr(base_client, 'session', None)
+    if session is None:
+        return False
+
+    pool_kwargs = {}
+    if keep_alive:
+        # probes keep idle pooled connections from being dropped silently by firewalls and load balancers
+        pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+        session.headers['Connection'] = 'keep-alive'
+    else:
+        session.headers['Connection'] = 'close'
+
+    for adapter in set(session.adapters.values()):
+        if getattr(adapter, 'poolmanager', None) is None:
+            continue
+        adapter.poolmanager.clear()
+        # blocking pools make threads wait for a free connection instead of opening one to discard after use
+        adapter.init_poolmanager(pool_connections, pool_size, block=True, **pool_kwargs)
+        classes = adapter.poolmanager.pool_classes_by_scheme
+        adapter.poolmanager.pool_classes_by_scheme = {
+            scheme: get_timed_pool_class(pool_class, keep_alive, connect_timeout)
+            for scheme, pool_class in classes.items()
+        }
+    base_client.timeout = (connect_timeout, read_timeout)
+    logging.getLogger().info(f"http pool of '{type(sdk_client).__name__}' sized to {pool_size} connections")
+    return True
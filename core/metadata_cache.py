@@ -0,0 +1,88 @@
+"""
+Instance metadata cache living at module level so that it survives warm invocations of the function.
+Entries are keyed by instance ocid. only entries younger than the ttl save a get_instance call, an expired
+entry is read again in full since the sdk sends no conditional request
+"""
+
+import threading
+import logging
+
+from utils.clock import get_clock
+from utils.metrics import metrics
+
+
+class MetadataCache:
+    """
+    A TTL based cache for instance metadata
+    """
+
+    def __init__(self, ttl=300):
+        """
+        Initialization
+        """
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get_ttl(self):
+        """
+        getter for cache ttl in seconds
+        """
+        return self._ttl
+
+    def set_ttl(self, ttl):
+        """
+        setter for cache ttl in seconds, zero or less disables ttl hits
+        """
+        self._ttl = ttl
+
+    def lookup(self, instance_id):
+        """
+        Returns tuple of cached entry and its freshness, entry is None if instance is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(instance_id)
+        if entry is None:
+            return None, False
+        is_fresh = (get_clock().monotonic() - entry['stored_at']) < self._ttl
+        return entry, is_fresh
+
+    def store(self, instance_id, details):
+        """
+        Adds or replaces the cache entry of given instance
+        """
+        with self._lock:
+            self._entries[instance_id] = {'details': details, 'stored_at': get_clock().monotonic()}
+
+    def invalidate(self, instance_id):
+        """
+        Drops the cached entry, used once the instance state is changed by this scheduler
+        """
+        with self._lock:
+            self._entries.pop(instance_id, None)
+
+    def record(self, outcome):
+        """
+        Increments given outcome counter, outcome is hits or misses
+        """
+        with self._lock:
+            self._stats[outcome] += 1
+        metrics.inc('scheduler_metadata_cache_total', outcome=outcome)
+
+    def reset_stats(self):
+        """
+        Reset the per run counters, cached entries are kept
+        """
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0}
+
+    def get_stats(self):
+        """
+        Returns per run counters along with current cache size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        logging.getLogger().info(f"metadata cache stats '{stats}'")
+        return stats
@@ -5,71 +5,364 @@ Created on 06-09-2021
 @email: an.anurag@msn.com
 """
 
+import json
+import time
+import queue
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from oci.config import from_file
 from oci.core import ComputeClient
+from oci.functions import FunctionsInvokeClient, FunctionsManagementClient
 from oci.nosql import NosqlClient, models
 from oci.exceptions import ServiceError, RequestException
 
+from core.drivers import get_driver
+from core.http_pool import EmptyPoolError, configure_sdk_client, pool_stats
+from core.metadata_cache import MetadataCache
+from utils.metrics import metrics
+from utils.tracing import tracer
+from core.resilience import CircuitBreaker, CircuitOpenError, HedgedCaller
+
 
 class OCIClient:
 
+    _ENDPOINTS = ('get_instance', 'instance_action', 'get_resource', 'resource_action', 'list_resources', 'query',
+                  'table_row', 'invoke_function')
+
     def __init__(self):
-        self.config = from_file('config')
-        self.compute = ComputeClient(self.config)
-        self.nosql_db = NosqlClient(self.config)
+        # sdk clients are built on first use and kept for the life of the container
+        self._config = None
+        self._compute = None
+        self._nosql_db = None
+        self._sdk_clients = {}
+        self._lock = threading.Lock()
+        self.http_settings = None
+        self.metadata_cache = MetadataCache()
+        self.breaker_settings = {'failure_threshold': 5, 'reset_timeout': 30}
+        self.breakers = self._build_breakers()
+        self.hedger = HedgedCaller('get_instance')
+
+    @property
+    def config(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = from_file('config')
+        return self._config
+
+    @property
+    def compute(self):
+        if self._compute is None:
+            config = self.config
+            with self._lock:
+                if self._compute is None:
+                    self._compute = self._configure_http_of(ComputeClient(config))
+        return self._compute
+
+    @compute.setter
+    def compute(self, compute_client):
+        self._compute = compute_client
+
+    @property
+    def nosql_db(self):
+        if self._nosql_db is None:
+            config = self.config
+            with self._lock:
+                if self._nosql_db is None:
+                    self._nosql_db = self._configure_http_of(NosqlClient(config))
+        return self._nosql_db
+
+    @nosql_db.setter
+    def nosql_db(self, nosql_client):
+        self._nosql_db = nosql_client
+
+    def get_sdk_client(self, sdk_class, service_endpoint=None):
+        """
+        sdk client of given class built on first use, compute and nosql clients are the ones above.
+        clients of a given service endpoint, eg - a function invoke endpoint, are kept per endpoint
+        """
+        if sdk_class is ComputeClient:
+            return self.compute
+        if sdk_class is NosqlClient:
+            return self.nosql_db
+        key = (sdk_class, service_endpoint) if service_endpoint else sdk_class
+        if key not in self._sdk_clients:
+            config = self.config
+            kwargs = {'service_endpoint': service_endpoint} if service_endpoint else {}
+            with self._lock:
+                if key not in self._sdk_clients:
+                    self._sdk_clients[key] = self._configure_http_of(sdk_class(config, **kwargs))
+        return self._sdk_clients[key]
+
+    def set_sdk_client(self, sdk_class, sdk_client):
+        """
+        replaces the sdk client of given class
+        """
+        if sdk_class is ComputeClient:
+            self.compute = sdk_client
+        elif sdk_class is NosqlClient:
+            self.nosql_db = sdk_client
+        else:
+            self._sdk_clients[sdk_class] = sdk_client
+
+    def configure_http(self, pool_size, keep_alive=True, connect_timeout=10.0, read_timeout=60.0):
+        """
+        Apply http pool size, keep-alive and timeouts to built sdk clients and those built later, pools are only
+        rebuilt when the settings change. resets per run pool wait counters
+        """
+        pool_stats.reset()
+        settings = {'pool_size': pool_size, 'keep_alive': keep_alive, 'connect_timeout': connect_timeout,
+                    'read_timeout': read_timeout}
+        with self._lock:
+            if settings == self.http_settings:
+                return
+            self.http_settings = settings
+            sdk_clients = [self._compute, self._nosql_db] + list(self._sdk_clients.values())
+        for sdk_client in sdk_clients:
+            if sdk_client is not None:
+                configure_sdk_client(sdk_client, **settings)
+
+    def _configure_http_of(self, sdk_client):
+        if self.http_settings:
+            configure_sdk_client(sdk_client, **self.http_settings)
+        return sdk_client
+
+    def get_http_stats(self) -> dict:
+        """
+        Returns http pool settings along with connection checkouts and pool wait time of the current run
+        """
+        return dict(self.http_settings or {}, **pool_stats.get_stats())
+
+    def configure_resilience(self, hedge_percentile=95, failure_threshold=5, reset_timeout=30):
+        """
+        Apply hedging and circuit breaker settings and reset their per run counters
+        """
+        self.hedger.percentile = hedge_percentile
+        self.hedger.reset_stats()
+        self.breaker_settings = {'failure_threshold': failure_threshold, 'reset_timeout': reset_timeout}
+        for breaker in self.breakers.values():
+            breaker.failure_threshold = failure_threshold
+            breaker.reset_timeout = reset_timeout
+            breaker.reset_stats()
+
+    def get_resilience_stats(self) -> dict:
+        """
+        Returns hedge and circuit breaker counters of the current run
+        """
+        return {
+            'hedge': self.hedger.get_stats(),
+            'breakers': {endpoint: breaker.get_stats() for endpoint, breaker in self.breakers.items()}
+        }
+
+    def _call(self, endpoint, fn, *args, hedge=False, **kwargs):
+        """
+        Calls the sdk function through the circuit breaker of the endpoint, idempotent reads can be hedged.
+        throttling, server side, connection and unexpected errors count as failures
+        """
+        breaker = self.breakers[endpoint]
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit breaker for '{endpoint}' is open")
+        started = time.monotonic()
+        with tracer.span(f'OCIClient.{endpoint}', hedged=hedge) as span:
+            try:
+                result = self.hedger.call(fn, *args, **kwargs) if hedge else fn(*args, **kwargs)
+            except ServiceError as err:
+                if span:
+                    span.set_attribute('status_code', err.status)
+                metrics.inc('scheduler_api_errors_total', endpoint=endpoint)
+                if err.status == 429:
+                    metrics.inc('scheduler_api_throttles_total', endpoint=endpoint)
+                if err.status == 429 or err.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            except RequestException:
+                metrics.inc('scheduler_api_errors_total', endpoint=endpoint)
+                breaker.record_failure()
+                raise
+            except EmptyPoolError as err:
+                # no pooled connection freed up in time, surfaced like any other connection error
+                metrics.inc('scheduler_api_errors_total', endpoint=endpoint)
+                breaker.record_failure()
+                raise RequestException(err) from err
+            except Exception:
+                # any other error counts as well, a half open breaker must not be left waiting for its probe
+                metrics.inc('scheduler_api_errors_total', endpoint=endpoint)
+                breaker.record_failure()
+                raise
+            finally:
+                metrics.observe('scheduler_api_latency_seconds', time.monotonic() - started, endpoint=endpoint)
+        breaker.record_success()
+        return result
 
-    def get_instance_metadata(self, instance_id) -> dict:
+    def reset(self):
         """
-        implements get_instance api from OCI sdk
+        Drops cached metadata and resilience state, used when the backend behind the sdk clients is replaced.
+        configured breaker thresholds and hedge percentile are kept
+        """
+        self.metadata_cache = MetadataCache(ttl=self.metadata_cache.get_ttl())
+        self.breakers = self._build_breakers()
+        self.hedger = HedgedCaller('get_instance', percentile=self.hedger.percentile)
+
+    def _build_breakers(self):
+        return {endpoint: CircuitBreaker(endpoint, **self.breaker_settings) for endpoint in self._ENDPOINTS}
+
+    def warm_up(self):
+        """
+        Builds sdk clients ahead of the first api call
+        """
+        return self.compute, self.nosql_db
+
+    def get_instance_metadata(self, instance_id, use_cache=True) -> dict:
+        """
+        implements get_instance api from OCI sdk, see get_resource_metadata
         :return:
         """
+        return self.get_resource_metadata('instance', instance_id, use_cache=use_cache)
+
+    def get_resource_metadata(self, resource_type, resource_id, use_cache=True) -> dict:
+        """
+        reads the resource through its driver, cache entries younger than the ttl are returned without calling
+        the api. expired entries are read again in full, only ttl hits save a call
+        """
         details = {}
         try:
-            response = self.compute.get_instance(instance_id)
+            entry, is_fresh = self.metadata_cache.lookup(resource_id) if use_cache else (None, False)
+            if entry and is_fresh:
+                self.metadata_cache.record('hits')
+                logging.getLogger().info(f"resource metadata served from cache for '{entry['details']['name']}'")
+                return dict(entry['details'], from_cache=True)
+
+            driver = get_driver(resource_type)
+            sdk = self.get_sdk_client(driver.sdk_client)
+            response = self._call(driver.get_endpoint, driver.get, sdk, resource_id, hedge=True)
             if response.status == 200:
-                details = {
-                    'ocid': response.data.id,
-                    'name': response.data.display_name,
-                    'state': response.data.lifecycle_state,
-                    'oracle_tags': response.data.defined_tags['Oracle-Tags'],
-                    'freeform_tags': response.data.freeform_tags,
-                }
-                logging.getLogger().info(f"instance metadata retrieved for '{details['name']}'")
-                return details
-            logging.getLogger().error("instance metadata retrieval failed")
+                details = driver.to_details(response.data, etag=response.headers.get('etag'))
+                self.metadata_cache.store(resource_id, details)
+                self.metadata_cache.record('misses')
+                logging.getLogger().info(f"{resource_type} metadata retrieved for '{details['name']}'")
+                return dict(details, from_cache=False)
+            logging.getLogger().error("resource metadata retrieval failed")
             return details
         except ServiceError as err:
-            logging.getLogger().exception(f"error occurred while getting instance metadata, {err}")
+            logging.getLogger().exception(f"error occurred while getting resource metadata, {err}")
             return details
         except RequestException as err:
-            logging.getLogger().exception(f"error occurred while getting instance metadata, {err}")
+            logging.getLogger().exception(f"error occurred while getting resource metadata, {err}")
+            return details
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
             return details
+        except ValueError as err:
+            logging.getLogger().error(f"unsupported resource type, {err}")
+            return details
+
+    def list_resources(self, resource_type, compartment_id) -> list:
+        """
+        bulk reads all resources of the type in the compartment page by page and caches their metadata,
+        so the per resource reads of the run are served from the cache
+        """
+        resources = []
+        try:
+            driver = get_driver(resource_type)
+            sdk = self.get_sdk_client(driver.sdk_client)
+            page = None
+            while True:
+                response = self._call(driver.list_endpoint, driver.list_page, sdk, compartment_id, page)
+                for data in response.data:
+                    details = driver.to_details(data)
+                    self.metadata_cache.store(details['ocid'], details)
+                    resources.append(details)
+                if not response.has_next_page:
+                    break
+                page = response.next_page
+            logging.getLogger().info(f"listed {len(resources)} resources of type '{resource_type}'")
+            return resources
+        except ServiceError as err:
+            logging.getLogger().exception(f"error occurred while listing resources, {err}")
+            return resources
+        except RequestException as err:
+            logging.getLogger().exception(f"error occurred while listing resources, {err}")
+            return resources
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return resources
+        except ValueError as err:
+            logging.getLogger().error(f"unsupported resource type, {err}")
+            return resources
 
     def set_instance_action(self, instance_id, action) -> dict:
         """
-        implements instance_action api from oci sdk
+        implements instance_action api from oci sdk, see set_resource_action
+        """
+        return self.set_resource_action('instance', instance_id, action)
+
+    def set_resource_action(self, resource_type, resource_id, action) -> dict:
+        """
+        starts or stops the whole resource through its driver, action is START or STOP
         """
         details = {}
         try:
-            response = self.compute.instance_action(instance_id, action)
-            if response.status == 200:
+            driver = get_driver(resource_type)
+            sdk = self.get_sdk_client(driver.sdk_client)
+            response = self._call(driver.action_endpoint, driver.act, sdk, resource_id, action)
+            # lifecycle state is about to change, cached metadata is no longer valid
+            self.metadata_cache.invalidate(resource_id)
+            if response.status in (200, 202):
                 details = {
                     'ocid': response.data.id,
                     'display_name': response.data.display_name,
-                    'lifecycle_state': response.data.lifecycle_state
+                    'lifecycle_state': driver.normalize_state(response.data.lifecycle_state)
                 }
-                logging.getLogger().info("instance action set successfully")
+                logging.getLogger().info(f"{resource_type} action set successfully")
                 return details
-            logging.getLogger().error("unable to set instance action")
+            logging.getLogger().error(f"unable to set {resource_type} action")
             return details
         except ServiceError as err:
-            logging.getLogger().exception(f"error occurred while getting instance metadata, {err}")
+            logging.getLogger().exception(f"error occurred while setting resource action, {err}")
             return details
         except RequestException as err:
-            logging.getLogger().exception(f"error occurred while getting instance metadata, {err}")
+            logging.getLogger().exception(f"error occurred while setting resource action, {err}")
+            return details
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
             return details
+        except ValueError as err:
+            logging.getLogger().error(f"unsupported resource type, {err}")
+            return details
+
+    def query_pages(self, compartment_id, query, stats: dict = None):
+        """
+        Generator over the result set of given query, pages are fetched one after another as they are consumed.
+        read latency, consumed read units, pages and rows are recorded in stats if given
+        """
+        stats = stats if stats is not None else {}
+        stats.update({'latency_ms': 0.0, 'max_page_latency_ms': 0.0, 'read_units': 0, 'pages': 0, 'rows': 0})
+        page = None
+        while True:
+            started = time.monotonic()
+            kwargs = {'page': page} if page else {}
+            response = self._call('query', self.nosql_db.query, query_details=models.QueryDetails(
+                compartment_id=compartment_id,
+                statement=query
+            ), **kwargs)
+            latency_ms = (time.monotonic() - started) * 1000
+            stats['latency_ms'] += latency_ms
+            stats['max_page_latency_ms'] = max(stats['max_page_latency_ms'], latency_ms)
+            stats['pages'] += 1
+            if response.data.usage:
+                stats['read_units'] += response.data.usage.read_units_consumed or 0
+
+            for item in response.data.items or []:
+                stats['rows'] += 1
+                yield item
+
+            if not response.has_next_page:
+                break
+            page = response.next_page
 
     def query_database(self, compartment_id, query):
         """
@@ -77,33 +370,192 @@ class OCIClient:
         :return: list
         """
         try:
-            response = self.nosql_db.query(query_details=models.QueryDetails(
-                compartment_id=compartment_id,
-                statement=query
-            ))
-
-            if response.status == 200:
-                result = response.data
-
-                while response.has_next_page:
-                    response = self.nosql_db.query(query_details=models.QueryDetails(
-                        compartment_id=compartment_id,
-                        statement=query
-                        ), page=response.next_page)
-                    result.extend(response.data)
-
-                result = result.items
-                if result:
-                    logging.getLogger().info("query returned result successfully")
-                    return result
-                logging.getLogger().error("query did not returned any result")
-                return None
+            result = list(self.query_pages(compartment_id, query))
+            if result:
+                logging.getLogger().info("query returned result successfully")
+                return result
+            logging.getLogger().error("query did not returned any result")
+            return None
         except ServiceError as err:
             logging.getLogger().exception(f"error occurred while querying the database {err}")
             return None
         except RequestException as err:
             logging.getLogger().exception(f"error occurred while querying the database, {err}")
             return None
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return None
+
+    def scan_partitions(self, compartment_id, queries: dict, parallelism: int, stats: dict):
+        """
+        Runs the partition queries concurrently and yields records as they arrive from any partition.
+        queries is a dict of partition name and query, per partition stats are recorded in stats.
+        closing the generator early, eg - at the run deadline, stops the scans without waiting for them
+        """
+        results = queue.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def scan(name, query):
+            partition_stats = stats.setdefault(name, {})
+            try:
+                for item in self.query_pages(compartment_id, query, stats=partition_stats):
+                    if stop.is_set():
+                        # next page is not fetched
+                        break
+                    results.put(item)
+            except (ServiceError, RequestException, CircuitOpenError) as err:
+                logging.getLogger().exception(f"error occurred while scanning partition '{name}', {err}")
+                partition_stats['error'] = str(err)
+            finally:
+                results.put(done)
+
+        executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='scan')
+        futures = [executor.submit(scan, name, query) for name, query in queries.items()]
+        try:
+            pending = len(queries)
+            while pending:
+                item = results.get()
+                if item is done:
+                    pending -= 1
+                    continue
+                yield item
+        finally:
+            # a page request in flight is left to finish in the background, queued partitions never start
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def get_table_row(self, compartment_id, table_name, key: dict) -> dict:
+        """
+        implements get_row api from oci sdk, returns row value or empty dict if row does not exist
+        """
+        return self.get_versioned_table_row(compartment_id, table_name, key)[0]
+
+    def get_versioned_table_row(self, compartment_id, table_name, key: dict) -> tuple:
+        """
+        implements get_row api from oci sdk, returns tuple of row value and row version. empty dict and None are
+        returned if row does not exist
+        """
+        details = {}
+        try:
+            response = self._call(
+                'table_row', self.nosql_db.get_row,
+                table_name_or_id=table_name,
+                key=["{}:{}".format(column, value) for column, value in key.items()],
+                compartment_id=compartment_id
+            )
+            if response.status == 200 and response.data.value:
+                details = response.data.value
+                # etag of the row is its version, used for writes conditional on the row being unchanged
+                return details, response.headers.get('etag')
+            return details, None
+        except ServiceError as err:
+            if err.status == 404:
+                return details, None
+            logging.getLogger().exception(f"error occurred while getting the table row, {err}")
+            return details, None
+        except RequestException as err:
+            logging.getLogger().exception(f"error occurred while getting the table row, {err}")
+            return details, None
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return details, None
+
+    def update_table_row(self, compartment_id, table_name, value: dict, option=None, ttl=None,
+                         if_version=None) -> dict:
+        """
+        implements update_row api from oci sdk. option can be IF_ABSENT or IF_PRESENT and if_version a row version
+        for conditional writes, returned version is None when the condition is not met and empty dict is returned
+        on failure
+        """
+        details = {}
+        kwargs = {'if_match': if_version} if if_version else {}
+        try:
+            response = self._call(
+                'table_row', self.nosql_db.update_row,
+                table_name_or_id=table_name,
+                update_row_details=models.UpdateRowDetails(
+                    compartment_id=compartment_id,
+                    value=value,
+                    option=option,
+                    ttl=ttl,
+                    is_ttl_use_table_default=ttl is None
+                ),
+                **kwargs
+            )
+            if response.status == 200:
+                details = {'version': response.data.version}
+                return details
+            logging.getLogger().error("unable to update the table row")
+            return details
+        except ServiceError as err:
+            if err.status == 412 and if_version:
+                # row changed since it was read
+                details = {'version': None}
+                return details
+            logging.getLogger().exception(f"error occurred while updating the table row, {err}")
+            return details
+        except RequestException as err:
+            logging.getLogger().exception(f"error occurred while updating the table row, {err}")
+            return details
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return details
+
+    def delete_table_row(self, compartment_id, table_name, key: dict) -> bool:
+        """
+        implements delete_row api from oci sdk, returns True when the row is deleted or does not exist
+        """
+        try:
+            response = self._call(
+                'table_row', self.nosql_db.delete_row,
+                table_name_or_id=table_name,
+                key=["{}:{}".format(column, value) for column, value in key.items()],
+                compartment_id=compartment_id
+            )
+            if response.status == 200:
+                return True
+            logging.getLogger().error("unable to delete the table row")
+            return False
+        except ServiceError as err:
+            if err.status == 404:
+                return True
+            logging.getLogger().exception(f"error occurred while deleting the table row, {err}")
+            return False
+        except RequestException as err:
+            logging.getLogger().exception(f"error occurred while deleting the table row, {err}")
+            return False
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return False
+
+    def invoke_function(self, function_id, payload: dict) -> bool:
+        """
+        implements detached invoke_function api from oci sdk, the call returns once the invocation is accepted
+        """
+        try:
+            management = self.get_sdk_client(FunctionsManagementClient)
+            endpoint = self._call('invoke_function', management.get_function, function_id).data.invoke_endpoint
+            invoker = self.get_sdk_client(FunctionsInvokeClient, service_endpoint=endpoint)
+            response = self._call(
+                'invoke_function', invoker.invoke_function, function_id,
+                invoke_function_body=json.dumps(payload), fn_invoke_type='detached'
+            )
+            if response.status in (200, 202):
+                return True
+            logging.getLogger().error("unable to invoke the function")
+            return False
+        except ServiceError as err:
+            logging.getLogger().exception(f"error occurred while invoking the function, {err}")
+            return False
+        except RequestException as err:
+            logging.getLogger().exception(f"error occurred while invoking the function, {err}")
+            return False
+        except CircuitOpenError as err:
+            logging.getLogger().error(f"call rejected, {err}")
+            return False
 
 
 client = OCIClient()
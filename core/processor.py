@@ -6,15 +6,35 @@ Created on 01-09-2021
 """
 
 import sys
+import math
+import time
+import zlib
+import uuid
 import datetime
 import logging
-
-import pytz
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # local imports
+from core.boot_profile import boot_profile
+from core.calendars import ExceptionCalendars
 from core.compute_instance import ComputeInstance
+from core.dependencies import DependencyPlan
+from core.dispatcher import ActionDispatcher
+from core.executor import BoundedExecutor
 from core.schedule import Schedule
 from core.oci_client import client
+from core.profiles import ScheduleProfiles
+from core.run_history import RunHistory, build_record
+from core.runtime import runtime
+from core.state_store import StateStore
+from core.validation_pool import ValidationBatcher, get_pool
+from utils.clock import get_clock, utc_now
+from utils.date_util import get_utc_from_str
+from utils.metrics import metrics, get_percentile, LATENESS_BUCKETS
+from utils.run_report import RunReport, NdjsonFileSink, TableSink
+from utils.tracing import tracer
+from utils.tz_context import TimezoneContext
 from validators import schedule_change_validator, tag_value_validator, db_schedule_validator
 
 
@@ -23,6 +43,11 @@ class Processor:
     A central management wrapper for start/stop functionality
     """
 
+    _PARTITION_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+    _CHECKPOINT_CHUNK = 2000
+    # report stages of failures that leave a scheduled event without its action
+    ACTION_STAGES = ('take_action', 'dependencies')
+
     def __init__(self, configs):
         self._configs = configs
         self.client = client
@@ -31,15 +56,55 @@ class Processor:
         self.activate_auto_start_stop = None
         self.activate_auto_start = None
         self.minutes_delta = None
+        self.metadata_cache_ttl = None
+        self.max_catch_up_minutes = None
+        self.state_store = None
+        self.tz_context = None
+        self.calendars = ExceptionCalendars()
+        self.calendar_tag_key = None
+        self.calendar_window = None
+        self.profile_table_name = None
+        self.prefetch_resources = []
+        self._config_profiles = ScheduleProfiles()
+        self.profiles = ScheduleProfiles()
+        self.shard_count = 1
+        self.shard_index = 0
+        self.scan_parallelism = 1
+        self.scan_partition_key = None
+        self.scan_stats = {}
+        self.dispatch_settings = {}
+        self.dependency_settings = {}
+        self.boot_settings = {}
+        self.boot_samples = []
+        self.pre_started = set()
+        self._accepted = {}
+        self._confirmed = set()
+        self.max_workers = 32
+        self.deadline = None
+        self.pre_processing_deadline = None
+        self.deadline_settings = {}
+        self.resume_ids = set()
+        self.resume_past = None
+        self.checkpoint_ids = []
+        self.validation_processes = 0
+        self.validation_batch_size = 200
+        self.validation_now = None
+        self._refresh = []
+        self.trace_span = None
+        self.run_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._queued_ocids = set()
         self.valid_instances_queue = []
-        self.started_instances = []
-        self.stopped_instances = []
-        self.processed_instances = []
         self.run_status = 'SUCCESS'
         self.enable_msg = {"message": "resource command scheduler is disabled, please enable it from configuration"}
-        self.instance_processed = {'count': 0, 'instances': []}
-        self.instance_started = {'count': 0, 'instances': []}
-        self.instance_stopped = {'count': 0, 'instances': []}
+        self.report = RunReport(self.run_id)
+        self.run_history = None
+        self.function_timeout = None
+        self.phases = {}
+        self._phase_started = time.monotonic()
+        self.run_started_at = utc_now()
+        self._run_started = time.monotonic()
+        self.action_lateness = []
         self.stats = {
             "message": "resource command scheduler executed",
             'status': self.run_status,
@@ -53,156 +118,1106 @@ class Processor:
         """
         return self._configs.get(key)
 
+    @staticmethod
+    def parse_configs(configs: dict) -> dict:
+        """
+        Parse OCI function configs into typed settings, result is reused while configs do not change
+        """
+        kill_switch = configs.get('ActivateAutoStartStopProcess').strip()
+        auto_start_switch = configs.get("ActivateAutoStart").strip()
+        minutes_delta = int(configs.get('MinutesDelta').strip())
+        cache_ttl = configs.get('MetadataCacheTTL')
+        max_catch_up = configs.get('MaxCatchUpMinutes')
+        state_table = configs.get('StateTableName')
+        shard_count = configs.get('ShardCount')
+        shard_index = configs.get('ShardIndex')
+        scan_parallelism = configs.get('ScanParallelism')
+        scan_partition_key = configs.get('ScanPartitionKey')
+        hedge_percentile = configs.get('HedgePercentile')
+        failure_threshold = configs.get('BreakerFailureThreshold')
+        reset_timeout = configs.get('BreakerResetSeconds')
+        dispatch_workers = configs.get('DispatchWorkers')
+        dispatch_rate = configs.get('DispatchRatePerSecond')
+        dispatch_spread = configs.get('DispatchSpreadSeconds')
+        trace_exporter = configs.get('TraceExporter')
+        trace_file_path = configs.get('TraceFilePath')
+        shape_limit = configs.get('MaxConcurrentPerShape')
+        fault_domain_limit = configs.get('MaxConcurrentPerFaultDomain')
+        prioritize_stops = configs.get('PrioritizeStops')
+        calendar_tag_key = configs.get('CalendarTagKey')
+        profile_table = configs.get('ProfileTableName')
+        prefetch_resources = configs.get('PrefetchResources')
+        report_path = configs.get('RunReportPath')
+        report_table = configs.get('RunReportTableName')
+        top_failures = configs.get('RunReportTopFailures')
+        history_table = configs.get('RunHistoryTableName')
+        history_ttl = configs.get('RunHistoryTTLDays')
+        history_batch = configs.get('RunHistoryBatchSize')
+        function_timeout = configs.get('FunctionTimeoutSeconds')
+        group_tag_key = configs.get('DependencyGroupTagKey')
+        depends_on_tag_key = configs.get('DependsOnTagKey')
+        dependency_wait = configs.get('DependencyWaitSeconds')
+        dependency_poll = configs.get('DependencyPollSeconds')
+        boot_watch = configs.get('BootWatchSeconds')
+        max_pre_start = configs.get('MaxPreStartMinutes')
+        boot_percentile = configs.get('BootLeadPercentile')
+        boot_refresh = configs.get('BootProfileRefreshMinutes')
+        boot_history_days = configs.get('BootHistoryDays')
+        max_workers = configs.get('MaxWorkers')
+        deadline_margin = configs.get('DeadlineMarginSeconds')
+        dispatch_reserve = configs.get('DispatchReserveSeconds')
+        continuation_function = configs.get('ContinuationFunctionId')
+        validation_processes = configs.get('ValidationProcesses')
+        validation_batch = configs.get('ValidationBatchSize')
+        http_pool_size = configs.get('HttpPoolSize')
+        http_keep_alive = configs.get('HttpKeepAlive')
+        http_connect_timeout = configs.get('HttpConnectTimeout')
+        http_read_timeout = configs.get('HttpReadTimeout')
+
+        # every worker thread may hold a connection, hedged reads and scan partitions hold a few more
+        workers = max(int(max_workers.strip()) if max_workers else 32,
+                      int(dispatch_workers.strip()) if dispatch_workers else 50)
+        default_pool_size = workers + workers // 4 + (int(scan_parallelism.strip()) if scan_parallelism else 1)
+
+        return {
+            'activate_auto_start_stop': True if kill_switch.casefold() == 'True'.casefold() else False,
+            'activate_auto_start': True if auto_start_switch.casefold() == 'True'.casefold() else False,
+            'compartment_id': configs.get('CompartmentId').strip(),
+            'table_name': configs.get('TableName').strip(),
+            'minutes_delta': minutes_delta,
+            'metadata_cache_ttl': int(cache_ttl.strip()) if cache_ttl else 300,
+            'max_catch_up_minutes': max(int(max_catch_up.strip()) if max_catch_up else 360, minutes_delta),
+            'state_table_name': state_table.strip() if state_table else None,
+            'shard_count': int(shard_count.strip()) if shard_count else 1,
+            'shard_index': int(shard_index.strip()) if shard_index else 0,
+            'scan_parallelism': max(int(scan_parallelism.strip()) if scan_parallelism else 1, 1),
+            'scan_partition_key': scan_partition_key.strip() if scan_partition_key else 'instance_id',
+            'hedge_percentile': int(hedge_percentile.strip()) if hedge_percentile else 95,
+            'breaker_failure_threshold': int(failure_threshold.strip()) if failure_threshold else 5,
+            'breaker_reset_seconds': int(reset_timeout.strip()) if reset_timeout else 30,
+            'dispatch_workers': int(dispatch_workers.strip()) if dispatch_workers else 50,
+            'dispatch_rate_per_second': float(dispatch_rate.strip()) if dispatch_rate else None,
+            'dispatch_spread_seconds': float(dispatch_spread.strip()) if dispatch_spread else 0,
+            'max_concurrent_per_shape': int(shape_limit.strip()) if shape_limit else None,
+            'max_concurrent_per_fault_domain': int(fault_domain_limit.strip()) if fault_domain_limit else None,
+            'trace_exporter': trace_exporter.strip() if trace_exporter else None,
+            'trace_file_path': trace_file_path.strip() if trace_file_path else None,
+            'prioritize_stops': prioritize_stops.strip().casefold() == 'True'.casefold() if prioritize_stops else False,
+            'exception_calendars': ExceptionCalendars.from_config(
+                configs.get('ExceptionCalendars'), configs.get('DefaultCalendars')
+            ),
+            'calendar_tag_key': calendar_tag_key.strip() if calendar_tag_key else 'ExceptionCalendars',
+            'schedule_profiles': ScheduleProfiles.from_config(configs.get('ScheduleProfiles')),
+            'profile_table_name': profile_table.strip() if profile_table else None,
+            'prefetch_resources': [
+                tuple(item.strip().split(':', 1)) for item in prefetch_resources.split(',') if ':' in item
+            ] if prefetch_resources else [],
+            'run_report_path': report_path.strip() if report_path else '/tmp/instance-scheduler-report.ndjson',
+            'run_report_table_name': report_table.strip() if report_table else None,
+            'run_report_top_failures': int(top_failures.strip()) if top_failures else 5,
+            'run_history_table_name': history_table.strip() if history_table else None,
+            'run_history_ttl_days': int(history_ttl.strip()) if history_ttl else 30,
+            'run_history_batch_size': max(int(history_batch.strip()) if history_batch else 1, 1),
+            'function_timeout_seconds': int(function_timeout.strip()) if function_timeout else 300,
+            'dependency_group_tag_key': group_tag_key.strip() if group_tag_key else 'DependencyGroup',
+            'depends_on_tag_key': depends_on_tag_key.strip() if depends_on_tag_key else 'DependsOn',
+            'dependency_wait_seconds': float(dependency_wait.strip()) if dependency_wait else None,
+            'dependency_poll_seconds': float(dependency_poll.strip()) if dependency_poll else 10,
+            'boot_watch_seconds': float(boot_watch.strip()) if boot_watch else 0,
+            'max_pre_start_minutes': int(max_pre_start.strip()) if max_pre_start else 0,
+            'boot_lead_percentile': int(boot_percentile.strip()) if boot_percentile else 90,
+            'boot_profile_refresh_minutes': int(boot_refresh.strip()) if boot_refresh else 60,
+            'boot_history_days': int(boot_history_days.strip()) if boot_history_days else 14,
+            'max_workers': max(int(max_workers.strip()) if max_workers else 32, 1),
+            'deadline_margin_seconds': float(deadline_margin.strip()) if deadline_margin else 30,
+            'dispatch_reserve_seconds': float(dispatch_reserve.strip()) if dispatch_reserve else 30,
+            'continuation_function_id': continuation_function.strip() if continuation_function else None,
+            'validation_processes': int(validation_processes.strip()) if validation_processes else 0,
+            'validation_batch_size': max(int(validation_batch.strip()) if validation_batch else 200, 1),
+            'http_pool_size': max(int(http_pool_size.strip()) if http_pool_size else default_pool_size, 1),
+            'http_keep_alive': http_keep_alive.strip().casefold() != 'False'.casefold() if http_keep_alive else True,
+            'http_connect_timeout': float(http_connect_timeout.strip()) if http_connect_timeout else 10.0,
+            'http_read_timeout': float(http_read_timeout.strip()) if http_read_timeout else 60.0,
+        }
+
     def apply_configs(self, started_at):
         """
         Apply necessary configuration from OCI function configs
         """
         try:
             logging.getLogger().info("applying function configurations")
+            settings = runtime.get_settings(self._configs, self.parse_configs)
 
-            kill_switch = self.get_config('ActivateAutoStartStopProcess').strip()
-            auto_start_switch = self.get_config("ActivateAutoStart").strip()
-
-            self.activate_auto_start_stop = True if kill_switch.casefold() == 'True'.casefold() else False
-            self.activate_auto_start = True if auto_start_switch.casefold() == 'True'.casefold() else False
-            self.compartment_id = self.get_config('CompartmentId').strip()
-            self.table_name = self.get_config('TableName').strip()
+            self.activate_auto_start_stop = settings['activate_auto_start_stop']
+            self.activate_auto_start = settings['activate_auto_start']
+            self.compartment_id = settings['compartment_id']
+            self.table_name = settings['table_name']
             self.stats['started_at'] = started_at
-            self.minutes_delta = int(self.get_config('MinutesDelta').strip())
+            self.minutes_delta = settings['minutes_delta']
+            self.metadata_cache_ttl = settings['metadata_cache_ttl']
+            self.client.metadata_cache.set_ttl(self.metadata_cache_ttl)
+            self.client.metadata_cache.reset_stats()
+            self.client.configure_resilience(
+                hedge_percentile=settings['hedge_percentile'],
+                failure_threshold=settings['breaker_failure_threshold'],
+                reset_timeout=settings['breaker_reset_seconds']
+            )
+            self.client.configure_http(
+                pool_size=settings['http_pool_size'],
+                keep_alive=settings['http_keep_alive'],
+                connect_timeout=settings['http_connect_timeout'],
+                read_timeout=settings['http_read_timeout']
+            )
+            self.max_catch_up_minutes = settings['max_catch_up_minutes']
+
+            if settings['state_table_name']:
+                self.state_store = StateStore(self.client, self.compartment_id, settings['state_table_name'],
+                                              lease_timeout=settings['function_timeout_seconds'])
+
+            self.shard_count = settings['shard_count']
+            self.shard_index = settings['shard_index']
+            self.scan_parallelism = settings['scan_parallelism']
+            self.scan_partition_key = settings['scan_partition_key']
+            self.calendars = settings['exception_calendars']
+            self.calendar_tag_key = settings['calendar_tag_key']
+            self._config_profiles = settings['schedule_profiles']
+            self.profile_table_name = settings['profile_table_name']
+            self.prefetch_resources = settings['prefetch_resources']
+            self.set_report(settings)
+            self.function_timeout = settings['function_timeout_seconds']
+            if settings['run_history_table_name']:
+                self.run_history = RunHistory(
+                    self.client, self.compartment_id, settings['run_history_table_name'],
+                    ttl_days=settings['run_history_ttl_days'], batch_size=settings['run_history_batch_size']
+                )
+            trace_options = {'path': settings['trace_file_path']} if settings['trace_file_path'] else {}
+            tracer.configure(settings['trace_exporter'], **trace_options)
+            self.dispatch_settings = {
+                'workers': settings['dispatch_workers'],
+                'rate_per_second': settings['dispatch_rate_per_second'],
+                'spread_seconds': settings['dispatch_spread_seconds'],
+                'shape_limit': settings['max_concurrent_per_shape'],
+                'fault_domain_limit': settings['max_concurrent_per_fault_domain'],
+                'prioritize_stops': settings['prioritize_stops'],
+            }
+            self.dependency_settings = {
+                'group_tag_key': settings['dependency_group_tag_key'],
+                'depends_on_tag_key': settings['depends_on_tag_key'],
+                'wait_seconds': settings['dependency_wait_seconds'],
+                'poll_seconds': settings['dependency_poll_seconds'],
+            }
+            self.max_workers = settings['max_workers']
+            self.validation_processes = settings['validation_processes']
+            self.validation_batch_size = settings['validation_batch_size']
+            self.deadline_settings = {
+                'margin_seconds': settings['deadline_margin_seconds'],
+                'dispatch_reserve_seconds': settings['dispatch_reserve_seconds'],
+                'continuation_function_id': settings['continuation_function_id'],
+            }
+            self.boot_settings = {
+                'watch_seconds': settings['boot_watch_seconds'],
+                'max_pre_start_minutes': settings['max_pre_start_minutes'],
+                'percentile': settings['boot_lead_percentile'],
+                'refresh_minutes': settings['boot_profile_refresh_minutes'],
+                'history_days': settings['boot_history_days'],
+            }
 
         except Exception as err:
             logging.getLogger().exception(f"error occurred while applying configs '{err}'")
             logging.getLogger().info("terminating function execution")
             sys.exit(0)
 
-    def get_records(self):
+    def set_report(self, settings):
+        """
+        Run report streaming per instance entries to the report file and the optional report table
+        """
+        sinks = []
+        if settings['run_report_path'].casefold() != 'none':
+            sinks.append(NdjsonFileSink(settings['run_report_path']))
+        if settings['run_report_table_name']:
+            sinks.append(TableSink(self.client, self.compartment_id, settings['run_report_table_name']))
+        self.report = RunReport(self.run_id, sinks=sinks, top_failures=settings['run_report_top_failures'])
+
+    def mark_phase(self, name):
+        """
+        Records seconds spent since the previous phase ended under given phase name
+        """
+        now = time.monotonic()
+        self.phases[name] = round(now - self._phase_started, 3)
+        self._phase_started = now
+
+    def get_invocation_lateness(self, now):
+        """
+        Seconds the invocation started after its MinutesDelta tick
+        """
+        since_midnight = now - now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return round(since_midnight.total_seconds() % (self.minutes_delta * 60), 3)
+
+    def measure_lateness(self, instance: ComputeInstance, call_started, call_ended):
+        """
+        Splits the delay between scheduled time of the action and the moment the api accepted it into time
+        before the invocation started, time queued inside the run and api latency. None for unscheduled actions
+        """
+        scheduled_at = instance.get_scheduled_at()
+        if scheduled_at is None:
+            return None
+        components = {
+            'invocation_s': round((self.run_started_at - scheduled_at).total_seconds(), 3),
+            'queue_s': round(call_started - self._run_started, 3),
+            'api_s': round(call_ended - call_started, 3),
+        }
+        lateness = dict(components, total_s=round(sum(components.values()), 3),
+                        cause=max(components, key=components.get)[:-2])
+        metrics.observe('scheduler_action_lateness_seconds', max(lateness['total_s'], 0), buckets=LATENESS_BUCKETS,
+                        action=instance.get_action())
+        with self._lock:
+            self.action_lateness.append(lateness)
+        return lateness
+
+    def get_lateness_summary(self) -> dict:
         """
-        Queries the given database and returns list as a result set
-        :return: list
+        Distribution of action lateness and of each of its components, and how many actions each one dominated
         """
-        # need to handle pagination if records are lot more
+        with self._lock:
+            lateness = list(self.action_lateness)
+        summary = {'actions': len(lateness)}
+        if not lateness:
+            return summary
+        for part in ('total', 'invocation', 'queue', 'api'):
+            values = [entry[part + '_s'] for entry in lateness]
+            summary[part] = {'p50_s': get_percentile(values, 50), 'p95_s': get_percentile(values, 95),
+                             'max_s': max(values)}
+        summary['cause'] = {cause: sum(entry['cause'] == cause for entry in lateness)
+                            for cause in ('invocation', 'queue', 'api')}
+        return summary
+
+    def load_boot_profile(self, now):
+        """
+        Reloads learned boot durations from the run history when pre-start is on and the profile is stale
+        """
+        if not self.boot_settings['max_pre_start_minutes'] or self.run_history is None:
+            return
+        if not boot_profile.is_stale(self.boot_settings['refresh_minutes'] * 60):
+            return
+        try:
+            boot_profile.load(self.run_history.get_boot_samples(self.boot_settings['history_days'], now))
+        except Exception as err:
+            logging.getLogger().exception(f"error occurred while loading boot durations '{err}'")
+
+    def get_start_lead(self, ocid, shape):
+        """
+        How early the instance is started, learned boot duration rounded up to minutes and capped by
+        MaxPreStartMinutes. None when pre-start is off or nothing is learned for the instance or its shape
+        """
+        max_minutes = self.boot_settings['max_pre_start_minutes']
+        if not max_minutes:
+            return None
+        seconds = boot_profile.get_boot_seconds(ocid, shape, self.boot_settings['percentile'])
+        if not seconds:
+            return None
+        return datetime.timedelta(minutes=min(math.ceil(seconds / 60), max_minutes))
+
+    def add_boot_sample(self, instance: ComputeInstance, seconds):
+        """
+        Records a measured boot duration of a started instance
+        """
+        boot_profile.add(instance.ocid, instance.shape, seconds)
+        with self._lock:
+            self.boot_samples.append({'ocid': instance.ocid, 'shape': instance.shape, 'seconds': round(seconds, 1)})
+
+    def watch_boots(self) -> dict:
+        """
+        Waits up to BootWatchSeconds for started instances to reach RUNNING so that their boot durations are
+        learned, returns counts of watched and measured instances
+        """
+        started = [instance for instance in self.valid_instances_queue if instance.get_action() == 'start'
+                   and self._accepted.get(instance.ocid) is not None and instance.ocid not in self._confirmed]
+        confirmed = self.confirm_states(started, wait_seconds=self.boot_settings['watch_seconds'])
+        return {'watched': len(started), 'measured': len(confirmed)}
+
+    def get_boot_stats(self) -> dict:
+        """
+        Returns pre-started instances, boot durations measured in this run and the learned profile
+        """
+        durations = [sample['seconds'] for sample in self.boot_samples]
+        return {
+            'pre_started': len(self.pre_started),
+            'samples': len(durations),
+            'p90_s': get_percentile(durations, 90),
+            'profile': boot_profile.get_stats(),
+        }
+
+    def save_run_history(self, duration_s):
+        """
+        Queues the history record of this run, returns rows written and pending or None without history table
+        """
+        if self.run_history is None:
+            return None
         try:
-            logging.getLogger().info(f"fetching instance records from table '{self.table_name}'")
-            query = "SELECT * FROM {}".format(self.table_name)
-            response = client.query_database(compartment_id=self.compartment_id, query=query)
-            if response:
-                return response
+            shard = "{}/{}".format(self.shard_index, self.shard_count)
+            record = build_record(self.run_id, self.stats, self.phases, duration_s, shard=shard,
+                                  boot_samples=self.boot_samples)
+            return self.run_history.add(record)
+        except Exception as err:
+            logging.getLogger().exception(f"error occurred while saving the run history '{err}'")
             return None
+
+    def get_history_trends(self, days, now):
+        """
+        Per day run duration and throughput trends of the run history table
+        """
+        if self.run_history is None:
+            return {"message": "run history is not configured, set RunHistoryTableName"}
+        try:
+            return self.run_history.get_trends(days, now, timeout_s=self.function_timeout)
         except Exception as err:
-            logging.getLogger().exception(f"error occurred while fetching the records from the table '{err}'")
+            logging.getLogger().exception(f"error occurred while reading the run history '{err}'")
+            return {}
+
+    def set_timezone_context(self, tz_context):
+        """
+        setter for per run timezone context shared by all validators
+        """
+        self.tz_context = tz_context
+
+    def set_calendar_window(self, past, now):
+        """
+        Narrows exception calendars down to the periods overlapping the run window, returns active calendars.
+        with pre-start on the window reaches MaxPreStartMinutes ahead, starts are decided for events that far out
+        """
+        end = now + datetime.timedelta(minutes=self.boot_settings.get('max_pre_start_minutes') or 0)
+        self.calendar_window = self.calendars.get_window(past, end)
+        return self.calendar_window.get_active()
+
+    def load_profiles(self):
+        """
+        Loads schedule profiles of this run from config and profile table, table rows override config profiles.
+        every profile schedule is validated and compiled here once, instances referencing it hit the cache
+        """
+        table_profiles = {}
+        if self.profile_table_name:
+            try:
+                query = "SELECT profile_name, schedule FROM {}".format(self.profile_table_name)
+                for row in client.query_pages(compartment_id=self.compartment_id, query=query):
+                    table_profiles[row['profile_name']] = row['schedule']
+            except Exception as err:
+                logging.getLogger().exception(f"error occurred while loading profiles from the table '{err}'")
+                self.run_status = 'FAILURE'
+
+        self.profiles = self._config_profiles.merge(table_profiles)
+        for name, schedule in self.profiles.get_schedules().items():
+            validated_data = runtime.get_validated_schedule(schedule, self.tz_context, self.validate_tag_value)
+            state = validated_data.get('validation_state') if validated_data else None
+            logging.getLogger().info(f"schedule profile '{name}' compiled with state '{state}'")
+        return self.profiles.get_stats()
+
+    def prefetch(self):
+        """
+        Bulk lists the configured resource types and compartments into the metadata cache ahead of the scan,
+        one paginated list call replaces a get call per resource. returns resources listed per type
+        """
+        listed = {}
+        for resource_type, compartment_id in self.prefetch_resources:
+            resources = client.list_resources(resource_type, compartment_id)
+            listed[resource_type] = listed.get(resource_type, 0) + len(resources)
+        return listed
+
+    def set_deadline(self, started):
+        """
+        Time budget of the run on the monotonic clock, the run must be done DeadlineMarginSeconds before the
+        function timeout and pre-processing leaves DispatchReserveSeconds of it for the actions
+        """
+        self.deadline = started + self.function_timeout - self.deadline_settings['margin_seconds']
+        self.pre_processing_deadline = self.deadline - self.deadline_settings['dispatch_reserve_seconds']
+
+    def get_time_left(self):
+        """
+        seconds left before the deadline
+        """
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def get_checkpoint_key(self, chunk=None):
+        """
+        Each shard keeps its own checkpoint, instance ids are stored in chunks to stay under the row size limit
+        """
+        key = "checkpoint|{}/{}".format(self.shard_index, self.shard_count)
+        return key if chunk is None else "{}|{}".format(key, chunk)
+
+    def load_checkpoint(self, now):
+        """
+        Loads instances left unprocessed by the previous run, they are processed first and over the window
+        of that run as well. returns number of instances resumed
+        """
+        if self.state_store is None:
+            return 0
+        checkpoint = self.state_store.get(self.get_checkpoint_key())
+        if not checkpoint or not checkpoint.get('chunks'):
+            return 0
+        for chunk in range(checkpoint['chunks']):
+            self.resume_ids.update(self.state_store.get(self.get_checkpoint_key(chunk)) or [])
+        oldest = now - datetime.timedelta(minutes=self.max_catch_up_minutes)
+        self.resume_past = max(get_utc_from_str(checkpoint['window_start']), oldest)
+        logging.getLogger().info(f"resuming {len(self.resume_ids)} instances checkpointed by run "
+                                 f"'{checkpoint.get('run_id')}'")
+        return len(self.resume_ids)
+
+    def save_checkpoint(self, past):
+        """
+        Stores instances left unprocessed at the deadline for the next run, clears a resumed checkpoint when
+        nothing is left. the run fails when a checkpoint is needed but cannot be stored, so the high water mark
+        stays and the whole window is evaluated again. returns number of instances checkpointed
+        """
+        ids = sorted(set(self.checkpoint_ids))
+        if self.state_store is None:
+            if ids:
+                logging.getLogger().error(f"{len(ids)} instances are left unprocessed, set StateTableName to "
+                                          f"checkpoint them")
+                self.run_status = 'FAILURE'
+            return 0
+        if not ids and not self.resume_ids:
+            return 0
+
+        chunks = [ids[index:index + self._CHECKPOINT_CHUNK] for index in range(0, len(ids), self._CHECKPOINT_CHUNK)]
+        saved = all(self.state_store.put(self.get_checkpoint_key(chunk), value) for chunk, value in enumerate(chunks))
+        window_start = min(past, self.resume_past) if self.resume_past else past
+        saved = saved and self.state_store.put(self.get_checkpoint_key(), {
+            'run_id': self.run_id,
+            'window_start': window_start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'chunks': len(chunks),
+            'instances': len(ids),
+        })
+        if not saved:
+            logging.getLogger().error("unable to store the checkpoint")
+            self.run_status = 'FAILURE'
+            return 0
+        if ids:
+            logging.getLogger().info(f"{len(ids)} unprocessed instances checkpointed")
+        return len(ids)
+
+    def continue_run(self):
+        """
+        Invokes ContinuationFunctionId to resume the checkpoint right away instead of at the next schedule
+        """
+        function_id = self.deadline_settings['continuation_function_id']
+        if not function_id:
+            return False
+        return client.invoke_function(function_id, {'resume': self.run_id})
+
+    def get_record_priority(self, record, past, now):
+        """
+        lower is processed first, resumed instances whose stored start or stop time of day falls in their window,
+        then other instances due that way, then resumed instances and then the rest. stored times may be
+        outdated by tag changes, so this only orders the work
+        """
+        resumed = record.get('instance_id') in self.resume_ids
+        past = self.get_record_window_start(record, past)
+        span = int((now - past).total_seconds() // 60)
+        due = span >= 1439
+        first = past.hour * 60 + past.minute
+        for column in ('utc_start_time', 'utc_stop_time'):
+            value = record.get(column) or ''
+            if not due and len(value) >= 16:
+                due = (int(value[11:13]) * 60 + int(value[14:16]) - first) % 1440 <= span
+        if due:
+            return 0 if resumed else 1
+        return 2 if resumed else 3
+
+    def get_record_window_start(self, record, past):
+        """
+        window start of the record, resumed instances are evaluated from the window start of the checkpoint
+        """
+        if self.resume_past and self.resume_past < past and record.get('instance_id') in self.resume_ids:
+            return self.resume_past
+        return past
+
+    def process_records(self, past, now):
+        """
+        Pre-processes the table records on MaxWorkers threads, due ones first, until the pre-processing deadline.
+        with ValidationProcesses set the threads only read metadata and records are validated in worker processes.
+        records left over are checkpointed, a scan cut short fails the run. returns executor stats
+        """
+        executor = BoundedExecutor(workers=self.max_workers, deadline=self.pre_processing_deadline)
+        batcher = None
+        work = lambda record: self.pre_processing(record, self.get_record_window_start(record, past), now)
+        if self.validation_processes > 1:
+            self.validation_now = now
+            batcher = ValidationBatcher(
+                get_pool(self.validation_processes), self.run_id, self.get_validation_context(),
+                on_decisions=self.apply_decisions, on_error=self.fail_batch, batch_size=self.validation_batch_size
+            )
+            work = lambda record: self.fetch_for_validation(record, self.get_record_window_start(record, past),
+                                                            batcher)
+
+        stats = executor.run(
+            self.iter_records(),
+            priority=lambda record: self.get_record_priority(record, past, now),
+            work=work
+        )
+        if batcher is not None:
+            stats['validation'] = dict(batcher.close(deadline=self.pre_processing_deadline),
+                                       processes=self.validation_processes, refreshed=len(self._refresh))
+            self.checkpoint_ids.extend(record['instance_id'] for record, _, _, _ in batcher.pending)
+            # instances due with cached metadata are validated again here against fresh metadata
+            if self._refresh:
+                refresher = BoundedExecutor(workers=min(self.max_workers, len(self._refresh)),
+                                            deadline=self.pre_processing_deadline)
+                refresher.run(iter(self._refresh), priority=lambda item: 0,
+                              work=lambda item: self.refresh_record(item[0], item[1], now, item[2]))
+                self.checkpoint_ids.extend(record['instance_id'] for record, _, _ in refresher.pending)
+        if not executor.scan_complete:
             self.run_status = 'FAILURE'
+        self.checkpoint_ids.extend(record['instance_id'] for record in executor.pending)
+        return stats
+
+    def get_validation_context(self) -> dict:
+        """
+        Everything validate_record needs besides the record and its metadata, shipped once per run to the workers
+        """
+        return {
+            'configs': self._configs,
+            'activate_auto_start': self.activate_auto_start,
+            'profiles': self.profiles.get_schedules(),
+            'tz_now': self.tz_context.now,
+            'now': self.validation_now,
+            'calendars': self.calendars,
+            'calendar_window': self.calendar_window,
+            'calendar_tag_key': self.calendar_tag_key,
+            'log_level': logging.getLogger().getEffectiveLevel(),
+        }
+
+    @classmethod
+    def from_validation_context(cls, context: dict):
+        """
+        Processor of a validation worker process built from the run context, it makes no api calls
+        """
+        logging.getLogger().setLevel(context['log_level'])
+        runtime.prepare(context['configs'])
+        processor = cls(configs=context['configs'])
+        processor.activate_auto_start = context['activate_auto_start']
+        processor.profiles = ScheduleProfiles(context['profiles'])
+        processor.set_timezone_context(TimezoneContext(now=context['tz_now']))
+        processor.validation_now = context['now']
+        processor.calendars = context['calendars']
+        processor.calendar_window = context['calendar_window']
+        processor.calendar_tag_key = context['calendar_tag_key']
+        return processor
+
+    def fetch_for_validation(self, record: dict, past, batcher: ValidationBatcher):
+        """
+        Reads the metadata of the record and queues it for a validation worker
+        """
+        response = self.get_metadata(record)
+        if response is not None:
+            batcher.add((record, response, past, self.get_start_lead(record.get('instance_id'), response.get('shape'))))
 
-    def create_instances(self, record: dict):
+    def apply_decisions(self, batch: list, decisions: list):
         """
-        create database and live instance objects, depending on the tag information creates schedule
-        and attach to both the instances
+        Applies decisions of a validated batch, instances due with cached metadata are kept for a refresh
+        """
+        for (record, response, past, start_lead), decision in zip(batch, decisions):
+            if decision.get('refresh'):
+                with self._lock:
+                    self._refresh.append((record, past, start_lead))
+                continue
+            self.apply_decision(record, response, decision)
+
+    def fail_batch(self, batch: list, err):
+        """
+        Reports every record of a batch the validation workers could not decide
+        """
+        for record, _, _, _ in batch:
+            self.report.add('failed', record.get('instance_name'), ocid=record.get('instance_id'),
+                            stage='validation', error=str(err))
+        self.run_status = 'FAILURE'
+
+    def get_high_water_mark_key(self):
+        """
+        Each shard keeps its own high water mark
+        """
+        return "high_water_mark|{}/{}".format(self.shard_index, self.shard_count)
+
+    def get_window_start(self, now):
+        """
+        Start of the time window to evaluate. window begins right after the last successful run so that
+        a delayed or failed invocation does not miss events, capped by MaxCatchUpMinutes
+        """
+        default_past = now - datetime.timedelta(minutes=self.minutes_delta)
+        if self.state_store is None:
+            return default_past
+
+        high_water_mark = self.state_store.get(self.get_high_water_mark_key())
+        if not high_water_mark:
+            logging.getLogger().info("no high water mark found, using default time window")
+            return default_past
+
+        # the minute of the last run is already evaluated
+        past = get_utc_from_str(high_water_mark) + datetime.timedelta(minutes=1)
+        oldest = now - datetime.timedelta(minutes=self.max_catch_up_minutes)
+        if past < oldest:
+            logging.getLogger().info(f"last successful run is older than {self.max_catch_up_minutes} minutes, "
+                                     f"catch up is capped")
+            return oldest
+        return min(past, now)
+
+    def save_high_water_mark(self, now):
+        """
+        Persists the end of the evaluated window, only successful runs move the high water mark. a failed
+        action keeps the mark as well, so the event is evaluated again next run
+        """
+        if self.state_store is None:
+            return
+        if self.run_status != 'SUCCESS':
+            logging.getLogger().info("run did not succeed, high water mark is not updated")
+            return
+        failed_actions = self.report.get_failed_count(*self.ACTION_STAGES)
+        if failed_actions:
+            logging.getLogger().info(f"{failed_actions} actions failed, high water mark is not updated")
+            return
+        if self.state_store.put(self.get_high_water_mark_key(), now.strftime('%Y-%m-%dT%H:%M:%SZ')):
+            logging.getLogger().info(f"high water mark updated to '{now}'")
+        else:
+            logging.getLogger().error("unable to update the high water mark")
+
+    def is_in_shard(self, instance_id):
+        """
+        Stable hash based sharding so that sharded invocations split the table without overlap
+        """
+        return zlib.crc32(instance_id.encode()) % self.shard_count == self.shard_index
+
+    def get_lease_key(self, instance: ComputeInstance):
+        """
+        Lease key of the scheduled event of the instance
+        """
+        return self.state_store.get_lease_key(instance.ocid, instance.get_action(), instance.get_scheduled_at())
+
+    def claim_action(self, instance: ComputeInstance):
+        """
+        Claims the lease of scheduled event of the instance, only the owner of the lease takes the action.
+        claims always succeed when state table is not configured
+        """
+        if self.state_store is None:
+            return True
+        return self.state_store.claim(self.get_lease_key(instance), owner=self.run_id)
+
+    def is_action_completed(self, instance: ComputeInstance):
+        """
+        Whether the action of a lease owned by another invocation was accepted, an action still in flight may
+        yet fail
+        """
+        return self.state_store.get_lease_status(self.get_lease_key(instance)) == StateStore.COMPLETED
+
+    def complete_action(self, instance: ComputeInstance):
+        """
+        Marks the lease of an accepted action completed, later runs count the event as done
+        """
+        if self.state_store is not None:
+            self.state_store.complete(self.get_lease_key(instance), owner=self.run_id)
+
+    def release_action(self, instance: ComputeInstance):
+        """
+        Releases the lease of a failed action, so the event can be claimed and acted on again
+        """
+        if self.state_store is not None:
+            self.state_store.release(self.get_lease_key(instance))
+
+    def get_partition_queries(self):
+        """
+        Splits the table scan into key ranges on the last character of the partition key column.
+        ocids end with a random base32 character so the ranges are evenly loaded
+        """
+        query = "SELECT * FROM {}".format(self.table_name)
+        if self.scan_parallelism <= 1:
+            return {'all': query}
+
+        key_char = "substring({0}, length({0}) - 1, 1)".format(self.scan_partition_key)
+        bounds = [self._PARTITION_ALPHABET[len(self._PARTITION_ALPHABET) * i // self.scan_parallelism]
+                  for i in range(1, self.scan_parallelism)]
+        queries = {}
+        for index in range(self.scan_parallelism):
+            predicates = []
+            if index > 0:
+                predicates.append("{} >= '{}'".format(key_char, bounds[index - 1]))
+            if index < self.scan_parallelism - 1:
+                predicates.append("{} < '{}'".format(key_char, bounds[index]))
+            queries['partition-{}'.format(index)] = "{} WHERE {}".format(query, " AND ".join(predicates))
+        return queries
+
+    def iter_records(self):
+        """
+        Streams the records of the given table, partitions are scanned concurrently and records are
+        yielded as they arrive
         """
         try:
-            # preparation
-            instance_info = {'name': None, 'db_schedule': None, 'live_schedule': None}
-            self.instance_processed['instances'].append(instance_info)
-            # get live metadata
-            instance_name, instance_id = record['instance_name'], record['instance_id']
-            logging.getLogger().info(f"started processing instance '{instance_name}'")
-            response = client.get_instance_metadata(instance_id)
-            # get instance from db first
-            compute_instance = ComputeInstance(
-                schedule_tag=self.get_config('ScheduleTagKey'),
-                name=instance_name,
-                ocid=instance_id,
-                oracle_tag=response['oracle_tags'],
-                freeform_tags=response['freeform_tags']
+            logging.getLogger().info(f"scanning instance records from table '{self.table_name}' "
+                                     f"with parallelism {self.scan_parallelism}")
+            records = client.scan_partitions(
+                compartment_id=self.compartment_id,
+                queries=self.get_partition_queries(),
+                parallelism=self.scan_parallelism,
+                stats=self.scan_stats
             )
-            # is it having schedule attached
-            schedule_tag_value = compute_instance.get_tag_value()
-            self.instance_processed['count'] += 1
-            instance_info['name'] = compute_instance.name
-
-            validator = tag_value_validator.TagValueValidator(tag_value=schedule_tag_value)
-            validator.set_configs(self._configs)
-            validated_data = validator.run()
-            # create live schedule and bind
-            schedule = Schedule(auto_start_state=self.activate_auto_start)
-            live_schedule = schedule.update_schedule_from_tag(response['name'], response['state'], validated_data)
-            compute_instance.set_live_schedule(live_schedule)
-
-            if live_schedule:
-                instance_info['live_schedule'] = str(live_schedule)
-                # create db schedule and bind
-                validated_data = db_schedule_validator.DBScheduleValidator(db_record=record).run()
-                schedule = Schedule()
-                db_schedule = schedule.update_schedule_from_db(validated_data)
-                compute_instance.set_db_schedule(db_schedule)
-                instance_info['db_schedule'] = str(db_schedule)
-                return compute_instance
-            return compute_instance
+            try:
+                for record in records:
+                    if self.shard_count > 1 and not self.is_in_shard(record['instance_id']):
+                        continue
+                    yield record
+            finally:
+                records.close()
 
+            if any('error' in partition for partition in self.scan_stats.values()):
+                self.run_status = 'FAILURE'
         except Exception as err:
-            logging.getLogger().exception(f"error occurred while creating compute instance objects '{err}'")
+            logging.getLogger().exception(f"error occurred while scanning the records from the table '{err}'")
             self.run_status = 'FAILURE'
-            return False
 
-    def pre_processing(self, db_record, past, now):
+    def validate_tag_value(self, schedule_tag_value):
         """
-        Creates instances and their schedules
-        validated db instance and live instances and adds them to valid instance queue
-        to be processed later
+        Validates schedule tag value and returns the schedule data, runtime caches it per distinct tag value
         """
-        try:
-            compute_instance = self.create_instances(db_record)
+        validator = tag_value_validator.TagValueValidator(tag_value=schedule_tag_value, tz_context=self.tz_context)
+        validator.set_configs(self._configs)
+        with tracer.span('TagValueValidator.run', tag_value=schedule_tag_value):
+            return validator.run()
+
+    def get_metadata(self, record: dict, use_cache=True):
+        """
+        Reads live metadata of the resource of the record, failure is reported and None returned
+        """
+        resource_type = record.get('resource_type') or 'instance'
+        logging.getLogger().info(f"started processing {resource_type} '{record.get('instance_name')}'")
+        response = client.get_resource_metadata(resource_type, record.get('instance_id'), use_cache=use_cache)
+        if response:
+            return response
+        self.report.add('failed', record.get('instance_name'), ocid=record.get('instance_id'),
+                        stage='create_instances', error="unable to get resource metadata")
+        self.run_status = 'FAILURE'
+        return None
+
+    def new_instance(self, record: dict, response: dict) -> ComputeInstance:
+        """
+        instance object of the record with its live metadata, without schedules
+        """
+        return ComputeInstance(
+            schedule_tag=self.get_config('ScheduleTagKey'),
+            name=record.get('instance_name'),
+            ocid=record.get('instance_id'),
+            oracle_tag=response['oracle_tags'],
+            freeform_tags=response['freeform_tags'],
+            from_cache=response['from_cache'],
+            shape=response.get('shape'),
+            fault_domain=response.get('fault_domain'),
+            resource_type=record.get('resource_type') or 'instance'
+        )
+
+    def create_instances(self, record: dict, response: dict):
+        """
+        create database and live instance objects from the record and live metadata, depending on the tag
+        information creates schedule and attach to both the instances. returns instance, tag value and profile
+        """
+        compute_instance = self.new_instance(record, response)
+        # is it having schedule attached
+        schedule_tag_value = compute_instance.get_tag_value()
+        # tag may name a profile in place of a schedule
+        tag_value = schedule_tag_value
+        schedule_tag_value, profile = self.profiles.resolve(schedule_tag_value)
+
+        validated_data = runtime.get_validated_schedule(schedule_tag_value, self.tz_context, self.validate_tag_value)
+        # create live schedule and bind
+        schedule = Schedule(auto_start_state=self.activate_auto_start)
+        live_schedule = schedule.update_schedule_from_tag(response['name'], response['state'], validated_data)
+        compute_instance.set_live_schedule(live_schedule)
 
-            if compute_instance is False:
-                raise Exception(f"instance or schedule creation failed for '{db_record['instance_name']}'")
+        if live_schedule:
+            # create db schedule and bind
+            validated_data = db_schedule_validator.DBScheduleValidator(db_record=record).run()
+            schedule = Schedule()
+            db_schedule = schedule.update_schedule_from_db(validated_data)
+            compute_instance.set_db_schedule(db_schedule)
+        return compute_instance, tag_value, profile
 
+    def validate_record(self, record: dict, response: dict, past, now, start_lead=None) -> dict:
+        """
+        Decides the action for the record from its live metadata without any api call, so it can run in a
+        validation worker process. decision holds tag value and profile once the tag is read, the action with
+        its scheduled time, a suppressing calendar, an error with its stage or refresh when the metadata came
+        from cache and the instance is due
+        """
+        decision = {'action': None}
+        try:
+            with tracer.span('Processor.create_instances'):
+                compute_instance, decision['tag_value'], decision['profile'] = self.create_instances(record, response)
+        except Exception as err:
+            logging.getLogger().exception(f"error occurred while creating compute instance objects '{err}'")
+            return dict(decision, stage='create_instances', error=str(err))
+
+        try:
             db_schedule = compute_instance.get_db_schedule()
             live_schedule = compute_instance.get_live_schedule()
+            if not (db_schedule and live_schedule):
+                logging.getLogger().info("instance do not have either live instance or db schedule, cannot validate")
+                return decision
 
-            if db_schedule and live_schedule:
-                validator = schedule_change_validator.ScheduleChangeValidator(
-                    db_schedule=db_schedule,
-                    live_schedule=live_schedule,
-                    past=past,
-                    now=now,
-                )
+            validator = schedule_change_validator.ScheduleChangeValidator(
+                db_schedule=db_schedule,
+                live_schedule=live_schedule,
+                past=past,
+                now=now,
+                tz_context=self.tz_context,
+                calendar_window=self.calendar_window,
+                calendar_names=self.calendars.get_names(compute_instance.freeform_tags.get(self.calendar_tag_key)),
+                start_lead=start_lead,
+            )
+            if compute_instance.from_cache and validator.is_due():
+                # never act on a cached lifecycle state
+                return dict(decision, refresh=True)
+            with tracer.span('ScheduleChangeValidator.run'):
                 validated_instance = validator.run(compute_instance)
-                self.processed_instances.append(compute_instance.name)
-
-                # instance has passed all the tests
-                if validated_instance:
-                    logging.getLogger().info("instance is valid to take action")
-                    self.valid_instances_queue.append(validated_instance)
-                else:
-                    logging.getLogger().info("instance invalidated for taking action")
-            else:
-                logging.getLogger().info("instance do not have either live instance or db schedule, cannot validate")
 
+            if validator.suppressed_by:
+                decision['suppressed'] = {'action': validator.suppressed_action, 'calendar': validator.suppressed_by}
+            if validated_instance:
+                decision.update(action=validated_instance.get_action(),
+                                scheduled_at=validated_instance.get_scheduled_at(),
+                                pre_start=validator.is_pre_start)
+            return decision
         except Exception as err:
             logging.getLogger().exception(f"error occurred while preprocessing the instance '{err}'")
+            return dict(decision, stage='pre_processing', error=str(err))
+
+    def apply_decision(self, record: dict, response: dict, decision: dict):
+        """
+        Reports the decision of the record and adds the instance to valid instance queue when it has an action
+        """
+        instance_name, instance_id = record.get('instance_name'), record.get('instance_id')
+        if 'tag_value' in decision:
+            self.report.add('processed', instance_name, ocid=instance_id,
+                            resource_type=record.get('resource_type') or 'instance', tag_value=decision['tag_value'],
+                            profile=decision['profile'], state=response['state'])
+            metrics.inc('scheduler_instances_processed_total')
+        if decision.get('error'):
+            self.report.add('failed', instance_name, ocid=instance_id, stage=decision['stage'],
+                            error=decision['error'])
             self.run_status = 'FAILURE'
+            return
+        if decision.get('suppressed'):
+            self.report.add('suppressed', instance_name, **decision['suppressed'])
+        if not decision['action']:
+            logging.getLogger().info("instance invalidated for taking action")
+            return
+
+        with self._lock:
+            is_queued = instance_id in self._queued_ocids
+            self._queued_ocids.add(instance_id)
+            if decision['pre_start'] and decision['action'] == 'start':
+                self.pre_started.add(instance_id)
+        if is_queued:
+            logging.getLogger().info("instance is already queued, skipping duplicate record")
+            return
+        # validated instance is rebuilt from the metadata, schedules are not needed to take the action
+        compute_instance = self.new_instance(record, response)
+        compute_instance.set_action(decision['action'])
+        compute_instance.set_scheduled_at(decision['scheduled_at'])
+        compute_instance.trace_span = tracer.current_span()
+        logging.getLogger().info("instance is valid to take action")
+        self.valid_instances_queue.append(compute_instance)
+
+    def refresh_record(self, record: dict, past, now, start_lead=None):
+        """
+        Validates an instance due for action again with fresh metadata, never act on a cached lifecycle state
+        """
+        logging.getLogger().info("instance is due for action, refreshing cached metadata")
+        response = self.get_metadata(record, use_cache=False)
+        if response is not None:
+            self.apply_decision(record, response, self.validate_record(record, response, past, now, start_lead))
+
+    def pre_processing(self, db_record, past, now):
+        """
+        Creates instances and their schedules
+        validated db instance and live instances and adds them to valid instance queue
+        to be processed later
+        """
+        with tracer.span('instance', parent=self.trace_span, instance=db_record.get('instance_name')):
+            response = self.get_metadata(db_record)
+            if response is None:
+                return
+            start_lead = self.get_start_lead(db_record.get('instance_id'), response.get('shape'))
+            decision = self.validate_record(db_record, response, past, now, start_lead=start_lead)
+            if decision.get('refresh'):
+                self.refresh_record(db_record, past, now, start_lead)
+                return
+            self.apply_decision(db_record, response, decision)
+
+    def dispatch_actions(self):
+        """
+        Takes action on all valid instances through the dispatcher, returns the dispatch timeline. instances
+        with dependency groups are dispatched level by level, a level waits for the groups it requires to
+        reach their target state and instances whose required groups are not confirmed are not acted on
+        """
+        plan = DependencyPlan(self.valid_instances_queue, self.dependency_settings['group_tag_key'],
+                              self.dependency_settings['depends_on_tag_key'])
+        if plan.is_flat():
+            dispatcher = ActionDispatcher(deadline=self.deadline, **self.dispatch_settings)
+            stats = dispatcher.run(self.valid_instances_queue, self.take_action)
+            self.checkpoint_ids.extend(instance.ocid for instance in dispatcher.pending)
+            return stats
+
+        started = time.monotonic()
+        for instance, reason in plan.blocked:
+            self.block_action(instance, reason)
+
+        confirmed = set()
+        awaited = {key for level in plan.levels for instance in level for key in plan.get_requires(instance)}
+        stats = {'dispatched': 0, 'blocked': len(plan.blocked), 'levels': []}
+        for index, level in enumerate(plan.levels):
+            runnable = []
+            for instance in level:
+                missing = plan.get_requires(instance) - confirmed
+                if missing:
+                    groups = ", ".join(sorted(group for _, group in missing))
+                    self.block_action(instance, f"required dependency groups {groups} are not confirmed")
+                    stats['blocked'] += 1
+                else:
+                    runnable.append(instance)
+            if not runnable:
+                continue
+
+            dispatcher = ActionDispatcher(deadline=self.deadline, **self.dispatch_settings)
+            level_stats = dispatcher.run(runnable, self.take_action)
+            self.checkpoint_ids.extend(instance.ocid for instance in dispatcher.pending)
+            confirm_started = time.monotonic()
+            # only groups some later instance waits on are confirmed
+            done = self.confirm_states([instance for instance in runnable if plan.get_key(instance) in awaited],
+                                       wait_seconds=self.get_dependency_wait(len(plan.levels) - index - 1))
+            failed_keys = {plan.get_key(instance) for instance in level if instance.ocid not in done}
+            confirmed |= {plan.get_key(instance) for instance in level} - failed_keys
+            stats['dispatched'] += level_stats['dispatched']
+            stats['levels'].append({
+                'groups': sorted({str(plan.get_group(instance)) for instance in runnable}),
+                'dispatched': level_stats['dispatched'],
+                'duration_ms': level_stats['duration_ms'],
+                'confirmed': len(done),
+                'confirm_ms': round((time.monotonic() - confirm_started) * 1000, 2),
+            })
+
+        stats['duration_ms'] = round((time.monotonic() - started) * 1000, 2)
+        return stats
+
+    def block_action(self, instance: ComputeInstance, reason):
+        """
+        Reports an action held back by its dependencies, the run fails so the event is retried next run
+        """
+        logging.getLogger().error(f"not taking action on '{instance.name}', {reason}")
+        self.report.add('failed', instance.name, ocid=instance.ocid, stage='dependencies',
+                        action=instance.get_action(), error=reason)
+        self.run_status = 'FAILURE'
+
+    def get_dependency_wait(self, levels_left):
+        """
+        Seconds a level waits for its groups, DependencyWaitSeconds when set. by default the time left before
+        the deadline is shared with the levels still to be dispatched, 180 seconds when the run has no deadline
+        """
+        if self.dependency_settings['wait_seconds'] is not None:
+            return self.dependency_settings['wait_seconds']
+        time_left = self.get_time_left()
+        if time_left is None:
+            return 180
+        return max(time_left / (levels_left + 1), 0)
+
+    def confirm_states(self, instances, wait_seconds=None) -> dict:
+        """
+        Polls accepted actions until their instances reach the target state or the wait, the dependency wait
+        by default, is over. returns ocids of instances confirmed in their target state and seconds from the
+        accepted action to the confirmation, boot durations of started instances are learned from these
+        """
+        targets = {'start': 'RUNNING', 'stop': 'STOPPED'}
+        pending = {instance.ocid: instance for instance in instances if instance.ocid in self._accepted}
+        confirmed = {}
+        clock = get_clock()
+        wait_seconds = self.get_dependency_wait(0) if wait_seconds is None else wait_seconds
+        time_left = self.get_time_left()
+        if time_left is not None:
+            wait_seconds = max(min(wait_seconds, time_left), 0)
+        deadline = clock.monotonic() + wait_seconds
+
+        def poll(instance):
+            response = client.get_resource_metadata(instance.resource_type, instance.ocid, use_cache=False)
+            return instance.ocid, bool(response) and response['state'] == targets.get(instance.get_action())
+
+        with ThreadPoolExecutor(max_workers=max(min(self.dispatch_settings['workers'], len(pending)), 1)) as pool:
+            while pending:
+                for ocid, is_confirmed in pool.map(poll, list(pending.values())):
+                    if not is_confirmed:
+                        continue
+                    instance = pending.pop(ocid)
+                    accepted_at = self._accepted.get(ocid)
+                    confirmed[ocid] = clock.monotonic() - accepted_at if accepted_at is not None else None
+                    self._confirmed.add(ocid)
+                    if confirmed[ocid] is not None and instance.get_action() == 'start':
+                        self.add_boot_sample(instance, confirmed[ocid])
+                if not pending or clock.monotonic() >= deadline:
+                    break
+                clock.sleep(self.dependency_settings['poll_seconds'])
+
+        if pending:
+            logging.getLogger().error(f"{len(pending)} instances did not reach their target state in time")
+        return confirmed
 
     def take_action(self, instance: ComputeInstance):
         """
         A method to take action on given instance based on its action attribute
         """
-        try:
-            logging.getLogger().info(f"started taking action on instance '{instance.name}'")
-
-            if instance.get_action() == 'start':
-                started_info = {'name': None, 'started_at': None}
-                instance.start()
-                self.instance_started['count'] += 1
-                started_info['name'] = instance.name
-                started_info['started_at'] = datetime.datetime.now(tz=pytz.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-                self.instance_started['instances'].append(started_info)
-
-            if instance.get_action() == 'stop':
-                stopped_info = {'name': None, 'stopped_at': None}
-                instance.stop()
-                self.instance_stopped['count'] += 1
-                stopped_info['name'] = instance.name
-                stopped_info['stopped_at'] = datetime.datetime.now(tz=pytz.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
-                self.instance_stopped['instances'].append(stopped_info)
+        action = instance.get_action()
+        claimed = False
+        with tracer.span('take_action', parent=instance.trace_span, instance=instance.name, action=action):
+            try:
+                logging.getLogger().info(f"started taking action on instance '{instance.name}'")
 
-        except Exception as err:
-            logging.getLogger().exception(f"error occurred while taking action on instance '{err}'")
-            self.run_status = 'FAILURE'
+                claimed = self.claim_action(instance)
+                if not claimed:
+                    # another invocation owns the action, dependents wait for its state once it was accepted
+                    if self.is_action_completed(instance):
+                        with self._lock:
+                            self._accepted[instance.ocid] = None
+                    self.report.add('deduplicated', instance.name, ocid=instance.ocid, action=action)
+                    return
+
+                if instance.get_action() == 'start':
+                    call_started = time.monotonic()
+                    if not instance.start():
+                        self.fail_action(instance, "start request was not accepted")
+                        return
+                    lateness = self.measure_lateness(instance, call_started, time.monotonic())
+                    self.complete_action(instance)
+                    with self._lock:
+                        self._accepted[instance.ocid] = get_clock().monotonic()
+                    metrics.inc('scheduler_actions_total', action='start')
+                    self.report.add('started', instance.name, ocid=instance.ocid,
+                                    started_at=utc_now().strftime('%Y-%m-%dT%H:%M:%SZ'), lateness=lateness,
+                                    pre_start=instance.ocid in self.pre_started)
+
+                if instance.get_action() == 'stop':
+                    call_started = time.monotonic()
+                    if not instance.stop():
+                        self.fail_action(instance, "stop request was not accepted")
+                        return
+                    lateness = self.measure_lateness(instance, call_started, time.monotonic())
+                    self.complete_action(instance)
+                    with self._lock:
+                        self._accepted[instance.ocid] = get_clock().monotonic()
+                    metrics.inc('scheduler_actions_total', action='stop')
+                    self.report.add('stopped', instance.name, ocid=instance.ocid,
+                                    stopped_at=utc_now().strftime('%Y-%m-%dT%H:%M:%SZ'), lateness=lateness)
+
+            except Exception as err:
+                logging.getLogger().exception(f"error occurred while taking action on instance '{err}'")
+                self.fail_action(instance, str(err), release=claimed)
+
+    def fail_action(self, instance: ComputeInstance, error, release=True):
+        """
+        Reports a failed action and releases its lease, the run fails so the event is retried next run
+        """
+        self.report.add('failed', instance.name, ocid=instance.ocid, stage='take_action',
+                        action=instance.get_action(), error=error)
+        self.run_status = 'FAILURE'
+        if release:
+            self.release_action(instance)
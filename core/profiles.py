@@ -0,0 +1,75 @@
+"""
+Named schedule profiles, a schedule tag may hold a profile name such as office-ist in place of a schedule.
+profiles come from the ScheduleProfiles config and an optional profile table, they are loaded once per run
+and resolved with a dict lookup. expected table schema -
+CREATE TABLE <ProfileTableName> (profile_name STRING, schedule STRING, PRIMARY KEY(profile_name))
+"""
+
+import json
+import logging
+import threading
+
+
+class ScheduleProfiles:
+    """
+    Profile name to schedule tag value mapping, names are case insensitive
+    """
+
+    def __init__(self, profiles: dict = None):
+        """
+        Initialization
+        """
+        self._profiles = {name.strip().casefold(): schedule.strip() for name, schedule in (profiles or {}).items()}
+        self._lock = threading.Lock()
+        self._resolved = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    @classmethod
+    def from_config(cls, profiles_json):
+        """
+        Builds profiles from ScheduleProfiles config, eg - {"office-ist": "08To18|12345|IST"}
+        """
+        if not profiles_json:
+            return cls()
+        try:
+            profiles = json.loads(profiles_json)
+            return cls({name: schedule for name, schedule in profiles.items() if isinstance(schedule, str)})
+        except (ValueError, AttributeError) as err:
+            logging.getLogger().error(f"schedule profiles config is not a valid json object '{err}'")
+            return cls()
+
+    def merge(self, profiles: dict):
+        """
+        Returns new profiles with given profiles overriding the existing ones
+        """
+        merged = ScheduleProfiles()
+        merged._profiles = dict(self._profiles)
+        merged._profiles.update(ScheduleProfiles(profiles)._profiles)
+        return merged
+
+    def get_schedules(self) -> dict:
+        """
+        getter for profile name and schedule mapping
+        """
+        return dict(self._profiles)
+
+    def resolve(self, tag_value):
+        """
+        Returns tuple of schedule tag value and profile name, tag value is returned as is when it is not a profile
+        """
+        if not tag_value:
+            return tag_value, None
+        schedule = self._profiles.get(tag_value.strip().casefold())
+        if schedule is None:
+            return tag_value, None
+        with self._lock:
+            self._resolved += 1
+        return schedule, tag_value.strip()
+
+    def get_stats(self) -> dict:
+        """
+        Returns number of profiles and tag values resolved through them
+        """
+        return {'profiles': len(self._profiles), 'resolved': self._resolved}
@@ -0,0 +1,207 @@
+"""
+Hedged requests and per endpoint circuit breakers for OCI api calls
+"""
+
+import time
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected by an open circuit breaker
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails fast once an endpoint keeps failing, a single probe call is allowed after the reset timeout
+    """
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        """
+        Initialization
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._stats = {'rejected': 0, 'opened': 0}
+
+    def get_state(self):
+        """
+        getter for breaker state
+        """
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        checks whether a call may go through
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                logging.getLogger().info(f"circuit breaker '{self.name}' is half open, probing the endpoint")
+                self._state = self.HALF_OPEN
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        """
+        successful call closes the breaker
+        """
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.getLogger().info(f"circuit breaker '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """
+        failed call opens the breaker once threshold is reached or when the probe call fails
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats['opened'] += 1
+                    logging.getLogger().error(f"circuit breaker '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def reset_stats(self):
+        """
+        reset per run counters, breaker state is kept
+        """
+        with self._lock:
+            self._stats = {'rejected': 0, 'opened': 0}
+
+    def get_stats(self):
+        """
+        returns per run counters along with the current state
+        """
+        with self._lock:
+            return dict(self._stats, state=self._state)
+
+
+class HedgedCaller:
+    """
+    Sends a second attempt of an idempotent call when the first one is slower than the given
+    percentile of recently observed latencies, whichever attempt finishes first wins
+    """
+
+    def __init__(self, name, percentile=95, min_samples=20, window=500, max_workers=64):
+        """
+        Initialization, percentile of zero disables hedging
+        """
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'hedge-{name}')
+        # attempts submitted to the executor and not finished yet
+        self._in_flight = 0
+        self._stats = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'saturated': 0}
+
+    def get_delay(self):
+        """
+        hedge delay in seconds, None until enough latencies are observed
+        """
+        with self._lock:
+            if not self.percentile or len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, len(ordered) * self.percentile // 100)]
+
+    def _timed(self, fn, *args, **kwargs):
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return result
+
+    def _attempt(self, running: threading.Event, fn, args, kwargs):
+        running.set()
+        try:
+            return self._timed(fn, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _submit(self, fn, args, kwargs):
+        """
+        submits an attempt unless every executor thread is busy, returns the future and an event set once the
+        attempt runs, None when the executor is saturated
+        """
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                self._stats['saturated'] += 1
+                return None
+            self._in_flight += 1
+        running = threading.Event()
+        return self._executor.submit(self._attempt, running, fn, args, kwargs), running
+
+    def call(self, fn, *args, **kwargs):
+        """
+        calls fn with hedging, exception is raised only if every attempt fails. the hedge delay counts from the
+        moment the primary attempt runs, and no hedge is sent while the executor is saturated
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+        delay = self.get_delay()
+        submitted = self._submit(fn, args, kwargs) if delay is not None else None
+        if submitted is None:
+            return self._timed(fn, *args, **kwargs)
+
+        primary, running = submitted
+        running.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        submitted = self._submit(fn, args, kwargs)
+        if submitted is None:
+            return primary.result()
+        with self._lock:
+            self._stats['hedges'] += 1
+        hedge, _ = submitted
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [attempt for attempt in done if attempt.exception() is None]
+            if succeeded:
+                if succeeded[0] is hedge:
+                    with self._lock:
+                        self._stats['hedge_wins'] += 1
+                return succeeded[0].result()
+            if not pending:
+                # both attempts failed, raise the error of the primary call
+                return primary.result()
+
+    def reset_stats(self):
+        """
+        reset per run counters, observed latencies are kept
+        """
+        with self._lock:
+            self._stats = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'saturated': 0}
+
+    def get_stats(self):
+        """
+        returns per run counters along with current hedge delay
+        """
+        delay = self.get_delay()
+        with self._lock:
+            return dict(self._stats, delay_ms=round(delay * 1000, 2) if delay is not None else None)
@@ -0,0 +1,175 @@
+"""
+Run history persisted in an OCI NoSQL table, one compact row per run with timings, counts, throttles and
+lateness. rows are buffered in the warm container and written in batches, rows that fail to write are retried
+with the next batch. retention is left to row ttl. expected table schema -
+CREATE TABLE <RunHistoryTableName> (run_id STRING, day STRING, started_at STRING, status STRING,
+duration_s DOUBLE, processed INTEGER, record JSON, PRIMARY KEY(run_id)) USING TTL 30 DAYS
+"""
+
+import datetime
+import logging
+import threading
+import collections
+
+from utils.metrics import get_percentile
+
+# rows waiting to be written, kept across invocations of a warm container
+_pending = collections.deque(maxlen=500)
+_pending_lock = threading.Lock()
+# keeps a row well under the row size limit
+_MAX_BOOT_SAMPLES = 500
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def build_record(run_id, stats: dict, phases: dict, duration_s, shard=None, boot_samples=()) -> dict:
+    """
+    Compact history record of a run from its response stats and the boot durations measured in the run
+    """
+    run_metrics = stats.get('metrics', {})
+    instances = stats.get('instances', {})
+    counts = instances.get('counts', {})
+    dispatch = stats.get('dispatch', {})
+    processed = counts.get('processed', 0)
+    return {
+        'run_id': run_id,
+        'started_at': stats.get('started_at'),
+        'day': (stats.get('started_at') or '')[:10],
+        'shard': shard,
+        'status': stats.get('status'),
+        'duration_s': round(duration_s, 3),
+        'throughput': round(processed / duration_s, 2) if duration_s else None,
+        'phases': phases,
+        'counts': counts,
+        'throttles': sum(value for key, value in run_metrics.items()
+                         if key.startswith('scheduler_api_throttles_total')),
+        'api_errors': sum(value for key, value in run_metrics.items()
+                          if key.startswith('scheduler_api_errors_total')),
+        'lateness': stats.get('lateness', {}),
+        'dispatch_ms': dispatch.get('duration_ms'),
+        'window': stats.get('window'),
+        'boot': list(boot_samples)[:_MAX_BOOT_SAMPLES],
+    }
+
+
+def summarize_runs(rows: list, timeout_s=None) -> dict:
+    """
+    Per day run count, p50 and p95 duration and throughput of history rows, oldest day first. the p95 slope is
+    fitted by least squares over days, a positive slope is projected onto the function timeout
+    """
+    days = collections.defaultdict(list)
+    for row in rows:
+        days[row['day']].append(row)
+
+    trends = []
+    for day in sorted(days):
+        durations = [row['duration_s'] for row in days[day] if row.get('duration_s') is not None]
+        throughputs = [row['record'].get('throughput') for row in days[day]
+                       if (row.get('record') or {}).get('throughput') is not None]
+        trends.append({
+            'day': day,
+            'runs': len(days[day]),
+            'failed': sum(row.get('status') != 'SUCCESS' for row in days[day]),
+            'p50_duration_s': _round(get_percentile(durations, 50)),
+            'p95_duration_s': _round(get_percentile(durations, 95)),
+            'max_duration_s': _round(max(durations) if durations else None),
+            'p50_throughput': _round(get_percentile(throughputs, 50)),
+            'processed': sum(row.get('processed') or 0 for row in days[day]),
+        })
+
+    points = [(index, day['p95_duration_s']) for index, day in enumerate(trends) if day['p95_duration_s'] is not None]
+    slope = None
+    if len(points) > 1:
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        spread = sum((x - mean_x) ** 2 for x, _ in points)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+    summary = {'days': trends, 'p95_slope_s_per_day': round(slope, 3) if slope is not None else None}
+    if timeout_s and points:
+        latest = points[-1][1]
+        summary['timeout_s'] = timeout_s
+        summary['p95_headroom_s'] = round(timeout_s - latest, 3)
+        summary['days_to_timeout'] = round((timeout_s - latest) / slope, 1) if slope and slope > 0 else None
+    return summary
+
+
+class RunHistory:
+    """
+    Batched writer and trend reader of the run history table
+    """
+
+    def __init__(self, client, compartment_id, table_name, ttl_days=30, batch_size=1):
+        """
+        Initialization
+        """
+        self.client = client
+        self.compartment_id = compartment_id
+        self.table_name = table_name
+        self.ttl_days = ttl_days
+        self.batch_size = batch_size
+
+    def add(self, record: dict) -> dict:
+        """
+        Queues the record of a run and writes the batch once it is full, returns rows written and pending
+        """
+        with _pending_lock:
+            _pending.append(record)
+            if len(_pending) < self.batch_size:
+                return {'written': 0, 'pending': len(_pending)}
+        return self.flush()
+
+    def flush(self) -> dict:
+        """
+        Writes all pending rows, failed rows stay pending for the next batch
+        """
+        with _pending_lock:
+            batch = list(_pending)
+            _pending.clear()
+
+        written, failed = 0, []
+        for record in batch:
+            row = {
+                'run_id': record['run_id'],
+                'day': record['day'],
+                'started_at': record['started_at'],
+                'status': record['status'],
+                'duration_s': record['duration_s'],
+                'processed': record['counts'].get('processed', 0),
+                'record': record,
+            }
+            if self.client.update_table_row(self.compartment_id, self.table_name, row, ttl=self.ttl_days):
+                written += 1
+            else:
+                failed.append(record)
+
+        with _pending_lock:
+            _pending.extendleft(reversed(failed))
+            pending = len(_pending)
+        if failed:
+            logging.getLogger().error(f"{len(failed)} run history rows could not be written, retrying next run")
+        return {'written': written, 'pending': pending}
+
+    def get_boot_samples(self, days, now: datetime.datetime) -> list:
+        """
+        Boot durations recorded by runs of the last given days
+        """
+        since = (now - datetime.timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        query = "SELECT h.record.boot AS boot FROM {} h WHERE h.day >= '{}'".format(self.table_name, since)
+        samples = []
+        for row in self.client.query_pages(compartment_id=self.compartment_id, query=query):
+            samples.extend(row.get('boot') or [])
+        return samples
+
+    def get_trends(self, days, now: datetime.datetime, timeout_s=None) -> dict:
+        """
+        Reads the history of last given days and returns per day duration and throughput trends
+        """
+        since = (now - datetime.timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        query = "SELECT day, status, duration_s, processed, record FROM {} WHERE day >= '{}'".format(
+            self.table_name, since
+        )
+        rows = list(self.client.query_pages(compartment_id=self.compartment_id, query=query))
+        return dict(summarize_runs(rows, timeout_s=timeout_s), since=since, runs=len(rows))
@@ -0,0 +1,94 @@
+"""
+Runtime context kept at module level so that warm containers of the function reuse the work done by
+previous invocations. everything derived from function configs is dropped when the configs change
+"""
+
+import json
+import hashlib
+import logging
+import threading
+
+from core.oci_client import client
+from utils.date_util import get_timezones, TIMEZONES
+
+
+class RuntimeContext:
+    """
+    State shared across invocations of a warm container
+    """
+
+    def __init__(self):
+        """
+        Initialization
+        """
+        self.client = client
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._settings = None
+        self._schedule_cache = {}
+        self._schedule_cache_day = None
+        self.invocations = 0
+
+    @staticmethod
+    def get_fingerprint(configs: dict) -> str:
+        """
+        Stable fingerprint of function configs
+        """
+        return hashlib.sha256(json.dumps(configs, sort_keys=True).encode()).hexdigest()
+
+    def prepare(self, configs: dict) -> bool:
+        """
+        Called at the start of every invocation, drops config derived state if configs have changed.
+        returns True if the context was (re)built
+        """
+        fingerprint = self.get_fingerprint(configs)
+        with self._lock:
+            self.invocations += 1
+            if fingerprint == self._fingerprint:
+                logging.getLogger().info(f"reusing warm runtime context, invocation {self.invocations}")
+                return False
+
+            logging.getLogger().info("function configs changed, rebuilding runtime context")
+            self._fingerprint = fingerprint
+            self._settings = None
+            self._schedule_cache = {}
+            self._schedule_cache_day = None
+            return True
+
+    def warm_up(self):
+        """
+        Prebuilds sdk clients and timezone index
+        """
+        self.client.warm_up()
+        get_timezones()
+        logging.getLogger().info("runtime context warmed up")
+
+    def get_settings(self, configs: dict, parser):
+        """
+        Returns parsed configs, parser is called only once per config fingerprint
+        """
+        with self._lock:
+            if self._settings is None:
+                self._settings = parser(configs)
+            return self._settings
+
+    def get_validated_schedule(self, tag_value, tz_context, validate):
+        """
+        Returns validated schedule data for given tag value. validated data holds utc times of today, so cache
+        is scoped to the local dates of the supported timezones and cleared when any of them rolls over
+        """
+        schedule_day = tuple(tz_context.get_local_date(timezone) for timezone in TIMEZONES.values())
+        with self._lock:
+            if schedule_day != self._schedule_cache_day:
+                self._schedule_cache = {}
+                self._schedule_cache_day = schedule_day
+            if tag_value in self._schedule_cache:
+                return self._schedule_cache[tag_value]
+
+        validated_data = validate(tag_value)
+        with self._lock:
+            self._schedule_cache[tag_value] = validated_data
+        return validated_data
+
+
+runtime = RuntimeContext()
@@ -21,6 +21,7 @@ class Schedule:
         self._stop_time = None
         self._weekdays = None
         self._timezone = None
+        self._compiled = None
 
     def __repr__(self):
         """
@@ -100,6 +101,18 @@ class Schedule:
         """
         self._stop_time = stop_time
 
+    def get_compiled(self):
+        """
+        getter for compiled minute of week schedule, only schedules from tags are compiled
+        """
+        return self._compiled
+
+    def set_compiled(self, compiled):
+        """
+        setter for compiled minute of week schedule
+        """
+        self._compiled = compiled
+
     def update_schedule_from_tag(self, name, state, validated_data: dict):
         """
         populates instance vars from schedule tag value
@@ -117,6 +130,7 @@ class Schedule:
                 self.set_start_time(start_time)
 
                 self.set_stop_time(validated_data['schedule']['stop'])
+                self.set_compiled(validated_data['schedule'].get('compiled'))
                 logging.getLogger().info(f"schedule created from tag successfully with value '{self}'")
                 return self
             return None
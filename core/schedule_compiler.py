@@ -0,0 +1,99 @@
+"""
+Schedule compiler, turns the windows and weekdays of a schedule into minute of week bitmaps of start and stop
+events in local time of the schedule. compiled schedules are deduplicated so instances sharing a schedule share
+the bitmaps, and checking a time window for events is a shift and a mask on an int
+"""
+
+import datetime
+import functools
+
+import pytz
+
+from utils.tz_context import get_local_time
+
+DAY_MINUTES = 1440
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+
+class CompiledSchedule:
+    """
+    Start and stop event bitmaps of a schedule, bit n is minute n of the week starting monday 00:00 local time
+    """
+
+    def __init__(self, timezone, start_bits: int, stop_bits: int):
+        """
+        Initialization, bitmaps are stored twice over so that windows wrapping the end of week need no special case
+        """
+        self.timezone = timezone
+        self.tz_info = pytz.timezone(timezone)
+        self._bitmaps = {
+            'start': start_bits | (start_bits << WEEK_MINUTES),
+            'stop': stop_bits | (stop_bits << WEEK_MINUTES),
+        }
+
+    def __repr__(self):
+        return "CompiledSchedule({}, starts={}, stops={})".format(
+            self.timezone, bin(self.get_bitmap('start')).count('1'), bin(self.get_bitmap('stop')).count('1')
+        )
+
+    def get_bitmap(self, kind) -> int:
+        """
+        getter for the minute of week bitmap of start or stop events
+        """
+        return self._bitmaps[kind] & ((1 << WEEK_MINUTES) - 1)
+
+    def has_event(self, kind, minute_of_week) -> bool:
+        """
+        single bit test, whether the start or stop event is scheduled at given local minute of week
+        """
+        return bool(self._bitmaps[kind] >> (minute_of_week % WEEK_MINUTES) & 1)
+
+    def get_last_event(self, kind, local_window) -> datetime.datetime:
+        """
+        Returns utc time of the latest start or stop event inside the local window, None if there is no event.
+        local window comes from TimezoneContext.get_local_window of the timezone of this schedule
+        """
+        first, last, utc_offset, past, now = local_window
+        length = min(last - first + 1, WEEK_MINUTES)
+        if length <= 0:
+            return None
+        events = (self._bitmaps[kind] >> (first % WEEK_MINUTES)) & ((1 << length) - 1)
+
+        while events:
+            position = events.bit_length() - 1
+            local_time = get_local_time(first + position)
+            if utc_offset is not None:
+                # offset is the same all through the window
+                return (local_time - utc_offset).replace(tzinfo=pytz.utc)
+            # DST transition near the window, wall clock times are resolved the same way as schedule hours
+            event = self.tz_info.normalize(self.tz_info.localize(local_time)).astimezone(pytz.utc)
+            if past <= event <= now:
+                return event
+            events &= ~(1 << position)
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_schedule(windows: tuple, weekdays: tuple, timezone: str) -> CompiledSchedule:
+    """
+    Compiles schedule windows for the weekdays. windows are tuples of start and stop minute of day, either may
+    be None. a stop earlier than or equal to its start ends the window on the following day, eg - 22To06
+    """
+    start_bits = stop_bits = 0
+    for weekday in weekdays:
+        day_start = (weekday - 1) * DAY_MINUTES
+        for start, stop in windows:
+            if start is not None:
+                start_bits |= 1 << (day_start + start)
+            if stop is not None:
+                overnight = start is not None and stop <= start
+                stop_bits |= 1 << ((day_start + stop + (DAY_MINUTES if overnight else 0)) % WEEK_MINUTES)
+    return CompiledSchedule(timezone, start_bits, stop_bits)
+
+
+def get_compiler_stats() -> dict:
+    """
+    distinct compiled schedules held by the process and how often they were shared
+    """
+    info = compile_schedule.cache_info()
+    return {'distinct': info.currsize, 'shared': info.hits, 'compiled': info.misses}
@@ -0,0 +1,144 @@
+"""
+A key value store on top of an OCI NoSQL table used to share scheduler state between invocations.
+expected table schema -
+CREATE TABLE <StateTableName> (state_key STRING, state_value JSON, PRIMARY KEY(state_key))
+"""
+
+import logging
+
+from utils.clock import utc_now
+from utils.date_util import get_utc_from_str
+
+
+class StateStore:
+    """
+    Scheduler state persisted in NoSQL table, leases are claimed with conditional writes
+    """
+
+    _LEASE_TTL_DAYS = 1
+    IN_FLIGHT = 'in_flight'
+    COMPLETED = 'completed'
+
+    def __init__(self, client, compartment_id, table_name, lease_timeout=300):
+        """
+        Initialization, lease timeout is seconds after which a lease still in flight is taken over
+        """
+        self.client = client
+        self.compartment_id = compartment_id
+        self.table_name = table_name
+        self.lease_timeout = lease_timeout
+
+    def get(self, state_key):
+        """
+        Returns the stored value of given key or None
+        """
+        row = self.client.get_table_row(self.compartment_id, self.table_name, {'state_key': state_key})
+        if row:
+            return row.get('state_value')
+        return None
+
+    def put(self, state_key, state_value, ttl=None) -> bool:
+        """
+        Stores given value against the key unconditionally
+        """
+        result = self.client.update_table_row(
+            self.compartment_id, self.table_name, {'state_key': state_key, 'state_value': state_value}, ttl=ttl
+        )
+        return bool(result and result['version'])
+
+    @staticmethod
+    def get_lease_key(instance_id, action, scheduled_at):
+        """
+        Lease key is unique per instance per scheduled event
+        """
+        scheduled = scheduled_at.strftime('%Y-%m-%dT%H:%M:%SZ') if scheduled_at else 'unscheduled'
+        return "lease|{}|{}|{}".format(instance_id, action, scheduled)
+
+    def claim(self, lease_key, owner) -> bool:
+        """
+        Claims the lease with a conditional write, only one invocation owns a lease at a time. a lease still
+        in flight after the lease timeout belongs to an invocation that died, it is taken over.
+        returns True if lease is acquired by the given owner
+        """
+        value = {
+            'state_key': lease_key,
+            'state_value': {
+                'owner': owner,
+                'status': self.IN_FLIGHT,
+                'claimed_at': utc_now().strftime('%Y-%m-%dT%H:%M:%SZ')
+            }
+        }
+        result = self.client.update_table_row(
+            self.compartment_id, self.table_name, value, option='IF_ABSENT', ttl=self._LEASE_TTL_DAYS
+        )
+        if not result:
+            # state table is unreachable, duplicate action is cheaper than a missed one
+            logging.getLogger().error(f"unable to claim lease '{lease_key}', proceeding without lease")
+            return True
+
+        if result['version'] is None:
+            row, version = self.client.get_versioned_table_row(self.compartment_id, self.table_name,
+                                                               {'state_key': lease_key})
+            lease = row.get('state_value') or {}
+            if version and lease.get('status') == self.IN_FLIGHT and self.is_stale(lease):
+                return self.take_over(lease_key, value, version, lease.get('owner'))
+            logging.getLogger().info(f"lease '{lease_key}' is already claimed by another invocation")
+            return False
+
+        logging.getLogger().info(f"lease '{lease_key}' claimed")
+        return True
+
+    def take_over(self, lease_key, value: dict, version, stale_owner) -> bool:
+        """
+        Replaces a stale lease only if it is unchanged since it was read, of the invocations finding the same stale
+        lease only one wins
+        """
+        result = self.client.update_table_row(
+            self.compartment_id, self.table_name, value, ttl=self._LEASE_TTL_DAYS, if_version=version
+        )
+        if result and result['version']:
+            logging.getLogger().info(f"lease '{lease_key}' of '{stale_owner}' was stale, taken over")
+            return True
+        logging.getLogger().info(f"stale lease '{lease_key}' was taken over or completed by another invocation")
+        return False
+
+    def is_stale(self, lease: dict) -> bool:
+        """
+        lease is stale when its owner would have been stopped by the function timeout by now
+        """
+        claimed_at = lease.get('claimed_at')
+        if not claimed_at:
+            return False
+        age = utc_now() - get_utc_from_str(claimed_at)
+        return age.total_seconds() > self.lease_timeout
+
+    def get_lease_status(self, lease_key):
+        """
+        Returns status of the lease, IN_FLIGHT or COMPLETED. leases written before statuses were recorded
+        are taken as completed, None when there is no lease
+        """
+        lease = self.get(lease_key)
+        if lease is None:
+            return None
+        return lease.get('status', self.COMPLETED)
+
+    def complete(self, lease_key, owner) -> bool:
+        """
+        Records that the action of the lease was accepted, the lease is kept so the event is not acted on again
+        """
+        state_value = {'owner': owner, 'status': self.COMPLETED,
+                       'completed_at': utc_now().strftime('%Y-%m-%dT%H:%M:%SZ')}
+        if self.put(lease_key, state_value, ttl=self._LEASE_TTL_DAYS):
+            return True
+        logging.getLogger().error(f"unable to complete lease '{lease_key}'")
+        return False
+
+    def release(self, lease_key) -> bool:
+        """
+        Deletes the lease of an action that failed, so the next run can claim the event again
+        """
+        if self.client.delete_table_row(self.compartment_id, self.table_name, {'state_key': lease_key}):
+            logging.getLogger().info(f"lease '{lease_key}' released")
+            return True
+        logging.getLogger().error(f"unable to release lease '{lease_key}'")
+        return False
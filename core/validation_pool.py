@@ -0,0 +1,181 @@
+"""
+Process pool validation for CPU bound fleets. tag parsing, timezone resolution and schedule comparison are pure
+python and hold the GIL, so with ValidationProcesses set the scan threads only fetch metadata and ship records with
+their metadata in batches to worker processes, which return a decision per record. api calls, the run report and
+the action queue stay in the parent. meant for the standalone runner on multi core hosts
+"""
+
+import time
+import pickle
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# pool is kept for the life of the process, so workers keep their schedule caches between runs
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+# validation processor of the current run inside a worker process
+_worker = {'key': None, 'processor': None}
+
+
+def get_pool(processes) -> ProcessPoolExecutor:
+    """
+    Shared process pool of given size, the pool is rebuilt when the size changes
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawned workers do not inherit locks held by threads of the parent
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+            _pool_size = processes
+        return _pool
+
+
+def _ready():
+    return True
+
+
+def warm_up_pool(processes) -> ProcessPoolExecutor:
+    """
+    Starts the worker processes ahead of the first run, spawning them takes a second or so
+    """
+    pool = get_pool(processes)
+    for future in [pool.submit(_ready) for _ in range(processes)]:
+        future.result()
+    return pool
+
+
+def shutdown_pool():
+    """
+    Stops the worker processes of the shared pool
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool, _pool_size = None, 0
+
+
+def validate_batch(context_key, context: bytes, items: list):
+    """
+    Worker entry point, decides the action of every (record, metadata, window start, start lead) item of the batch.
+    the pickled run context is loaded once per run. returns decisions in item order and cpu seconds spent
+    """
+    started = time.process_time()
+    if _worker['key'] != context_key:
+        # imported here, the processor module imports this one
+        from core.processor import Processor
+        _worker['processor'] = Processor.from_validation_context(pickle.loads(context))
+        _worker['key'] = context_key
+    processor = _worker['processor']
+    now = processor.validation_now
+    decisions = [processor.validate_record(record, response, past, now, start_lead=start_lead)
+                 for record, response, past, start_lead in items]
+    return decisions, time.process_time() - started
+
+
+class ValidationBatcher:
+    """
+    Collects items from the scan threads and submits them to the pool in batches, decisions of a batch are handed
+    to on_decisions and a failed batch to on_error from the result thread of the pool
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor, context_key, context: dict, on_decisions, on_error,
+                 batch_size=200):
+        """
+        Initialization, context is pickled once and shipped as bytes with every batch
+        """
+        self.pool = pool
+        self.context_key = context_key
+        self.context = pickle.dumps(context)
+        self.on_decisions = on_decisions
+        self.on_error = on_error
+        self.batch_size = batch_size
+        self.pending = []
+        self._items = []
+        # batches submitted and not yet handed to the callbacks
+        self._batches = {}
+        self._sequence = itertools.count()
+        self._abandoned = False
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._apply_lock = threading.Lock()
+        self._stats = {'batches': 0, 'items': 0, 'failed_batches': 0, 'worker_cpu_s': 0.0}
+
+    def add(self, item):
+        """
+        Queues an item, a full batch is submitted by the calling thread
+        """
+        with self._lock:
+            self._items.append(item)
+            if len(self._items) < self.batch_size:
+                return
+            batch, self._items = self._items, []
+        self._submit(batch)
+
+    def _submit(self, batch):
+        with self._lock:
+            key = next(self._sequence)
+            self._batches[key] = batch
+            self._stats['batches'] += 1
+            self._stats['items'] += len(batch)
+        try:
+            future = self.pool.submit(validate_batch, self.context_key, self.context, batch)
+        except Exception as err:
+            # a broken pool refuses new batches
+            self._done(key, batch, None, error=err)
+            return
+        future.add_done_callback(lambda done: self._done(key, batch, done))
+
+    def _done(self, key, batch, future, error=None):
+        with self._apply_lock:
+            try:
+                if self._abandoned:
+                    # close gave up waiting, the items of the batch are left pending
+                    return
+                if error is not None:
+                    raise error
+                decisions, cpu_seconds = future.result()
+                with self._lock:
+                    self._stats['worker_cpu_s'] += cpu_seconds
+                self.on_decisions(batch, decisions)
+            except Exception as err:
+                logging.getLogger().exception(f"error occurred while validating a batch in the worker pool '{err}'")
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+                self.on_error(batch, err)
+            finally:
+                # close waits for the callbacks as well, futures are done before their callbacks run
+                with self._condition:
+                    if not self._abandoned:
+                        self._batches.pop(key, None)
+                    self._condition.notify_all()
+
+    def close(self, deadline=None) -> dict:
+        """
+        Submits the last batch and waits for all batches until the deadline on the monotonic clock. items of
+        batches not decided by then are left in pending and their decisions are dropped when they arrive.
+        returns batch counts and cpu seconds spent in workers
+        """
+        with self._lock:
+            batch, self._items = self._items, []
+        if batch:
+            self._submit(batch)
+        with self._condition:
+            while self._batches:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+        with self._apply_lock, self._lock:
+            self._abandoned = True
+            self.pending = [item for batch in self._batches.values() for item in batch]
+            stats = dict(self._stats, worker_cpu_s=round(self._stats['worker_cpu_s'], 3), pending=len(self.pending))
+        if self.pending:
+            logging.getLogger().error(f"{len(self.pending)} records were not validated by the deadline")
+        return stats
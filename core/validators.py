@@ -6,11 +6,11 @@ Created on 18-09-2021
 """
 
 import re
-import datetime
 import logging
 
 import pytz
 
+from utils.clock import utc_now
 from utils.date_util import time_in_range
 from utils.patterns import TAG_VALUE_PATTERNS
 
@@ -168,7 +168,7 @@ class ScheduleValidator:
         """
         # check if schedule weekday matches current weekday
         live_timezone = self.live_schedule.get_timezone()
-        today = datetime.datetime.now(tz=pytz.timezone(live_timezone)).weekday() + 1
+        today = utc_now().astimezone(pytz.timezone(live_timezone)).weekday() + 1
         db_weekdays = [int(x) for x in self.db_schedule.get_weekdays()]
         live_weekdays = [int(x) for x in self.live_schedule.get_weekdays()]
 
@@ -5,53 +5,128 @@ Created on 01-09-2021
 """
 
 import io
+import os
 import time
+import argparse
 import json
-import threading
 import datetime
 
-import pytz
 from fdk import response
 
 from core.processor import Processor
+from core.runtime import runtime
+from core.schedule_compiler import get_compiler_stats
+from core.validation_pool import warm_up_pool
+from utils.clock import utc_now as utc_now_of_clock
+from utils.tz_context import TimezoneContext
+from utils.tracing import tracer
+from utils.metrics import metrics, DURATION_BUCKETS
+from utils.profiling import get_profile_options, profile_call
 import logging
 
 
+def read_payload(data: io.BytesIO = None) -> dict:
+    """
+    parse optional json request body of the invocation
+    """
+    try:
+        body = data.getvalue() if data else b''
+        payload = json.loads(body) if body else {}
+        return payload if isinstance(payload, dict) else {}
+    except (ValueError, AttributeError):
+        logging.getLogger().info("request body is not a json object, ignoring it")
+        return {}
+
+
 def handler(ctx=None, data: io.BytesIO = None):
     """
     main handler for oci function
     """
+    configs = dict(ctx.Config())
+    payload = read_payload(data)
+    profile_options = get_profile_options(
+        payload.get('profile') or configs.get('ProfileHandler'),
+        top_n=payload.get('profile_top_n') or configs.get('ProfileTopN'),
+        dump_path=configs.get('ProfileDumpPath')
+    )
+
+    if profile_options is None:
+        result = execute(configs, payload)
+    else:
+        result, summary = profile_call(execute, configs, payload, **profile_options)
+        result = dict(result, profile=summary)
+
+    return response.Response(
+        ctx,
+        response_data=json.dumps(result),
+        headers={"Content-Type": "application/json"}
+    )
+
+
+def execute(configs: dict, payload: dict) -> dict:
+    """
+    runs the scheduler and returns the response body
+    """
     start = time.monotonic()
+    run_snapshot = metrics.snapshot()
     # check current execution utc time
-    naive_now = datetime.datetime.utcnow()
-    utc_now = naive_now.replace(tzinfo=pytz.utc)
+    utc_now = utc_now_of_clock()
     logging.getLogger().info("oci instance scheduler started at '{}'".format(utc_now))
-    process = Processor(configs=dict(ctx.Config()))
+    rebuilt = runtime.prepare(configs)
+
+    if payload.get('warmup'):
+        # prebuild everything for the next scheduled invocation and return right away
+        runtime.warm_up()
+        process = Processor(configs=configs)
+        process.apply_configs(started_at=utc_now.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        if process.validation_processes > 1:
+            warm_up_pool(process.validation_processes)
+        return {"message": "resource command scheduler warmed up", "rebuilt": rebuilt}
+
+    process = Processor(configs=configs)
     process.apply_configs(started_at=utc_now.strftime('%Y-%m-%dT%H:%M:%SZ'))
 
+    if payload.get('history_trends'):
+        try:
+            days = int(payload['history_trends'])
+        except (TypeError, ValueError):
+            logging.getLogger().info(f"invalid history trends days '{payload['history_trends']}'")
+            return {"message": "history_trends must be a whole number of days"}
+        return process.get_history_trends(days, utc_now)
+
+    process.set_deadline(start)
+    process.set_timezone_context(TimezoneContext(now=utc_now))
+    process.mark_phase('configs')
+
     if process.activate_auto_start_stop:
+        process.trace_span = tracer.start_span('run', run_id=process.run_id)
 
         try:
             logging.getLogger().info("pre-processing started")
-            delta = datetime.timedelta(minutes=process.minutes_delta)
             rounded_utc_now = utc_now.replace(second=0, microsecond=0)
-            past_utc = rounded_utc_now - delta
-
-            records = process.get_records()
-            if records:
-                pre_processing_threads = []
-                for record in records:
-                    # fetch all data from table and validate all instances parallelly
-                    worker = threading.Thread(target=process.pre_processing, args=(record, past_utc, rounded_utc_now))
-                    worker.start()
-                    pre_processing_threads.append(worker)
-
-                for th in pre_processing_threads:
-                    th.join()
-
+            past_utc = process.get_window_start(rounded_utc_now)
+            process.stats['window'] = {
+                'start': past_utc.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'end': rounded_utc_now.strftime('%Y-%m-%dT%H:%M:%SZ')
+            }
+            process.stats['active_calendars'] = process.set_calendar_window(past_utc, rounded_utc_now)
+            process.load_profiles()
+            process.load_boot_profile(utc_now)
+            if process.prefetch_resources:
+                process.stats['prefetched'] = process.prefetch()
+            process.stats['lateness'] = {'invocation_s': process.get_invocation_lateness(utc_now)}
+            resumed = process.load_checkpoint(rounded_utc_now)
+            if resumed:
+                process.stats['resumed'] = resumed
+            process.mark_phase('setup')
+
+            # validate instances on a bounded pool as the records arrive from the table, due ones first
+            process.stats['execution'] = process.process_records(past_utc, rounded_utc_now)
+            if process.stats['execution']['scanned']:
                 logging.getLogger().info("pre-processing completed")
             else:
                 logging.getLogger().info("no instances to process at this moment")
+            process.mark_phase('pre_processing')
 
             instance_queue = process.valid_instances_queue
 
@@ -59,45 +134,104 @@ def handler(ctx=None, data: io.BytesIO = None):
                 # we have instance to start/stop
                 logging.getLogger().info("found {} instances in the job queue to take action".format(len(instance_queue)))
 
-                action_threads = []
-
-                for instance in instance_queue:
-                    worker = threading.Thread(target=process.take_action, args=(instance,))
-                    worker.start()
-                    action_threads.append(worker)
-
-                for th in action_threads:
-                    th.join()
+                process.stats['dispatch'] = process.dispatch_actions()
+                if process.boot_settings['watch_seconds']:
+                    process.stats['dispatch']['boot_watch'] = process.watch_boots()
             else:
                 logging.getLogger().info("no instance to start/stop at this moment")
+            process.mark_phase('dispatch')
+
+            checkpointed = process.save_checkpoint(past_utc)
+            if checkpointed:
+                process.stats['checkpoint'] = {'instances': checkpointed, 'continued': process.continue_run()}
+            process.save_high_water_mark(rounded_utc_now)
+            process.mark_phase('high_water_mark')
 
         except Exception as err:
             logging.getLogger().exception("error occurred in function execution with value '{}'".format(err))
             process.run_status = 'FAILURE'
 
+        tracer.end_span(process.trace_span)
         end = time.monotonic()
         duration = datetime.timedelta(seconds=end - start)
         logging.getLogger().info("oci instance scheduler finished in '{}'".format(duration))
         process.stats['execution_time'] = str(duration.seconds) + " " + "seconds"
-        process.stats['instance_processed'] = process.instance_processed
-        process.stats['instance_started'] = process.instance_started
-        process.stats['instance_stopped'] = process.instance_stopped
+        process.stats['status'] = process.run_status
+        metrics.inc('scheduler_runs_total', status=process.run_status)
+        metrics.observe('scheduler_run_duration_seconds', end - start, buckets=DURATION_BUCKETS)
+        # per instance entries are in the run report, the response only carries the summary
+        process.report.close()
+        process.stats['instances'] = process.report.get_summary()
+        process.stats['metadata_cache'] = process.client.metadata_cache.get_stats()
+        process.stats['warm_start'] = not rebuilt
+        process.stats['scan'] = process.scan_stats
+        process.stats['resilience'] = process.client.get_resilience_stats()
+        process.stats['http_pool'] = process.client.get_http_stats()
+        process.stats['schedules'] = dict(get_compiler_stats(), profiles=process.profiles.get_stats())
+        if tracer.enabled:
+            slowest_instances = tracer.get_slowest('instance')
+            process.stats['tracing'] = dict(tracer.flush(), slowest_instances=slowest_instances)
+        process.stats['metrics'] = metrics.delta(run_snapshot)
+        process.stats['phases'] = process.phases
+        process.stats.setdefault('lateness', {}).update(process.get_lateness_summary())
+        process.stats['boot'] = process.get_boot_stats()
+        run_history = process.save_run_history(end - start)
+        if run_history is not None:
+            process.stats['run_history'] = run_history
 
         logging.getLogger().info(process.stats)
-        return response.Response(
-            ctx,
-            response_data=json.dumps(process.stats),
-            headers={"Content-Type": "application/json"}
-        )
+        return process.stats
     else:
         logging.getLogger().info(process.enable_msg)
-        return response.Response(
-            ctx,
-            response_data=json.dumps(process.enable_msg),
-            headers={"Content-Type": "application/json"}
-        )
+        return process.enable_msg
+
+
+class StandaloneContext:
+    """
+    Stand-in for the fdk context when running outside OCI Functions, configs are read from environment
+    """
+
+    def Config(self):
+        return dict(os.environ)
+
+
+def run_standalone():
+    """
+    standalone runner, runs once or every --interval seconds and exposes metrics over http or a textfile
+    """
+    parser = argparse.ArgumentParser(description="oci instance state scheduler")
+    parser.add_argument('--interval', type=int, default=0, help="seconds between runs, runs once if not set")
+    parser.add_argument('--metrics-port', type=int, help="serve prometheus metrics on this port")
+    parser.add_argument('--metrics-textfile', help="write prometheus metrics to this file after every run")
+    parser.add_argument('--trends', type=int, help="print run duration trends of the last given days and exit")
+    parser.add_argument('--validation-processes', type=int,
+                        help="validate records in this many worker processes, overrides ValidationProcesses")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    ctx = StandaloneContext()
+    if args.trends:
+        print(json.dumps(execute(dict(ctx.Config()), {'history_trends': args.trends}), indent=2))
+        return
+
+    overrides = {}
+    if args.validation_processes:
+        overrides['ValidationProcesses'] = str(args.validation_processes)
+        warm_up_pool(args.validation_processes)
+
+    while True:
+        result = execute(dict(ctx.Config(), **overrides), {})
+        print(json.dumps(result))
+        if args.metrics_textfile:
+            metrics.write_textfile(args.metrics_textfile)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
 
 
 if __name__ == '__main__':
     # driver function
-    handler()
+    run_standalone()
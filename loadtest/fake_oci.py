@@ -0,0 +1,262 @@
+"""
+Local stand-ins for the OCI Compute and NoSQL sdk clients used by OCIClient. latency, throttling and
+errors are injected from configurable distributions so the scheduler can be exercised at scale
+"""
+
+import re
+import math
+import time
+import random
+import hashlib
+import threading
+import collections
+from types import SimpleNamespace
+
+from oci.exceptions import ServiceError
+
+from utils.clock import get_clock
+
+PARTITION_PREDICATE = re.compile(r"substring\((?P<column>\w+), length\(\w+\) - 1, 1\) (?P<op>>=|<) '(?P<bound>.)'")
+
+
+class LatencyModel:
+    """
+    Log normal latency distribution described by its median and p99 in milliseconds
+    """
+
+    def __init__(self, median_ms=50, p99_ms=400, time_scale=1.0):
+        """
+        Initialization, time scale shrinks or stretches every sampled latency
+        """
+        self.median_ms = median_ms
+        self.sigma = math.log(max(p99_ms, median_ms) / median_ms) / 2.326 if median_ms else 0
+        self.time_scale = time_scale
+
+    def sample(self) -> float:
+        """
+        sampled latency in seconds
+        """
+        if not self.median_ms:
+            return 0.0
+        return self.median_ms * math.exp(random.gauss(0, self.sigma)) / 1000 * self.time_scale
+
+
+class FaultInjector:
+    """
+    Applies latency, throttling and errors to every fake api call and records served latencies
+    """
+
+    def __init__(self, latency: LatencyModel = None, throttle_rate=0.0, error_rate=0.0):
+        """
+        Initialization
+        """
+        self.latency = latency or LatencyModel()
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.calls = collections.defaultdict(list)
+        self.faults = collections.Counter()
+
+    def apply(self, operation):
+        """
+        sleeps for sampled latency and raises injected faults
+        """
+        latency = self.latency.sample()
+        time.sleep(latency)
+        with self._lock:
+            self.calls[operation].append(latency)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.faults[(operation, 429)] += 1
+            raise ServiceError(429, 'TooManyRequests', {}, f"{operation} throttled by fake backend")
+        if roll < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.faults[(operation, 503)] += 1
+            raise ServiceError(503, 'ServiceUnavailable', {}, f"{operation} failed in fake backend")
+
+    def get_stats(self) -> dict:
+        """
+        call count and latency percentiles per operation
+        """
+        with self._lock:
+            calls = {operation: sorted(latencies) for operation, latencies in self.calls.items()}
+            faults = dict(self.faults)
+
+        def percentile(values, pct):
+            return round(values[min(len(values) - 1, len(values) * pct // 100)] * 1000, 2) if values else None
+
+        return {
+            'operations': {
+                operation: {'calls': len(latencies), 'p50_ms': percentile(latencies, 50),
+                            'p99_ms': percentile(latencies, 99)}
+                for operation, latencies in calls.items()
+            },
+            'faults': {"{}:{}".format(operation, status): total for (operation, status), total in faults.items()},
+        }
+
+
+def response(data, status=200, headers=None, next_page=None):
+    """
+    minimal shape of oci.response.Response
+    """
+    return SimpleNamespace(
+        status=status, data=data, headers=headers or {}, next_page=next_page, has_next_page=next_page is not None
+    )
+
+
+class FakeComputeClient:
+    """
+    Stand-in of oci.core.ComputeClient for get_instance and instance_action
+    """
+
+    def __init__(self, instances: dict, faults: FaultInjector, boot_seconds=0.0, page_size=100):
+        """
+        Initialization, instances are keyed by ocid
+        """
+        self.instances = instances
+        self.faults = faults
+        self.boot_seconds = boot_seconds
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self.actions = []
+
+    def _settle(self, instance):
+        # transitional states finish once their deadline passes
+        ready_at = instance.get('ready_at')
+        if ready_at and get_clock().monotonic() >= ready_at:
+            instance['lifecycle_state'] = instance.pop('target_state')
+            instance.pop('ready_at')
+
+    @staticmethod
+    def _model(instance):
+        etag = hashlib.md5("{}|{}".format(instance['lifecycle_state'], instance['freeform_tags']).encode())
+        return SimpleNamespace(**{key: value for key, value in instance.items()
+                                  if key not in ('ready_at', 'target_state')}), {'etag': etag.hexdigest()}
+
+    def get_instance(self, instance_id, **kwargs):
+        self.faults.apply('get_instance')
+        with self._lock:
+            instance = self.instances.get(instance_id)
+            if instance is None:
+                raise ServiceError(404, 'NotAuthorizedOrNotFound', {}, f"instance '{instance_id}' not found")
+            self._settle(instance)
+            data, headers = self._model(instance)
+        return response(data, headers=headers)
+
+    def list_instances(self, compartment_id, page=None, **kwargs):
+        self.faults.apply('list_instances')
+        offset = int(page) if page else 0
+        with self._lock:
+            ocids = sorted(self.instances)[offset:offset + self.page_size]
+            items = []
+            for ocid in ocids:
+                self._settle(self.instances[ocid])
+                items.append(self._model(self.instances[ocid])[0])
+        next_page = str(offset + self.page_size) if offset + self.page_size < len(self.instances) else None
+        return response(items, next_page=next_page)
+
+    def instance_action(self, instance_id, action, **kwargs):
+        self.faults.apply('instance_action')
+        with self._lock:
+            instance = self.instances[instance_id]
+            self._settle(instance)
+            transitional, target = ('STARTING', 'RUNNING') if action == 'START' else ('STOPPING', 'STOPPED')
+            if self.boot_seconds:
+                instance['lifecycle_state'] = transitional
+                instance['target_state'] = target
+                instance['ready_at'] = get_clock().monotonic() + self.boot_seconds
+            else:
+                instance['lifecycle_state'] = target
+            self.actions.append((get_clock().now(), instance_id, action))
+            data, headers = self._model(instance)
+        return response(data, headers=headers)
+
+
+class FakeNosqlClient:
+    """
+    Stand-in of oci.nosql.NosqlClient for paginated query and single row reads, conditional writes and deletes
+    """
+
+    def __init__(self, tables: dict, faults: FaultInjector, page_size=100):
+        """
+        Initialization, tables are dict of table name and list of rows
+        """
+        self.tables = tables
+        self.faults = faults
+        self.page_size = page_size
+        self._rows = {}
+        self._row_versions = {}
+        self._versions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _matches(row, statement):
+        # only the key range predicates generated by partitioned scans are understood
+        for predicate in PARTITION_PREDICATE.finditer(statement):
+            key_char = str(row.get(predicate.group('column'), ''))[-1:]
+            bound = predicate.group('bound')
+            if predicate.group('op') == '>=' and not key_char >= bound:
+                return False
+            if predicate.group('op') == '<' and not key_char < bound:
+                return False
+        return True
+
+    def query(self, query_details, page=None, **kwargs):
+        self.faults.apply('query')
+        statement = query_details.statement
+        table_name = statement.split('FROM')[1].split()[0]
+        rows = [row for row in self.tables.get(table_name, []) if self._matches(row, statement)]
+        offset = int(page) if page else 0
+        items = rows[offset:offset + self.page_size]
+        next_page = str(offset + self.page_size) if offset + self.page_size < len(rows) else None
+        usage = SimpleNamespace(read_units_consumed=len(items), write_units_consumed=0)
+        return response(SimpleNamespace(items=items, usage=usage), next_page=next_page)
+
+    def get_row(self, table_name_or_id, key, **kwargs):
+        self.faults.apply('get_row')
+        with self._lock:
+            row = self._rows.get((table_name_or_id, tuple(key)))
+            version = self._row_versions.get((table_name_or_id, tuple(key)))
+        return response(SimpleNamespace(value=dict(row) if row else None), headers={'etag': version})
+
+    def update_row(self, table_name_or_id, update_row_details, if_match=None, **kwargs):
+        self.faults.apply('update_row')
+        value = update_row_details.value
+        primary_key = next(iter(value))
+        key = (table_name_or_id, ("{}:{}".format(primary_key, value[primary_key]),))
+        with self._lock:
+            exists = key in self._rows
+            if (update_row_details.option == 'IF_ABSENT' and exists) or \
+                    (update_row_details.option == 'IF_PRESENT' and not exists) or \
+                    (if_match is not None and self._row_versions.get(key) != if_match):
+                return response(SimpleNamespace(version=None, existing_value=self._rows.get(key)))
+            self._versions += 1
+            self._rows[key] = dict(value)
+            self._row_versions[key] = str(self._versions)
+            return response(SimpleNamespace(version=str(self._versions), existing_value=None))
+
+    def delete_row(self, table_name_or_id, key, **kwargs):
+        self.faults.apply('delete_row')
+        with self._lock:
+            deleted = self._rows.pop((table_name_or_id, tuple(key)), None) is not None
+            self._row_versions.pop((table_name_or_id, tuple(key)), None)
+        return response(SimpleNamespace(success=deleted, existing_value=None))
+
+
+class FakeComputeManagementClient(FakeComputeClient):
+    """
+    Stand-in of oci.core.ComputeManagementClient for instance pools, pools are keyed by ocid like instances
+    """
+
+    def get_instance_pool(self, instance_pool_id, **kwargs):
+        return self.get_instance(instance_pool_id, **kwargs)
+
+    def list_instance_pools(self, compartment_id, page=None, **kwargs):
+        return self.list_instances(compartment_id, page=page, **kwargs)
+
+    def start_instance_pool(self, instance_pool_id, **kwargs):
+        return self.instance_action(instance_pool_id, 'START', **kwargs)
+
+    def stop_instance_pool(self, instance_pool_id, **kwargs):
+        return self.instance_action(instance_pool_id, 'STOP', **kwargs)
@@ -0,0 +1,72 @@
+"""
+Synthetic fleet generator, builds compute instance models and matching schedule table records.
+a configurable share of the fleet is due for start or stop in the current hour
+"""
+
+import random
+import string
+
+from utils.date_util import TIMEZONES
+from utils.tz_context import TimezoneContext
+
+SHAPES = ('VM.Standard.E4.Flex', 'VM.Standard3.Flex', 'VM.Standard.A1.Flex', 'BM.Standard.E4.128')
+FAULT_DOMAINS = ('FAULT-DOMAIN-1', 'FAULT-DOMAIN-2', 'FAULT-DOMAIN-3')
+
+
+def generate_ocid(rng) -> str:
+    """
+    instance ocid with random base32 suffix like the real ones
+    """
+    suffix = ''.join(rng.choice(string.ascii_lowercase + '234567') for _ in range(60))
+    return "ocid1.instance.oc1.fake.{}".format(suffix)
+
+
+def generate_fleet(size, now, schedule_tag='Schedule', due_ratio=0.2, seed=None, weekdays=('1234567',)):
+    """
+    Returns tuple of instances keyed by ocid and schedule table records for given utc time,
+    working days of every instance are picked from given weekdays choices
+    """
+    rng = random.Random(seed)
+    tz_context = TimezoneContext(now=now)
+    instances = {}
+    records = []
+
+    for index in range(size):
+        ocid = generate_ocid(rng)
+        abbreviation = rng.choice(list(TIMEZONES))
+        timezone = TIMEZONES[abbreviation]
+        hour = tz_context.get_zone(timezone)['local_now'].hour
+
+        roll = rng.random()
+        if roll < due_ratio / 2:
+            # start due in this hour
+            start, stop, state = hour, (hour + 10) % 24, 'STOPPED'
+        elif roll < due_ratio:
+            # stop due in this hour
+            start, stop, state = (hour - 10) % 24, hour, 'RUNNING'
+        else:
+            offset = rng.randrange(2, 12)
+            start, stop, state = (hour + offset) % 24, (hour + offset + 10) % 24, rng.choice(('RUNNING', 'STOPPED'))
+
+        working_days = rng.choice(weekdays)
+        name = "loadtest-{:06d}".format(index)
+        instances[ocid] = {
+            'id': ocid,
+            'display_name': name,
+            'lifecycle_state': state,
+            'shape': rng.choice(SHAPES),
+            'fault_domain': rng.choice(FAULT_DOMAINS),
+            'defined_tags': {'Oracle-Tags': {}},
+            'freeform_tags': {schedule_tag: "{:02d}To{:02d}|{}|{}".format(start, stop, working_days, abbreviation)},
+        }
+        records.append({
+            'instance_name': name,
+            'instance_id': ocid,
+            'lifecycle_state': state,
+            'working_timezone': timezone,
+            'working_days': working_days,
+            'utc_start_time': tz_context.get_utctime_from_hour(start, timezone).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'utc_stop_time': tz_context.get_utctime_from_hour(stop, timezone).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+
+    return instances, records
@@ -0,0 +1,165 @@
+"""
+Load test entry point, drives func.handler against the fake compute and nosql backend for synthetic fleets
+and reports throughput and api latency.
+usage - python -m loadtest.run --fleet 1000 10000 --median-ms 40 --p99-ms 300 --throttle-rate 0.01
+validation in worker processes is compared with threads by --compare-processes 4
+"""
+
+import io
+import json
+import time
+import logging
+import argparse
+import datetime
+
+import pytz
+from oci.core import ComputeManagementClient
+
+import func
+from core.oci_client import client
+from core.validation_pool import warm_up_pool
+from loadtest.fake_oci import LatencyModel, FaultInjector, FakeComputeClient, FakeComputeManagementClient, \
+    FakeNosqlClient
+from loadtest.fleet import generate_fleet
+
+TABLE_NAME = 'loadtest_schedules'
+
+DEFAULT_CONFIGS = {
+    'ActivateAutoStartStopProcess': 'True',
+    'ActivateAutoStart': 'True',
+    'CompartmentId': 'ocid1.compartment.oc1..loadtest',
+    'TableName': TABLE_NAME,
+    'MinutesDelta': '60',
+    'ScheduleTagKey': 'Schedule',
+    'DefaultTimezone': 'UTC',
+    'DefaultWeekdays': '12345',
+    'DefaultStart': 'NA',
+    'DefaultStop': 'NA',
+}
+
+
+class LoadTestContext:
+    """
+    Stand-in for the fdk context with fixed configs
+    """
+
+    def __init__(self, configs: dict):
+        self._configs = configs
+
+    def Config(self):
+        return self._configs
+
+    def SetResponseHeaders(self, headers, status_code):
+        self.response_headers = headers
+        self.status_code = status_code
+
+
+def install_backend(instances, records, faults, page_size=100, boot_seconds=0.0, pools=None):
+    """
+    replaces sdk clients of the shared OCIClient with the fake backend, instance pools are optional
+    """
+    client.reset()
+    client.compute = FakeComputeClient(instances, faults, boot_seconds=boot_seconds, page_size=page_size)
+    client.nosql_db = FakeNosqlClient({TABLE_NAME: records}, faults, page_size=page_size)
+    client.set_sdk_client(ComputeManagementClient, FakeComputeManagementClient(
+        pools or {}, faults, boot_seconds=boot_seconds, page_size=page_size
+    ))
+    return client.compute, client.nosql_db
+
+
+def run_load_test(size, faults: FaultInjector, configs: dict = None, page_size=100, due_ratio=0.2, seed=None,
+                  keep_actions=False):
+    """
+    runs the handler once against a fresh synthetic fleet and returns the report, with keep_actions the report
+    carries the (ocid, action) pairs acted on as well
+    """
+    configs = dict(DEFAULT_CONFIGS, **(configs or {}))
+    now = datetime.datetime.now(tz=pytz.utc)
+    instances, records = generate_fleet(size, now, schedule_tag=configs['ScheduleTagKey'], due_ratio=due_ratio,
+                                        seed=seed)
+    compute, _ = install_backend(instances, records, faults, page_size=page_size)
+
+    started = time.monotonic()
+    result = func.handler(LoadTestContext(configs), io.BytesIO(b''))
+    elapsed = time.monotonic() - started
+    body = json.loads(result.body())
+
+    processed = body.get('instances', {}).get('counts', {}).get('processed', 0)
+    report = {
+        'fleet': size,
+        'status': body.get('status'),
+        'duration_s': round(elapsed, 3),
+        'instances_per_second': round(processed / elapsed, 2) if elapsed else None,
+        'processed': processed,
+        'actions': len(compute.actions),
+        'hedge': body.get('resilience', {}).get('hedge'),
+        'validation': body.get('execution', {}).get('validation'),
+        'backend': faults.get_stats(),
+    }
+    if keep_actions:
+        report['acted'] = {(instance_id, action) for _, instance_id, action in compute.actions}
+    return report
+
+
+def compare_validation_modes(size, processes, make_faults, configs: dict = None, **options) -> dict:
+    """
+    runs the same fleet with validation on threads and in given number of worker processes and reports the
+    speedup of the process pool. workers are started before the timed run
+    """
+    warm_up_pool(processes)
+    threads = run_load_test(size, make_faults(), configs=dict(configs or {}, ValidationProcesses='0'),
+                            keep_actions=True, **options)
+    pool = run_load_test(size, make_faults(), configs=dict(configs or {}, ValidationProcesses=str(processes)),
+                         keep_actions=True, **options)
+    return {
+        'fleet': size,
+        'processes': processes,
+        'threads_s': threads['duration_s'],
+        'processes_s': pool['duration_s'],
+        'speedup': round(threads['duration_s'] / pool['duration_s'], 2) if pool['duration_s'] else None,
+        'same_actions': threads['acted'] == pool['acted'],
+        'validation': pool['validation'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test the scheduler against a fake oci backend")
+    parser.add_argument('--fleet', type=int, nargs='+', default=[1000], help="fleet sizes to test")
+    parser.add_argument('--median-ms', type=float, default=40, help="median api latency")
+    parser.add_argument('--p99-ms', type=float, default=300, help="p99 api latency")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="multiplier applied to sampled latencies")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument('--page-size', type=int, default=100, help="rows per query page")
+    parser.add_argument('--due-ratio', type=float, default=0.2, help="share of the fleet due for action")
+    parser.add_argument('--seed', type=int, help="random seed of the fleet generator")
+    parser.add_argument('--config', action='append', default=[], help="function config override KEY=VALUE")
+    parser.add_argument('--verbose', action='store_true', help="show scheduler logs")
+    parser.add_argument('--compare-processes', type=int,
+                        help="compare validation on threads with validation in this many worker processes")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    overrides = dict(item.split('=', 1) for item in args.config)
+
+    def make_faults():
+        return FaultInjector(
+            latency=LatencyModel(args.median_ms, args.p99_ms, time_scale=args.time_scale),
+            throttle_rate=args.throttle_rate,
+            error_rate=args.error_rate,
+        )
+
+    for size in args.fleet:
+        if args.compare_processes:
+            # both modes run the same fleet, so a seed is always set
+            report = compare_validation_modes(size, args.compare_processes, make_faults, configs=overrides,
+                                              page_size=args.page_size, due_ratio=args.due_ratio,
+                                              seed=args.seed if args.seed is not None else 0)
+        else:
+            report = run_load_test(size, make_faults(), configs=overrides, page_size=args.page_size,
+                                   due_ratio=args.due_ratio, seed=args.seed)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Fast forward simulator, replays every MinutesDelta tick of a week or of a DST transition against a synthetic
+fleet with a fake clock and records the actions taken at each tick. expected start and stop events of every
+tick are computed independently from the tags, so missed and unexpected actions are reported
+usage - python -m loadtest.simulate --fleet 500 --days 7
+        python -m loadtest.simulate --fleet 500 --dst America/Los_Angeles --year 2026
+"""
+
+import io
+import json
+import time
+import bisect
+import logging
+import argparse
+import datetime
+
+import pytz
+
+import func
+from loadtest.fake_oci import LatencyModel, FaultInjector
+from loadtest.fleet import generate_fleet
+from loadtest.run import DEFAULT_CONFIGS, LoadTestContext, install_backend
+from utils.clock import FakeClock, set_clock
+from utils.date_util import TIMEZONES
+from utils.patterns import TAG_VALUE_PATTERNS
+
+WEEKDAY_CHOICES = ('1234567', '12345', '67', '135')
+
+
+def get_dst_window(timezone, year):
+    """
+    Returns utc start and end of a two day window around the first DST transition of the timezone in the year
+    """
+    tz_info = pytz.timezone(timezone)
+    transitions = getattr(tz_info, '_utc_transition_times', [])
+    index = bisect.bisect_left(transitions, datetime.datetime(year, 1, 1))
+    if index >= len(transitions) or transitions[index].year != year:
+        raise ValueError(f"timezone '{timezone}' has no DST transition in {year}")
+    transition = transitions[index].replace(tzinfo=pytz.utc, minute=0, second=0)
+    return transition - datetime.timedelta(days=1), transition + datetime.timedelta(days=1)
+
+
+def parse_schedule(tag_value):
+    """
+    start hour, stop hour, weekdays and tz database timezone of a generated schedule tag
+    """
+    match = TAG_VALUE_PATTERNS[1].match(tag_value)
+    start, stop = (int(hour) if hour else None for hour in match.group('windows').split('To'))
+    weekdays = {int(day) for day in match.group('weekdays')}
+    return start, stop, weekdays, TIMEZONES[match.group('timezone').upper()]
+
+
+def get_expected_events(schedules, past, now):
+    """
+    Returns dict of instance ocid and action for start and stop events falling in the window [past, now].
+    computed straight from pytz, independent of the validators under test
+    """
+    expected = {}
+    for ocid, (start, stop, weekdays, timezone) in schedules.items():
+        tz_info = pytz.timezone(timezone)
+        local_dates = {past.astimezone(tz_info).date(), now.astimezone(tz_info).date()}
+        for action, hour in (('START', start), ('STOP', stop)):
+            if hour is None:
+                continue
+            # an overnight window stops on the day after its start
+            overnight = action == 'STOP' and start is not None and stop <= start
+            for local_date in local_dates:
+                day = local_date - datetime.timedelta(days=1) if overnight else local_date
+                if day.isoweekday() not in weekdays:
+                    continue
+                naive_local = datetime.datetime.combine(local_date, datetime.time(hour))
+                event = tz_info.normalize(tz_info.localize(naive_local)).astimezone(pytz.utc)
+                if past <= event <= now:
+                    expected[ocid] = action
+    return expected
+
+
+def simulate(size, start, end, configs: dict = None, boot_seconds=0.0, seed=None):
+    """
+    runs the handler at every tick between start and end on a fake clock, returns per tick report and totals
+    """
+    configs = dict(DEFAULT_CONFIGS, StateTableName='loadtest_state', **(configs or {}))
+    tick = datetime.timedelta(minutes=int(configs['MinutesDelta']))
+    # starts may be taken early by the learned boot duration, up to MaxPreStartMinutes
+    pre_start = datetime.timedelta(minutes=int(configs.get('MaxPreStartMinutes') or 0))
+    clock = FakeClock(start)
+    set_clock(clock)
+
+    try:
+        instances, records = generate_fleet(size, start, schedule_tag=configs['ScheduleTagKey'], due_ratio=0,
+                                            seed=seed, weekdays=WEEKDAY_CHOICES)
+        schedules = {ocid: parse_schedule(instance['freeform_tags'][configs['ScheduleTagKey']])
+                     for ocid, instance in instances.items()}
+        compute, _ = install_backend(instances, records, FaultInjector(latency=LatencyModel(median_ms=0)),
+                                     boot_seconds=boot_seconds)
+        ctx = LoadTestContext(configs)
+
+        ticks = []
+        totals = {'START': 0, 'STOP': 0, 'early': 0, 'missed': 0, 'unexpected': 0, 'failed_runs': 0}
+        previous = None
+        while clock.now() <= end:
+            now = clock.now()
+            # the scheduler window is inclusive on both ends, first tick looks back one full interval
+            past = previous + datetime.timedelta(minutes=1) if previous else now - tick
+            before = {ocid: instance['lifecycle_state'] for ocid, instance in instances.items()}
+            seen = len(compute.actions)
+
+            started = time.monotonic()
+            body = json.loads(func.handler(ctx, io.BytesIO(b'')).body())
+            elapsed = time.monotonic() - started
+
+            taken = {ocid: action for _, ocid, action in compute.actions[seen:]}
+            expected = get_expected_events(schedules, past, now)
+            ahead = get_expected_events(schedules, now + datetime.timedelta(minutes=1), now + pre_start) \
+                if pre_start else {}
+            target = {'START': ('RUNNING', 'STARTING'), 'STOP': ('STOPPED', 'STOPPING')}
+            missed = [ocid for ocid, action in expected.items()
+                      if taken.get(ocid) != action and before[ocid] not in target[action]]
+            early = [ocid for ocid, action in taken.items()
+                     if expected.get(ocid) != action and action == 'START' and ahead.get(ocid) == 'START']
+            unexpected = [ocid for ocid, action in taken.items() if expected.get(ocid) != action and ocid not in early]
+
+            for action in taken.values():
+                totals[action] += 1
+            totals['early'] += len(early)
+            totals['missed'] += len(missed)
+            totals['unexpected'] += len(unexpected)
+            totals['failed_runs'] += body.get('status') != 'SUCCESS'
+            ticks.append({
+                'at': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'status': body.get('status'),
+                'started': sum(action == 'START' for action in taken.values()),
+                'stopped': sum(action == 'STOP' for action in taken.values()),
+                'expected': len(expected),
+                'missed': [instances[ocid]['display_name'] for ocid in missed],
+                'unexpected': [instances[ocid]['display_name'] for ocid in unexpected],
+                'duration_ms': round(elapsed * 1000, 2),
+            })
+
+            # the table sync job keeps recorded lifecycle states in step with the fleet
+            for record in records:
+                record['lifecycle_state'] = instances[record['instance_id']]['lifecycle_state']
+            previous = now
+            clock.advance(tick.total_seconds())
+
+        return {'fleet': size, 'ticks': len(ticks), 'totals': totals, 'timeline': ticks}
+    finally:
+        set_clock()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="replay scheduler ticks on a fake clock against a synthetic fleet")
+    parser.add_argument('--fleet', type=int, default=200, help="fleet size")
+    parser.add_argument('--start', help="utc start of the simulation as YYYY-MM-DDTHH:MM, defaults to last monday")
+    parser.add_argument('--days', type=float, default=7, help="number of days to replay")
+    parser.add_argument('--dst', help="replay a day on either side of the DST transition of this timezone")
+    parser.add_argument('--year', type=int, default=datetime.datetime.utcnow().year,
+                        help="year of the --dst transition")
+    parser.add_argument('--boot-seconds', type=float, default=0, help="seconds instances stay in transitional state")
+    parser.add_argument('--seed', type=int, help="random seed of the fleet generator")
+    parser.add_argument('--config', action='append', default=[], help="function config override KEY=VALUE")
+    parser.add_argument('--timeline', action='store_true', help="print every tick instead of ticks with actions")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    overrides = dict(item.split('=', 1) for item in args.config)
+
+    if args.dst:
+        start, end = get_dst_window(args.dst, args.year)
+    else:
+        if args.start:
+            start = datetime.datetime.strptime(args.start, '%Y-%m-%dT%H:%M').replace(tzinfo=pytz.utc)
+        else:
+            today = datetime.datetime.now(tz=pytz.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            start = today - datetime.timedelta(days=today.weekday() + 7)
+        end = start + datetime.timedelta(days=args.days)
+
+    report = simulate(args.fleet, start, end, configs=overrides, boot_seconds=args.boot_seconds, seed=args.seed)
+    if not args.timeline:
+        report['timeline'] = [tick for tick in report['timeline']
+                              if tick['started'] or tick['stopped'] or tick['missed'] or tick['unexpected']]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""
+pytest configuration, the repository root is importable the same way func.py imports its modules
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
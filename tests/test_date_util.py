@@ -0,0 +1,18 @@
+"""
+Tests of the date utilities
+"""
+
+import pytest
+
+from utils.date_util import get_timezones
+
+
+def test_cached_timezones_cannot_be_modified():
+    timezones = get_timezones()
+    assert 'Asia/Kolkata' in timezones['IST']
+    with pytest.raises(TypeError):
+        timezones['XYZ'] = {'Etc/UTC'}
+    with pytest.raises(AttributeError):
+        timezones['IST'].add('Etc/UTC')
+    # unknown abbreviations do not grow the shared mapping
+    assert timezones.get('XYZ') is None and 'XYZ' not in get_timezones()
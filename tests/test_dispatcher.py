@@ -0,0 +1,114 @@
+"""
+Tests of the action dispatcher
+"""
+
+import time
+import datetime
+import threading
+
+from core.dispatcher import ActionDispatcher
+
+
+class Instance:
+
+    def __init__(self, name, action='start', minute=0, fault_domain=None, shape=None):
+        self.name = name
+        self.action = action
+        self.scheduled_at = datetime.datetime(2026, 10, 19, 8, minute, tzinfo=datetime.timezone.utc)
+        self.fault_domain = fault_domain
+        self.shape = shape
+
+    def get_action(self):
+        return self.action
+
+    def get_scheduled_at(self):
+        return self.scheduled_at
+
+    def __repr__(self):
+        return self.name
+
+
+class Recorder:
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, instance):
+        with self._lock:
+            self.calls.append((time.monotonic(), instance.name))
+        time.sleep(self.seconds)
+
+
+def test_priority_order_with_stops_first():
+    instances = [Instance('late', minute=5), Instance('stop', action='stop', minute=9), Instance('early', minute=1)]
+    recorder = Recorder()
+    stats = ActionDispatcher(workers=1, prioritize_stops=True).run(instances, recorder)
+    assert [name for _, name in recorder.calls] == ['stop', 'early', 'late']
+    assert stats['dispatched'] == 3 and stats['pending'] == 0
+
+
+def test_rate_paces_the_actions():
+    recorder = Recorder()
+    started = time.monotonic()
+    ActionDispatcher(workers=5, rate_per_second=20).run([Instance(str(i)) for i in range(5)], recorder)
+    offsets = sorted(at - started for at, _ in recorder.calls)
+    # nth action is not taken before n / rate seconds
+    for index, offset in enumerate(offsets):
+        assert offset >= index / 20 - 0.005
+
+
+def test_no_action_is_taken_after_the_deadline():
+    recorder = Recorder()
+    instances = [Instance(str(i), minute=i) for i in range(10)]
+    deadline = time.monotonic() + 0.25
+    dispatcher = ActionDispatcher(workers=10, rate_per_second=10, deadline=deadline)
+    stats = dispatcher.run(instances, recorder)
+    assert all(at < deadline for at, _ in recorder.calls)
+    assert stats['dispatched'] == len(recorder.calls) == 3
+    # paced actions whose slot is after the deadline are handed back in priority order
+    assert [instance.name for instance in dispatcher.pending] == [str(i) for i in range(3, 10)]
+    assert time.monotonic() - deadline < 0.1
+
+
+def test_deadline_stops_waiting_for_capacity():
+    recorder = Recorder(seconds=0.5)
+    instances = [Instance(str(i), minute=i, fault_domain='FD-1') for i in range(3)]
+    deadline = time.monotonic() + 0.2
+    dispatcher = ActionDispatcher(workers=3, fault_domain_limit=1, deadline=deadline)
+    stats = dispatcher.run(instances, recorder)
+    assert stats['dispatched'] == 1
+    assert [instance.name for instance in dispatcher.pending] == ['1', '2']
+
+
+def test_fault_domain_limit_caps_concurrency():
+    running = {'FD-1': 0, 'FD-2': 0}
+    peak = {'FD-1': 0, 'FD-2': 0}
+    lock = threading.Lock()
+
+    def action(instance):
+        with lock:
+            running[instance.fault_domain] += 1
+            peak[instance.fault_domain] = max(peak[instance.fault_domain], running[instance.fault_domain])
+        time.sleep(0.02)
+        with lock:
+            running[instance.fault_domain] -= 1
+
+    instances = [Instance(str(i), minute=i % 60, fault_domain='FD-1' if i % 3 else 'FD-2') for i in range(30)]
+    stats = ActionDispatcher(workers=10, fault_domain_limit=2).run(instances, action)
+    assert stats['dispatched'] == 30
+    assert peak == {'FD-1': 2, 'FD-2': 2}
+
+
+def test_instance_blocked_on_another_cap_does_not_hold_back_its_fault_domain():
+    recorder = Recorder(seconds=0.05)
+    instances = [
+        Instance('a', minute=0, fault_domain='FD-1', shape='S1'),
+        Instance('b', minute=1, fault_domain='FD-2', shape='S1'),
+        Instance('c', minute=2, fault_domain='FD-2', shape='S2'),
+    ]
+    stats = ActionDispatcher(workers=3, shape_limit=1, fault_domain_limit=1).run(instances, recorder)
+    assert stats['dispatched'] == 3
+    # 'b' waits for shape S1 while 'c' goes ahead on fault domain FD-2
+    assert {name for _, name in recorder.calls[:2]} == {'a', 'c'}
@@ -0,0 +1,66 @@
+"""
+Tests of opt-in handler profiling
+"""
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.profiling import get_profile_options, profile_call
+
+
+def work(count):
+    return sum(range(count))
+
+
+def test_pool_is_reusable_after_profiling():
+    # pool threads are started by the profiled call and outlive it, as the hedging pool does in a warm container
+    pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        def fn():
+            return [future.result() for future in [pool.submit(work, 1000) for _ in range(20)]]
+
+        for _ in range(3):
+            result, summary = profile_call(fn, top_n=5)
+            assert result == [work(1000)] * 20
+            assert summary['profilers'] > 1
+            assert sum(future.result() for future in [pool.submit(work, 1000) for _ in range(200)]) == 200 * work(1000)
+        assert pool.submit(sys.getprofile).result() is None
+    finally:
+        pool.shutdown()
+
+
+def test_threads_started_by_the_call_are_profiled():
+    def fn():
+        threads = [threading.Thread(target=work, args=(10000,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    _, summary = profile_call(fn, top_n=50)
+    assert summary['profilers'] == 4
+    assert any('work' in row['function'] for row in summary['hotspots'])
+    assert threading.Thread.run.__qualname__ == 'Thread.run'
+    assert ThreadPoolExecutor.submit.__qualname__ == 'ThreadPoolExecutor.submit'
+
+
+def test_profiling_is_restored_when_the_call_fails():
+    def fn():
+        raise RuntimeError('failed')
+
+    try:
+        profile_call(fn)
+    except RuntimeError:
+        pass
+    assert threading.Thread.run.__qualname__ == 'Thread.run'
+    assert sys.getprofile() is None
+
+
+def test_profile_options():
+    assert get_profile_options(None) is None
+    assert get_profile_options('unknown') is None
+    assert get_profile_options('cprofile', top_n='abc')['top_n'] == 20
+    assert get_profile_options('both', top_n='5') == {
+        'use_cprofile': True, 'use_tracemalloc': True, 'top_n': 5, 'dump_path': None
+    }
@@ -0,0 +1,55 @@
+"""
+Tests of the circuit breaker
+"""
+
+import time
+
+import pytest
+
+from core.oci_client import OCIClient
+from core.resilience import CircuitBreaker
+
+
+def test_breaker_opens_once_failures_reach_the_threshold():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.get_stats() == {'rejected': 1, 'opened': 1, 'state': CircuitBreaker.OPEN}
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.get_state() == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize('probe_succeeds, state', [(True, CircuitBreaker.CLOSED), (False, CircuitBreaker.OPEN)])
+def test_single_probe_after_the_reset_timeout(probe_succeeds, state):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.get_state() == CircuitBreaker.HALF_OPEN
+    # only the probe goes through while half open
+    assert not breaker.allow()
+    if probe_succeeds:
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+    assert breaker.get_state() == state
+    assert breaker.allow() == probe_succeeds
+
+
+def test_reset_keeps_the_configured_thresholds():
+    oci_client = OCIClient()
+    oci_client.configure_resilience(failure_threshold=2, reset_timeout=7)
+    oci_client.reset()
+    for breaker in oci_client.breakers.values():
+        assert (breaker.failure_threshold, breaker.reset_timeout) == (2, 7)
+        assert breaker.get_state() == CircuitBreaker.CLOSED
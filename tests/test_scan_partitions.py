@@ -0,0 +1,54 @@
+"""
+Tests of the concurrent partition scan
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from core.oci_client import client
+
+
+class SlowNosqlClient:
+    """
+    endless result set with a slow page read
+    """
+
+    def __init__(self, page_seconds):
+        self.page_seconds = page_seconds
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def query(self, query_details, page=None, **kwargs):
+        time.sleep(self.page_seconds)
+        with self._lock:
+            self.pages += 1
+        offset = int(page or 0)
+        data = SimpleNamespace(items=[{'instance_id': str(offset + index)} for index in range(10)], usage=None)
+        return SimpleNamespace(status=200, data=data, has_next_page=True, next_page=str(offset + 10))
+
+
+@pytest.fixture
+def slow_nosql():
+    original = client._nosql_db
+    client.nosql_db = SlowNosqlClient(page_seconds=0.2)
+    yield client.nosql_db
+    client.nosql_db = original
+
+
+def test_closing_the_scan_does_not_wait_for_partitions(slow_nosql):
+    queries = {str(index): 'SELECT * FROM records' for index in range(4)}
+    records = client.scan_partitions('compartment', queries, parallelism=2, stats={})
+    assert next(records)['instance_id'] == '0'
+
+    started = time.monotonic()
+    records.close()
+    assert time.monotonic() - started < 0.1
+
+    # scans stop at their next row, no partition fetches another page
+    time.sleep(0.5)
+    pages = slow_nosql.pages
+    time.sleep(0.5)
+    assert slow_nosql.pages == pages <= 4
@@ -0,0 +1,88 @@
+"""
+Tests of lease claims on the state table
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.oci_client import client
+from core.state_store import StateStore
+from loadtest.fake_oci import FakeNosqlClient, FaultInjector, LatencyModel
+
+LEASE_KEY = 'lease|ocid1.instance.oc1..a|start|2026-10-19T08:00:00Z'
+
+
+@pytest.fixture
+def store():
+    original = client._nosql_db
+    client.nosql_db = FakeNosqlClient({}, FaultInjector(latency=LatencyModel(median_ms=0)))
+    yield StateStore(client, 'compartment', 'state', lease_timeout=300)
+    client.nosql_db = original
+
+
+def put_stale_lease(store):
+    store.put(LEASE_KEY, {'owner': 'dead-run', 'status': StateStore.IN_FLIGHT, 'claimed_at': '2020-01-01T00:00:00Z'})
+
+
+def test_only_one_owner_claims_a_lease(store):
+    assert store.claim(LEASE_KEY, 'run-1')
+    assert not store.claim(LEASE_KEY, 'run-2')
+    assert store.get(LEASE_KEY)['owner'] == 'run-1'
+    assert store.get_lease_status(LEASE_KEY) == StateStore.IN_FLIGHT
+
+
+def test_released_lease_is_claimed_again(store):
+    assert store.claim(LEASE_KEY, 'run-1')
+    assert store.release(LEASE_KEY)
+    assert store.get_lease_status(LEASE_KEY) is None
+    assert store.claim(LEASE_KEY, 'run-2')
+
+
+def test_completed_lease_is_never_taken_over(store):
+    assert store.claim(LEASE_KEY, 'run-1')
+    assert store.complete(LEASE_KEY, 'run-1')
+    assert store.get_lease_status(LEASE_KEY) == StateStore.COMPLETED
+    assert not store.claim(LEASE_KEY, 'run-2')
+
+
+def test_fresh_lease_in_flight_is_not_taken_over(store):
+    assert store.claim(LEASE_KEY, 'run-1')
+    assert not store.claim(LEASE_KEY, 'run-2')
+
+
+def test_stale_lease_is_taken_over(store):
+    put_stale_lease(store)
+    assert store.claim(LEASE_KEY, 'run-2')
+    assert store.get(LEASE_KEY)['owner'] == 'run-2'
+
+
+def test_stale_lease_is_taken_over_by_one_invocation_only(store):
+    put_stale_lease(store)
+    # both invocations read the stale lease before either writes
+    _, version = client.get_versioned_table_row('compartment', 'state', {'state_key': LEASE_KEY})
+    value = {'state_key': LEASE_KEY, 'state_value': {'owner': 'run-2', 'status': StateStore.IN_FLIGHT}}
+    assert store.take_over(LEASE_KEY, value, version, 'dead-run')
+    value = {'state_key': LEASE_KEY, 'state_value': {'owner': 'run-3', 'status': StateStore.IN_FLIGHT}}
+    assert not store.take_over(LEASE_KEY, value, version, 'dead-run')
+    assert store.get(LEASE_KEY)['owner'] == 'run-2'
+
+
+def test_concurrent_claims_of_a_stale_lease(store):
+    put_stale_lease(store)
+    barrier = threading.Barrier(8)
+
+    def claim(owner):
+        barrier.wait()
+        return store.claim(LEASE_KEY, owner)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        claimed = list(pool.map(claim, ['run-{}'.format(index) for index in range(8)]))
+    assert claimed.count(True) == 1
+    assert store.get(LEASE_KEY)['owner'] == 'run-{}'.format(claimed.index(True))
+
+
+def test_claim_proceeds_when_state_table_is_unreachable(store, monkeypatch):
+    monkeypatch.setattr(client, 'update_table_row', lambda *args, **kwargs: {})
+    assert store.claim(LEASE_KEY, 'run-1')
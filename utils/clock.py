@@ -0,0 +1,103 @@
+"""
+Clock abstraction used by every time dependent part of the scheduler. the system clock is active by default,
+a fake clock can be installed so that weekdays, DST transitions and cache expiry are replayed without waiting
+"""
+
+import time
+import datetime
+import threading
+
+import pytz
+
+
+class SystemClock:
+    """
+    Wall clock and monotonic time of the host
+    """
+
+    def now(self) -> datetime.datetime:
+        """
+        current utc aware datetime
+        """
+        return datetime.datetime.now(tz=pytz.utc)
+
+    def monotonic(self) -> float:
+        """
+        seconds from an arbitrary point, never goes back
+        """
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        """
+        blocks the calling thread for given seconds
+        """
+        time.sleep(seconds)
+
+
+class FakeClock(SystemClock):
+    """
+    Manually advanced clock, time only moves when advance or set is called
+    """
+
+    def __init__(self, start: datetime.datetime):
+        """
+        Initialization, start must be a utc aware datetime
+        """
+        self._now = start
+        self._monotonic = 0.0
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime.datetime:
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self._monotonic
+
+    def advance(self, seconds: float):
+        """
+        moves both wall clock and monotonic time forward by given seconds
+        """
+        with self._lock:
+            self._now = self._now + datetime.timedelta(seconds=seconds)
+            self._monotonic += seconds
+
+    def sleep(self, seconds: float):
+        """
+        returns right away after advancing the clock by given seconds
+        """
+        self.advance(seconds)
+
+    def set(self, now: datetime.datetime):
+        """
+        jumps the wall clock to given utc aware datetime, monotonic time follows when moving forward
+        """
+        with self._lock:
+            self._monotonic += max((now - self._now).total_seconds(), 0)
+            self._now = now
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """
+    getter for the active clock
+    """
+    return _clock
+
+
+def set_clock(clock: SystemClock = None):
+    """
+    setter for the active clock, system clock is restored if clock is not given
+    """
+    global _clock
+    _clock = clock if clock else SystemClock()
+
+
+def utc_now() -> datetime.datetime:
+    """
+    current utc aware datetime of the active clock
+    """
+    return _clock.now()
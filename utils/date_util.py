@@ -5,11 +5,16 @@ Created on 02-09-2021
 @email: an.anurag@msn.com
 """
 
+import types
 import datetime
+import functools
 import collections
 
 import pytz
 
+from utils.clock import utc_now
+from utils.tz_context import TimezoneContext
+
 
 TIMEZONES = {
 
@@ -20,20 +25,14 @@ TIMEZONES = {
 }
 
 
-def get_utctime_from_hour(hour: int = None, timezone: str = None):
+def get_utctime_from_hour(hour: int = None, timezone: str = None, tz_context: TimezoneContext = None,
+                          minute: int = 0):
     """
-    A function to convert given time in specified timezone to utc
+    A function to convert given time in specified timezone to utc, per run timezone context is used if given
     """
-    local = pytz.timezone(timezone)
-    # as reference point
-    naive_now = datetime.datetime.now()
-    # create local time wrt utc first
-    local_time = naive_now.astimezone(local)
-    # create datetime obj from given timezone and hour
-    updated_local = local_time.replace(hour=hour, minute=0, second=0, microsecond=0)
-    # convert local time to utc
-    converted_utc = updated_local.astimezone(pytz.utc)
-    return converted_utc
+    if tz_context is None:
+        tz_context = TimezoneContext(now=utc_now())
+    return tz_context.get_utctime_from_hour(hour, timezone, minute)
 
 
 def get_timezone_from_abbreviation(abbr: str):
@@ -61,9 +60,11 @@ def get_utc_from_str(utc_str):
     return utc_date
 
 
+@functools.lru_cache(maxsize=None)
 def get_timezones():
     """
-    Get the dict of all timezones group by timezone abbreviation
+    Get the read only mapping of all timezones group by timezone abbreviation, built once per process.
+    the cached mapping is shared by every caller so neither it nor its sets can be modified
     """
     tzones = collections.defaultdict(set)
     # abbrevs = collections.defaultdict(set)
@@ -74,4 +75,4 @@ def get_timezones():
         for utcoffset, dstoffset, tzabbrev in data:
             tzones[tzabbrev].add(name)
             # abbrevs[name].add(tzabbrev)
-    return tzones
+    return types.MappingProxyType({tzabbrev: frozenset(names) for tzabbrev, names in tzones.items()})
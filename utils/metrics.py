@@ -0,0 +1,183 @@
+"""
+In process metrics collector with prometheus text exposition. response stats of a run are computed from
+the same collector, so alerts on the exposed metrics and the run response never disagree
+"""
+
+import os
+import math
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 180.0, 240.0, 300.0, 600.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LATENESS_BUCKETS = (5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0, 1800.0, 3600.0)
+
+METRICS = {
+    'scheduler_runs_total': ('counter', "Scheduler runs by final status"),
+    'scheduler_instances_processed_total': ('counter', "Instances fetched and validated"),
+    'scheduler_actions_total': ('counter', "Start and stop actions taken"),
+    'scheduler_api_throttles_total': ('counter', "OCI api calls throttled with status 429"),
+    'scheduler_api_errors_total': ('counter', "OCI api calls failed"),
+    'scheduler_metadata_cache_total': ('counter', "Instance metadata cache lookups by outcome"),
+    'scheduler_api_latency_seconds': ('histogram', "OCI api call latency"),
+    'scheduler_run_duration_seconds': ('histogram', "Scheduler run duration"),
+    'scheduler_action_lateness_seconds': ('histogram', "Delay between scheduled time and accepted start or stop"),
+    'scheduler_http_pool_wait_seconds': ('histogram', "Time waited to check out a pooled http connection"),
+}
+
+
+def get_percentile(values, percentile):
+    """
+    nearest rank percentile of given values, None when there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(len(ordered) * percentile / 100)
+    return ordered[min(max(rank - 1, 0), len(ordered) - 1)]
+
+
+class MetricsCollector:
+    """
+    Thread safe counters and histograms identified by metric name and labels
+    """
+
+    def __init__(self):
+        """
+        Initialization
+        """
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        increments a counter
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        records a value in a histogram
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+                self._histograms[key] = histogram
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self) -> dict:
+        """
+        point in time copy of all counter values and histogram counts and sums
+        """
+        with self._lock:
+            values = dict(self._counters)
+            for key, histogram in self._histograms.items():
+                values[(key[0] + '_count', key[1])] = histogram['count']
+                values[(key[0] + '_sum', key[1])] = histogram['sum']
+        return values
+
+    def delta(self, since: dict) -> dict:
+        """
+        per run view of the collector, values accumulated after the given snapshot
+        """
+        summary = {}
+        for (name, labels), value in self.snapshot().items():
+            change = value - since.get((name, labels), 0)
+            if not change:
+                continue
+            label = ",".join("{}={}".format(key, val) for key, val in labels)
+            summary["{}{{{}}}".format(name, label) if label else name] = round(change, 6)
+        return summary
+
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in pairs) + '}'
+
+    def render(self) -> str:
+        """
+        prometheus text exposition format
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, counts=list(value['counts'])) for key, value in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            if metric_type == 'counter':
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append("{}{} {}".format(name, self._format_labels(labels), value))
+                continue
+            for (key_name, labels), histogram in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(name, self._format_labels(labels, ('le', bound)), cumulative))
+                lines.append("{}_bucket{} {}".format(name, self._format_labels(labels, ('le', '+Inf')),
+                                                     histogram['count']))
+                lines.append("{}_sum{} {}".format(name, self._format_labels(labels), histogram['sum']))
+                lines.append("{}_count{} {}".format(name, self._format_labels(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        writes the exposition atomically, suitable for node exporter textfile collector
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temp_path, path)
+        logging.getLogger().info(f"metrics written to '{path}'")
+
+    def start_http_server(self, port, address=''):
+        """
+        serves the exposition on /metrics from a daemon thread, returns the server
+        """
+        collector = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = collector.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.getLogger().info(f"metrics endpoint listening on port {port}")
+        return server
+
+
+metrics = MetricsCollector()
@@ -10,7 +10,9 @@ import re
 
 TAG_VALUE_PATTERNS = {
 
-    1: re.compile(r'^((?P<start>\d+)?To(?P<stop>\d+)?)\|(?P<weekdays>\d+)\|(?P<timezone>[A-Za-z]+)$', re.IGNORECASE),
+    # one or more comma separated windows, eg - 0830To1230,13:30To18|12345|IST
+    1: re.compile(r'^(?P<windows>[\d:]*To[\d:]*(,[\d:]*To[\d:]*)*)\|(?P<weekdays>\d+)\|(?P<timezone>[A-Za-z]+)$',
+                  re.IGNORECASE),
 
     # MANUAL START STOP BELOW
     # all NA
@@ -27,4 +29,9 @@ WEEKDAYS_PATTERN = re.compile(r'(?P<weekdays>[1-7]+)')
 
 HOUR_PATTERN = re.compile(r'^(?P<hour>0[0-9]|1[0-9]|2[0-3])$')
 
+# HH, HHMM or HH:MM
+TIME_PATTERN = re.compile(r'^(?P<hour>0[0-9]|1[0-9]|2[0-3]):?(?P<minute>[0-5][0-9])?$')
+
+WINDOW_PATTERN = re.compile(r'^(?P<start>[\d:]+|Na)?To(?P<stop>[\d:]+|Na)?$', re.IGNORECASE)
+
 DB_TIME_PATTERN = re.compile(r'^(?P<datetime>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)$')
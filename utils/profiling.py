@@ -0,0 +1,181 @@
+"""
+Opt-in cProfile and tracemalloc profiling of the handler. nothing of this module runs unless profiling
+is requested, so there is no overhead for regular invocations
+"""
+
+import io
+import os
+import sys
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.thread import _worker as thread_worker  # worker loop of pool threads
+
+PROFILE_MODES = {
+    'cprofile': (True, False),
+    'tracemalloc': (False, True),
+    'both': (True, True),
+}
+
+
+def get_profile_options(mode, top_n=None, dump_path=None):
+    """
+    Returns profiling keyword arguments for given mode, None if profiling is not requested
+    """
+    if not mode or mode.strip().casefold() not in PROFILE_MODES:
+        return None
+    use_cprofile, use_tracemalloc = PROFILE_MODES[mode.strip().casefold()]
+    try:
+        top_n = max(int(top_n), 1) if top_n else 20
+    except (TypeError, ValueError):
+        logging.getLogger().info(f"invalid profile top n '{top_n}', using 20")
+        top_n = 20
+    return {
+        'use_cprofile': use_cprofile,
+        'use_tracemalloc': use_tracemalloc,
+        'top_n': top_n,
+        'dump_path': dump_path or None,
+    }
+
+
+def summarize_profile(profilers, top_n):
+    """
+    Top functions by cumulative time across all profiled threads
+    """
+    stats = pstats.Stats(*profilers, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [
+        {
+            'function': "{}:{}({})".format(os.path.basename(filename), line, name),
+            'ncalls': calls,
+            'tottime': round(total_time, 6),
+            'cumtime': round(cumulative_time, 6),
+        }
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in rows
+    ], stats
+
+
+def summarize_allocations(snapshot, top_n):
+    """
+    Top allocation sites by size
+    """
+    return [
+        {
+            'location': "{}:{}".format(os.path.basename(stat.traceback[0].filename), stat.traceback[0].lineno),
+            'size_kb': round(stat.size / 1024, 2),
+            'count': stat.count,
+        }
+        for stat in snapshot.statistics('lineno')[:top_n]
+    ]
+
+
+class ThreadProfilers:
+    """
+    cProfile profilers of the threads working for the profiled call. a profiler can only be removed safely by
+    its own thread, so it is enabled and disabled around units of work of that thread, the run of a thread
+    started by the call and every task submitted to a thread pool during the call. pool worker threads are
+    only profiled per task, they outlive the call
+    """
+
+    def __init__(self):
+        """
+        Initialization
+        """
+        self.profilers = []
+        self.unfinished = 0
+        self._active = False
+        self._lock = threading.Lock()
+        self._thread_run = threading.Thread.run
+        self._pool_submit = ThreadPoolExecutor.submit
+
+    def _profiled(self, work, *args, **kwargs):
+        # tasks of a pool run in threads profiled per run already are not profiled twice
+        if not self._active or sys.getprofile() is not None:
+            return work(*args, **kwargs)
+        profiler = cProfile.Profile()
+        entry = {'profiler': profiler, 'finished': False}
+        with self._lock:
+            self.profilers.append(entry)
+        profiler.enable()
+        try:
+            return work(*args, **kwargs)
+        finally:
+            profiler.disable()
+            entry['finished'] = True
+
+    def start(self):
+        """
+        Profiles threads started and tasks submitted from now on
+        """
+        profiled, thread_run, pool_submit = self._profiled, self._thread_run, self._pool_submit
+
+        def run(thread):
+            if getattr(thread, '_target', None) is thread_worker:
+                return thread_run(thread)
+            return profiled(thread_run, thread)
+
+        def submit(executor, work, *args, **kwargs):
+            return pool_submit(executor, profiled, work, *args, **kwargs)
+
+        self._active = True
+        threading.Thread.run = run
+        ThreadPoolExecutor.submit = submit
+
+    def stop(self) -> list:
+        """
+        Stops profiling new work and returns profilers of finished work, the work still running is counted in
+        unfinished and left out, its profiler is disabled by its thread once it is done
+        """
+        self._active = False
+        threading.Thread.run = self._thread_run
+        ThreadPoolExecutor.submit = self._pool_submit
+        with self._lock:
+            finished = [entry['profiler'] for entry in self.profilers if entry['finished']]
+            self.unfinished = len(self.profilers) - len(finished)
+        return finished
+
+
+def profile_call(fn, *args, use_cprofile=True, use_tracemalloc=False, top_n=20, dump_path=None, **kwargs):
+    """
+    Calls fn under the requested profilers and returns tuple of its result and profile summary.
+    threads started and pool tasks submitted while fn runs get their own cProfile profiler, the summary covers
+    all of them
+    """
+    summary = {}
+    thread_profilers = ThreadProfilers()
+
+    if use_tracemalloc:
+        tracemalloc.start()
+    if use_cprofile:
+        thread_profilers.start()
+        main_profiler = cProfile.Profile()
+        main_profiler.enable()
+
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        if use_cprofile:
+            main_profiler.disable()
+            profilers = [main_profiler] + thread_profilers.stop()
+            summary['hotspots'], stats = summarize_profile(profilers, top_n)
+            summary['profilers'] = len(profilers)
+            if thread_profilers.unfinished:
+                summary['unfinished_profilers'] = thread_profilers.unfinished
+            if dump_path:
+                stats.dump_stats(dump_path)
+                summary['profile_path'] = dump_path
+        if use_tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary['allocations'] = summarize_allocations(snapshot, top_n)
+            summary['memory_kb'] = {'current': round(current / 1024, 2), 'peak': round(peak / 1024, 2)}
+            if dump_path:
+                snapshot.dump(dump_path + '.tracemalloc')
+                summary['allocation_path'] = dump_path + '.tracemalloc'
+        logging.getLogger().info(f"profiling summary '{summary}'")
+
+    return result, summary
@@ -0,0 +1,173 @@
+"""
+Streaming run report. per instance entries are counted and handed to the sinks in small batches as the run
+progresses, so only counters and the most frequent failures are held in memory and returned in the response.
+orjson is used for encoding when it is installed, standard json otherwise
+expected report table schema -
+CREATE TABLE <RunReportTableName> (run_id STRING, seq INTEGER, kind STRING, name STRING, entry JSON,
+PRIMARY KEY(SHARD(run_id), seq)) USING TTL 7 DAYS
+"""
+
+import json
+import logging
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_entry(entry: dict) -> bytes:
+    """
+    single ndjson line of a report entry
+    """
+    if orjson is not None:
+        return orjson.dumps(entry, default=str) + b'\n'
+    return (json.dumps(entry, default=str, separators=(',', ':')) + '\n').encode()
+
+
+class NdjsonFileSink:
+    """
+    Writes report entries of a run to a local file, one json document per line. file is rewritten every run
+    """
+
+    def __init__(self, path='/tmp/instance-scheduler-report.ndjson'):
+        self.path = path
+        self._file = None
+
+    def write(self, entries: list):
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+        self._file.write(b''.join(encode_entry(entry) for entry in entries))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def describe(self):
+        return {'path': self.path}
+
+
+class TableSink:
+    """
+    Writes report entries as rows of a NoSQL table, rows expire with the table default ttl
+    """
+
+    def __init__(self, client, compartment_id, table_name):
+        self.client = client
+        self.compartment_id = compartment_id
+        self.table_name = table_name
+        self.failed = 0
+
+    def write(self, entries: list):
+        for entry in entries:
+            value = {'run_id': entry['run_id'], 'seq': entry['seq'], 'kind': entry['kind'], 'name': entry['name'],
+                     'entry': entry}
+            if not self.client.update_table_row(self.compartment_id, self.table_name, value):
+                self.failed += 1
+
+    def close(self):
+        if self.failed:
+            logging.getLogger().error(f"{self.failed} run report rows could not be written to '{self.table_name}'")
+
+    def describe(self):
+        return {'table': self.table_name, 'failed': self.failed}
+
+
+class RunReport:
+    """
+    Per run counters by entry kind, most frequent failures and the sinks receiving every entry
+    """
+
+    KINDS = ('processed', 'started', 'stopped', 'deduplicated', 'suppressed', 'failed')
+
+    def __init__(self, run_id, sinks=(), top_failures=5, batch_size=100):
+        """
+        Initialization
+        """
+        self.run_id = run_id
+        self.sinks = list(sinks)
+        self.top_failures = top_failures
+        self.batch_size = batch_size
+        self._counts = dict.fromkeys(self.KINDS, 0)
+        self._failures = {}
+        self._failed_stages = {}
+        self._pending = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def add(self, kind, name, **details):
+        """
+        Counts an entry and queues it for the sinks, a full batch is written by the calling thread
+        """
+        with self._lock:
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+            self._seq += 1
+            if kind == 'failed':
+                stage = details.get('stage')
+                self._failed_stages[stage] = self._failed_stages.get(stage, 0) + 1
+                # failures are grouped by message, a few instance names are kept as examples
+                error = str(details.get('error'))[:200]
+                failure = self._failures.setdefault(error, {'error': error, 'count': 0, 'instances': []})
+                failure['count'] += 1
+                if len(failure['instances']) < 3:
+                    failure['instances'].append(name)
+            if not self.sinks:
+                return
+            entry = {'run_id': self.run_id, 'seq': self._seq, 'kind': kind, 'name': name}
+            self._pending.append(dict(entry, **details))
+            batch = None
+            if len(self._pending) >= self.batch_size:
+                batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._write_lock:
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as err:
+                    logging.getLogger().exception(f"error occurred while writing the run report '{err}'")
+
+    def close(self):
+        """
+        Writes remaining entries and closes the sinks
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+        for sink in self.sinks:
+            sink.close()
+
+    def get_count(self, kind) -> int:
+        """
+        getter for number of entries of given kind
+        """
+        return self._counts.get(kind, 0)
+
+    def get_failed_count(self, *stages) -> int:
+        """
+        getter for number of failures of given stages, all failures when no stage is given
+        """
+        with self._lock:
+            if not stages:
+                return sum(self._failed_stages.values())
+            return sum(self._failed_stages.get(stage, 0) for stage in stages)
+
+    def get_summary(self) -> dict:
+        """
+        Returns counts, most frequent failures and where per instance entries were written
+        """
+        with self._lock:
+            failures = sorted(self._failures.values(), key=lambda failure: failure['count'], reverse=True)
+            return {
+                'counts': dict(self._counts),
+                'top_failures': [dict(failure) for failure in failures[:self.top_failures]],
+                'entries': self._seq,
+                'sinks': [sink.describe() for sink in self.sinks],
+            }
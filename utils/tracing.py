@@ -0,0 +1,196 @@
+"""
+Minimal span based tracing for the fetch, validate and act stages of a run. spans are kept in memory
+and handed over to a pluggable exporter at the end of the run. disabled tracer creates no spans
+"""
+
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+
+
+class Span:
+    """
+    A timed unit of work with parent/child relationship
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        """
+        Initialization
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.status = 'OK'
+        self.started_at = time.time()
+        self.duration_ms = None
+        self._started = time.monotonic()
+
+    def __repr__(self):
+        """
+        Object representation
+        """
+        return "{} {} {}ms".format(self.name, self.span_id, self.duration_ms)
+
+    def set_attribute(self, key, value):
+        """
+        setter for span attributes
+        """
+        self.attributes[key] = value
+
+    def end(self):
+        """
+        finishes the span
+        """
+        self.duration_ms = round((time.monotonic() - self._started) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        """
+        exportable form of the span
+        """
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class JsonFileExporter:
+    """
+    Appends every trace as a single json document line to the given local file
+    """
+
+    def __init__(self, path='/tmp/instance-scheduler-traces.json'):
+        self.path = path
+
+    def export(self, trace_id, spans: list):
+        with open(self.path, 'a') as trace_file:
+            trace_file.write(json.dumps({'trace_id': trace_id, 'spans': [span.to_dict() for span in spans]}))
+            trace_file.write('\n')
+        return self.path
+
+
+EXPORTERS = {
+    'json': JsonFileExporter,
+}
+
+
+def register_exporter(name, exporter_class):
+    """
+    register a custom exporter class, it must implement export(trace_id, spans)
+    """
+    EXPORTERS[name] = exporter_class
+
+
+class Tracer:
+    """
+    Per run tracer, current span is tracked per thread and parents can be passed across threads
+    """
+
+    def __init__(self):
+        """
+        Initialization
+        """
+        self.exporter = None
+        self.trace_id = None
+        self._spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, exporter_name=None, **options):
+        """
+        select exporter for this run and start a new trace, unknown or empty name disables tracing
+        """
+        exporter_class = EXPORTERS.get(exporter_name.strip().casefold()) if exporter_name else None
+        self.exporter = exporter_class(**options) if exporter_class else None
+        self.trace_id = uuid.uuid4().hex
+        with self._lock:
+            self._spans = []
+
+    def current_span(self):
+        """
+        innermost open span of the calling thread
+        """
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def start_span(self, name, parent=None, **attributes):
+        """
+        starts a span, parent defaults to current span of the calling thread
+        """
+        if not self.enabled:
+            return None
+        parent = parent or self.current_span()
+        span = Span(name, self.trace_id, parent_id=parent.span_id if parent else None, attributes=attributes)
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(span)
+        return span
+
+    def end_span(self, span):
+        """
+        finishes the span and records it for export
+        """
+        if span is None:
+            return
+        span.end()
+        stack = getattr(self._local, 'stack', [])
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self._spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, **attributes):
+        """
+        context manager around start_span and end_span, failed spans are marked with ERROR status
+        """
+        span = self.start_span(name, parent=parent, **attributes)
+        try:
+            yield span
+        except Exception:
+            if span:
+                span.status = 'ERROR'
+            raise
+        finally:
+            self.end_span(span)
+
+    def get_slowest(self, name, limit=5) -> list:
+        """
+        slowest finished spans with given name
+        """
+        with self._lock:
+            spans = [span for span in self._spans if span.name == name]
+        spans.sort(key=lambda span: span.duration_ms, reverse=True)
+        return [{'duration_ms': span.duration_ms, 'attributes': span.attributes} for span in spans[:limit]]
+
+    def flush(self) -> dict:
+        """
+        exports finished spans of the run and returns tracing summary
+        """
+        if not self.enabled:
+            return {}
+        with self._lock:
+            spans, self._spans = self._spans, []
+        try:
+            location = self.exporter.export(self.trace_id, spans)
+        except Exception as err:
+            logging.getLogger().exception(f"error occurred while exporting the trace, {err}")
+            location = None
+        return {'trace_id': self.trace_id, 'spans': len(spans), 'exported_to': location}
+
+
+tracer = Tracer()
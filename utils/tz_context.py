@@ -0,0 +1,107 @@
+"""
+Per run timezone context. local date, weekday and utc offset of every timezone are computed once per run
+and utc conversion of schedule hours are memoized, so validators do a dict lookup instead of tz conversions
+"""
+
+import datetime
+
+import pytz
+
+# a monday midnight, local minutes are counted from here
+_EPOCH = datetime.datetime(2001, 1, 1)
+# longest DST shift of any timezone, windows this close to a transition take the slow path
+_DST_MARGIN = datetime.timedelta(hours=3)
+
+
+def get_local_minute(local_time: datetime.datetime) -> int:
+    """
+    minutes of the naive local time since the reference monday, modulo a week it is the minute of week
+    """
+    return int((local_time.replace(tzinfo=None) - _EPOCH).total_seconds() // 60)
+
+
+def get_local_time(local_minute: int) -> datetime.datetime:
+    """
+    naive local time of the given minute since the reference monday
+    """
+    return _EPOCH + datetime.timedelta(minutes=local_minute)
+
+
+class TimezoneContext:
+    """
+    Timezone index for a single run pinned to the given utc reference time
+    """
+
+    def __init__(self, now: datetime.datetime):
+        """
+        Initialization, now must be a utc aware datetime
+        """
+        self.now = now
+        self._zones = {}
+        self._utc_times = {}
+        self._local_windows = {}
+
+    def get_zone(self, timezone: str) -> dict:
+        """
+        Returns local time, date, weekday and utc offset of the timezone at the reference time
+        """
+        zone = self._zones.get(timezone)
+        if zone is None:
+            tz_info = pytz.timezone(timezone)
+            local_now = self.now.astimezone(tz_info)
+            zone = {
+                'tz_info': tz_info,
+                'local_now': local_now,
+                'date': local_now.date(),
+                'weekday': local_now.weekday() + 1,
+                'utc_offset': local_now.utcoffset(),
+            }
+            self._zones[timezone] = zone
+        return zone
+
+    def get_weekday(self, timezone: str) -> int:
+        """
+        Current weekday in given timezone, monday is 1
+        """
+        return self.get_zone(timezone)['weekday']
+
+    def get_local_date(self, timezone: str) -> datetime.date:
+        """
+        Current date in given timezone
+        """
+        return self.get_zone(timezone)['date']
+
+    def get_utctime_from_hour(self, hour: int, timezone: str, minute: int = 0) -> datetime.datetime:
+        """
+        Converts given wall clock time of today in the timezone to utc. offset is resolved for the given
+        wall clock time, so schedules on the day of a DST transition are converted correctly
+        """
+        key = (timezone, hour, minute)
+        converted_utc = self._utc_times.get(key)
+        if converted_utc is None:
+            tz_info = self.get_zone(timezone)['tz_info']
+            naive_local = datetime.datetime.combine(self.get_local_date(timezone), datetime.time(hour, minute))
+            # normalize moves non existent wall clock times of spring forward gap past the gap
+            local_time = tz_info.normalize(tz_info.localize(naive_local))
+            converted_utc = local_time.astimezone(pytz.utc)
+            self._utc_times[key] = converted_utc
+        return converted_utc
+
+    def get_local_window(self, timezone: str, past: datetime.datetime, now: datetime.datetime) -> tuple:
+        """
+        Maps the utc window [past, now] to local minutes of the timezone, returns tuple of first and last local
+        minute, utc offset, past and now. offset is None when a DST transition is near, the local range is then
+        widened to cover both offsets and events in it have to be checked against the utc window
+        """
+        key = (timezone, past, now)
+        window = self._local_windows.get(key)
+        if window is None:
+            tz_info = self.get_zone(timezone)['tz_info']
+            offsets = [moment.astimezone(tz_info).utcoffset() for moment in (past - _DST_MARGIN, past, now)]
+            # first whole minute at or after past
+            first = get_local_minute(past + min(offsets) - datetime.timedelta(microseconds=1)) + 1
+            last = get_local_minute(now + max(offsets))
+            utc_offset = offsets[0] if len(set(offsets)) == 1 else None
+            window = (first, last, utc_offset, past, now)
+            self._local_windows[key] = window
+        return window
@@ -6,12 +6,11 @@ Created on 13-10-2021
 @email: an.anurag@msn.com
 """
 
-import datetime
 import logging
 
-import pytz
-
+from utils.clock import utc_now
 from utils.date_util import time_in_range
+from utils.tz_context import TimezoneContext
 
 
 class ScheduleChangeValidator:
@@ -19,14 +18,98 @@ class ScheduleChangeValidator:
     Universal validator wrapper for this project
     """
 
-    def __init__(self, db_schedule=None, live_schedule=None, past=None, now=None):
+    def __init__(self, db_schedule=None, live_schedule=None, past=None, now=None, tz_context=None,
+                 calendar_window=None, calendar_names=(), start_lead=None):
         """
         Initialization
         """
+        self.tz_context = tz_context if tz_context else TimezoneContext(now=utc_now())
         self.db_schedule = db_schedule
         self.live_schedule = live_schedule
         self.past = past
         self.now = now
+        self._live_events = None
+        self.calendar_window = calendar_window
+        self.calendar_names = calendar_names
+        self.suppressed_by = None
+        self.suppressed_action = None
+        self.start_lead = start_lead
+        self.is_pre_start = False
+
+    def get_live_events(self):
+        """
+        Latest start and stop event of the compiled live schedule in the current time window, computed once.
+        start events are ignored when auto start is turned off
+        """
+        if self._live_events is None:
+            compiled = self.live_schedule.get_compiled()
+            local_window = self.tz_context.get_local_window(compiled.timezone, self.past, self.now)
+            is_start_enabled = self.live_schedule.get_start_time() is not None
+            self._live_events = {
+                'start': compiled.get_last_event('start', local_window) if is_start_enabled else None,
+                'stop': compiled.get_last_event('stop', local_window),
+            }
+            if is_start_enabled and self.start_lead and self._live_events['start'] is None:
+                self._live_events['start'] = self.get_early_start(compiled)
+        return self._live_events
+
+    def get_early_start(self, compiled):
+        """
+        Start event due within the start lead after the window, the instance is started ahead of it so that it is
+        usable at the scheduled time. no early start when a stop is also scheduled before that start
+        """
+        ahead = self.tz_context.get_local_window(compiled.timezone, self.now, self.now + self.start_lead)
+        start = compiled.get_last_event('start', ahead)
+        if start is None or start <= self.now:
+            return None
+        stop = compiled.get_last_event('stop', ahead)
+        if stop is not None and stop <= start:
+            return None
+        logging.getLogger().info(f"start at '{start}' is taken early by {self.start_lead}")
+        self.is_pre_start = True
+        return start
+
+    def is_in_window(self, kind, live_time):
+        """
+        checks whether the start or stop event of live schedule falls in current time window. compiled schedules
+        are checked with bit tests, when both events fall in the window only the later one is valid
+        """
+        if self.live_schedule.get_compiled() is None:
+            return time_in_range(self.past, self.now, live_time)
+
+        events = self.get_live_events()
+        other = events['stop' if kind == 'start' else 'start']
+        if events[kind] is None:
+            return False
+        if other is not None and other > events[kind]:
+            logging.getLogger().info(f"{kind} is followed by a later event in the same time window")
+            return False
+        return True
+
+    def get_scheduled_at(self, kind):
+        """
+        utc time of the start or stop event being acted on
+        """
+        if self.live_schedule.get_compiled() is None:
+            return self.live_schedule.get_start_time() if kind == 'start' else self.live_schedule.get_stop_time()
+        return self.get_live_events()[kind]
+
+    def is_suppressed(self, kind):
+        """
+        checks exception calendars of the instance for a period suppressing the start or stop at its event time
+        returns: bool
+        """
+        if self.calendar_window is None or not self.calendar_names:
+            return False
+
+        moment = self.get_scheduled_at(kind) or self.now
+        calendar_name = self.calendar_window.get_blocking_calendar(self.calendar_names, kind, moment)
+        if calendar_name:
+            logging.getLogger().info(f"{kind} is suppressed by exception calendar '{calendar_name}'")
+            self.suppressed_by = calendar_name
+            self.suppressed_action = kind
+            return True
+        return False
 
     def is_start_valid(self):
         """
@@ -43,7 +126,7 @@ class ScheduleChangeValidator:
                 logging.getLogger().info("no change in start time, checking the time range")
                 # no change
                 # check range
-                is_okay = time_in_range(self.past, self.now, live_start)
+                is_okay = self.is_in_window('start', live_start)
                 if is_okay:
                     return True
                 logging.getLogger().info("start time mismatched with time range")
@@ -51,7 +134,7 @@ class ScheduleChangeValidator:
             else:
                 logging.getLogger().info(f"start time has changed to '{live_start}', checking the time range")
                 # change found, check range in live
-                is_okay = time_in_range(self.past, self.now, live_start)
+                is_okay = self.is_in_window('start', live_start)
                 if is_okay:
                     return True
                 logging.getLogger().info("start time mismatched with time range")
@@ -68,7 +151,7 @@ class ScheduleChangeValidator:
         if not db_start and live_start:
             logging.getLogger().info("start time added recently")
             # check the range
-            is_okay = time_in_range(self.past, self.now, live_start)
+            is_okay = self.is_in_window('start', live_start)
             if is_okay:
                 return True
             logging.getLogger().info("start time mismatched with time range")
@@ -89,7 +172,7 @@ class ScheduleChangeValidator:
                 logging.getLogger().info("no change in stop time, checking the time range")
                 # no change
                 # check range
-                is_okay = time_in_range(self.past, self.now, live_stop)
+                is_okay = self.is_in_window('stop', live_stop)
                 if is_okay:
                     return True
                 logging.getLogger().info("stop time mismatched with time range")
@@ -98,7 +181,7 @@ class ScheduleChangeValidator:
                 logging.getLogger().info(f"stop time has changed to '{live_stop}', checking the time range")
                 # change found
                 # check range in live
-                is_okay = time_in_range(self.past, self.now, live_stop)
+                is_okay = self.is_in_window('stop', live_stop)
                 if is_okay:
                     return True
                 logging.getLogger().info("stop time mismatched with time range")
@@ -115,7 +198,7 @@ class ScheduleChangeValidator:
         if not db_stop and live_stop:
             logging.getLogger().info("stop time added recently")
             # check the range
-            is_okay = time_in_range(self.past, self.now, live_stop)
+            is_okay = self.is_in_window('stop', live_stop)
             if is_okay:
                 return True
             logging.getLogger().info("stop time mismatched with time range")
@@ -165,9 +248,14 @@ class ScheduleChangeValidator:
         """
         validate today by comparing db weekdays and live weekdays
         """
+        if self.live_schedule.get_compiled() is not None:
+            # weekdays are part of the compiled schedule, overnight windows may end on a day not in the list
+            logging.getLogger().info("weekdays are validated by the compiled schedule")
+            return True
+
         # check if schedule weekday matches current weekday
         live_timezone = self.live_schedule.get_timezone()
-        today = datetime.datetime.now(tz=pytz.timezone(live_timezone)).weekday() + 1
+        today = self.tz_context.get_weekday(live_timezone)
         db_weekdays = self.db_schedule.get_weekdays()
         live_weekdays = self.live_schedule.get_weekdays()
 
@@ -191,6 +279,15 @@ class ScheduleChangeValidator:
             logging.getLogger().info("today is removed from the schedule")
             return False
 
+    def is_due(self):
+        """
+        checks whether start or stop falls in current time window irrespective of the lifecycle state
+        returns: bool
+        """
+        if not self.is_weekdays_valid():
+            return False
+        return bool(self.is_start_valid() or self.is_stop_valid())
+
     def run(self, compute_instance):
         """"
         driver code for schedule validator. if db schedule validates against live schedule
@@ -217,7 +314,10 @@ class ScheduleChangeValidator:
 
             if self.is_state_valid_for_start():
                 logging.getLogger().info("instance state is validated successfully")
+                if self.is_suppressed('start'):
+                    return False
                 compute_instance.set_action('start')
+                compute_instance.set_scheduled_at(self.get_scheduled_at('start'))
                 logging.getLogger().info("instance marked for starting")
                 return compute_instance
             logging.getLogger().info("instance state is invalid cannot take action")
@@ -228,7 +328,10 @@ class ScheduleChangeValidator:
 
             if self.is_state_valid_for_stop():
                 logging.getLogger().info("instance state is validated successfully")
+                if self.is_suppressed('stop'):
+                    return False
                 compute_instance.set_action('stop')
+                compute_instance.set_scheduled_at(self.get_scheduled_at('stop'))
                 logging.getLogger().info("instance marked for stopping")
                 return compute_instance
             logging.getLogger().info("instance state is invalid cannot take action")
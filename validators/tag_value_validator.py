@@ -9,8 +9,9 @@ import datetime
 import logging
 from typing import Any
 
+from core.schedule_compiler import compile_schedule
 from utils.date_util import get_timezones, get_timezone_from_abbreviation, get_utctime_from_hour
-from utils.patterns import HOUR_PATTERN, WEEKDAYS_PATTERN, TIMEZONE_PATTERN, TAG_VALUE_PATTERNS
+from utils.patterns import TIME_PATTERN, WINDOW_PATTERN, WEEKDAYS_PATTERN, TIMEZONE_PATTERN, TAG_VALUE_PATTERNS
 
 
 class TagValueValidator:
@@ -25,11 +26,12 @@ class TagValueValidator:
     _TAG_DEFINED_WITH_INVALID_VALUE = "TAG_DEFINED_WITH_INVALID_VALUE"
     _TAG_DEFINED_WITH_NO_AUTOMATION = "TAG_DEFINED_WITH_NO_AUTOMATION"
 
-    def __init__(self, tag_value: Any):
+    def __init__(self, tag_value: Any, tz_context=None):
+        self.tz_context = tz_context
         # clean it first
         self._tag_value = tag_value.strip() if tag_value else tag_value
         self.na = 'Na'.casefold()
-        self.schedule = {'start': None, 'stop': None, 'weekdays': None, 'timezone': None}
+        self.schedule = {'start': None, 'stop': None, 'weekdays': None, 'timezone': None, 'compiled': None}
         self._validated_data = {'tag_value': self._tag_value, 'validation_state': None, 'schedule': self.schedule}
 
     def update_validated_data(self, state):
@@ -43,7 +45,7 @@ class TagValueValidator:
         """
         checks whether given tz abbreviation is correct or not
         """
-        return bool(get_timezones()[tz_abbr])
+        return bool(get_timezones().get(tz_abbr))
 
     def set_configs(self, defaults: dict):
         """
@@ -154,9 +156,9 @@ class TagValueValidator:
         except Exception as err:
             logging.getLogger().exception(f"error occurred while setting the weekdays, '{err}'")
 
-    def get_default_start_time(self, default_tz):
+    def get_default_start_time(self):
         """
-        Returns default start time value set in the function configurations
+        Returns default start time value set in the function configurations as minute of the day
         """
         default_start = self.get_configs('DefaultStart')
 
@@ -168,35 +170,66 @@ class TagValueValidator:
             logging.getLogger().info("default start time set to 'NA'")
             return None
 
-        return get_utctime_from_hour(int(default_start), timezone=default_tz)
+        return self.parse_time(default_start)
 
-    def validate_start_time(self, start_time, timezone):
+    def parse_time(self, time_value):
         """
-        Assigns start time to the schedule instance it will be datetime object
+        Parses HH, HHMM or HH:MM into minute of the day, None if not provided and False if invalid
         """
-        try:
-            if start_time is None:
-                return None
+        if time_value is None or time_value == "":
+            return None
 
-            if start_time.casefold() == self.na:
-                return None
+        if time_value.casefold() == self.na:
+            return None
 
-            # apply provided start time
-            live_start_match = HOUR_PATTERN.search(start_time)
+        time_match = TIME_PATTERN.search(time_value)
+        if time_match:
+            return int(time_match.group('hour')) * 60 + int(time_match.group('minute') or 0)
 
-            if live_start_match:
-                return get_utctime_from_hour(int(live_start_match.group('hour')), timezone=timezone)
+        logging.getLogger().info(f"invalid time '{time_value}' provided, invalidating tag value")
+        return False
 
-            else:
-                logging.getLogger().info("invalid start time provided, invalidating tag value")
-                return False
+    def get_utctime_from_minute(self, minute_of_day, timezone):
+        """
+        Converts given minute of the day in the timezone to utc time of today
+        """
+        if minute_of_day is None:
+            return None
+        return get_utctime_from_hour(
+            minute_of_day // 60, timezone=timezone, tz_context=self.tz_context, minute=minute_of_day % 60
+        )
+
+    def validate_windows(self, windows):
+        """
+        Validates comma separated start and stop windows, returns list of start and stop minute of day tuples
+        ex = 0830To1230,13:30To18 or 22To06
+        """
+        try:
+            result = []
+            for window in windows.split(','):
+                window_match = WINDOW_PATTERN.search(window.strip())
+                if not window_match:
+                    logging.getLogger().info(f"invalid window '{window}' provided, invalidating tag value")
+                    return False
+
+                start = self.parse_time(window_match.group('start'))
+                stop = self.parse_time(window_match.group('stop'))
+                if start is False or stop is False:
+                    return False
+
+                if start is not None and start == stop:
+                    logging.getLogger().info("start time and stop time cannot be equal, invalidating tag value")
+                    return False
+                result.append((start, stop))
+            return result
 
         except Exception as err:
-            logging.getLogger().exception(f"error occurred while setting the start time, '{err}'")
+            logging.getLogger().exception(f"error occurred while validating the windows, '{err}'")
+            return False
 
-    def get_default_stop_time(self, default_tz):
+    def get_default_stop_time(self):
         """
-        Returns default stop time value set in the function configurations
+        Returns default stop time value set in the function configurations as minute of the day
         """
         default_stop = self.get_configs('DefaultStop')
 
@@ -208,31 +241,7 @@ class TagValueValidator:
             logging.getLogger().info("default stop time set to 'NA'")
             return None
 
-        return get_utctime_from_hour(int(default_stop), timezone=default_tz)
-
-    def validate_stop_time(self, stop_time, timezone):
-        """
-        Assigns stop time to the schedule instance it will be datetime object
-        """
-        try:
-            if stop_time is None:
-                return None
-
-            if stop_time.casefold() == self.na:
-                return None
-
-            # apply provided stop time, not provided means user dont want to stop it
-            live_stop_match = HOUR_PATTERN.search(stop_time)
-
-            if live_stop_match:
-                return get_utctime_from_hour(int(live_stop_match.group('hour')), timezone=timezone)
-
-            else:
-                logging.getLogger().info("invalid stop time provided, invalidating tag value")
-                return False
-
-        except Exception as err:
-            logging.getLogger().exception(f"error occurred while setting the stop time, '{err}'")
+        return self.parse_time(default_stop)
 
     def validate(self):
         """
@@ -262,8 +271,12 @@ class TagValueValidator:
                 logging.getLogger().info("default weekdays is not defined, cannot create default schedule")
                 return False
 
-            start = self.get_default_start_time(default_tz=timezone)
-            stop = self.get_default_stop_time(default_tz=timezone)
+            start = self.get_default_start_time()
+            stop = self.get_default_stop_time()
+
+            if start is False or stop is False:
+                logging.getLogger().info("default start or stop is invalid, cannot create default schedule")
+                return False
 
             if start is None and stop is None:
                 logging.getLogger().info("default start and stop both are not defined, cannot create default schedule")
@@ -271,8 +284,9 @@ class TagValueValidator:
 
             self.schedule['timezone'] = timezone
             self.schedule['weekdays'] = weekdays
-            self.schedule['start'] = start
-            self.schedule['stop'] = stop
+            self.schedule['start'] = self.get_utctime_from_minute(start, timezone)
+            self.schedule['stop'] = self.get_utctime_from_minute(stop, timezone)
+            self.schedule['compiled'] = compile_schedule(((start, stop),), tuple(sorted(weekdays)), timezone)
 
             logging.getLogger().info("default schedule created")
             return self._validated_data
@@ -297,15 +311,20 @@ class TagValueValidator:
                 self.update_validated_data(self._TAG_DEFINED_WITH_INVALID_VALUE)
                 return self.create_schedule_from_default_values()
 
-            validated_start = self.validate_start_time(start_time=schedule_dict['start'], timezone=validated_timezone)
-            if validated_start is False:
+            # manual patterns carry start and stop in place of windows
+            windows = schedule_dict.get('windows') or "{}To{}".format(schedule_dict['start'], schedule_dict['stop'])
+            validated_windows = self.validate_windows(windows=windows)
+            if validated_windows is False:
                 self.update_validated_data(self._TAG_DEFINED_WITH_INVALID_VALUE)
                 return self.create_schedule_from_default_values()
 
-            validated_stop = self.validate_stop_time(stop_time=schedule_dict['stop'], timezone=validated_timezone)
-            if validated_stop is False:
-                self.update_validated_data(self._TAG_DEFINED_WITH_INVALID_VALUE)
-                return self.create_schedule_from_default_values()
+            # first start and stop of the day are kept as datetime for the database and the logs
+            starts = [start for start, _ in validated_windows if start is not None]
+            stops = [stop for _, stop in validated_windows if stop is not None]
+            validated_start = validated_stop = None
+            if validated_timezone:
+                validated_start = self.get_utctime_from_minute(starts[0] if starts else None, validated_timezone)
+                validated_stop = self.get_utctime_from_minute(stops[0] if stops else None, validated_timezone)
 
             # create schedule
             self.schedule['timezone'] = validated_timezone
@@ -324,11 +343,9 @@ class TagValueValidator:
                 self.update_validated_data(self._TAG_DEFINED_WITH_NO_AUTOMATION)
                 return self._validated_data
 
-            if validated_start == validated_stop:
-                logging.getLogger().info("start time and stop time cannot be equal, falling back to default schedule")
-                self.update_validated_data(self._TAG_DEFINED_WITH_INVALID_VALUE)
-                return self.create_schedule_from_default_values()
-
+            self.schedule['compiled'] = compile_schedule(
+                tuple(validated_windows), tuple(sorted(validated_weekdays)), validated_timezone
+            )
             logging.getLogger().info("schedule is created from provided values successfully")
             self.update_validated_data(self._TAG_DEFINED_WITH_VALID_VALUE)
             return self._validated_data